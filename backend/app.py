@@ -1,16 +1,31 @@
-import yaml
 import os
 import logging
 import atexit
 import time
+import threading
+import io
+import csv
+import json
+import base64
 from datetime import datetime # Corrección de import
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
-from etl_core import ETLEngine
-from sqlalchemy import text, create_engine, inspect
+from etl_core import ETLEngine, CHECKSUM_PK_TYPES
+from sqlalchemy import text
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from dotenv import load_dotenv
 from init_db import generate_source_data
+from db_registry import get_engine, pool_stats, dispose_all
+from config_store import config_store
+from event_log import event_log
+from jobs import JobManager
+from metrics import registry, SCHEDULER_LAG
+from health import health_monitor
+from schema_catalog import schema_catalog, suggest_masking_rules
+from backup_stream import BackupReader
+from restore_util import restore_backup, BACKUP_DIR
+from audit_sink import status_kind
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, '.env'))
@@ -22,122 +37,169 @@ app = Flask(__name__)
 CORS(app)
 
 scheduler = BackgroundScheduler()
+jobs = JobManager(max_workers=int(config_store.get().get('settings', {}).get('scheduler', {}).get('max_concurrent_jobs', 2)))
 
 def load_config():
-    path = os.path.join(BASE_DIR, 'config.yaml')
-    with open(path, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f)
+    return config_store.get()
 
 def save_config(config):
-    path = os.path.join(BASE_DIR, 'config.yaml')
-    with open(path, 'w', encoding='utf-8') as f:
-        yaml.dump(config, f, sort_keys=False, allow_unicode=True)
+    config_store.save(config)
+
+# ETLEngine compartido mientras la configuración no cambie (versión del config_store)
+_etl_cache = {"engine": None}
+_etl_lock = threading.Lock()
+
+def get_etl():
+    with _etl_lock:
+        engine = _etl_cache["engine"]
+        if engine is None or engine.config_version != config_store.current_version():
+            engine = _etl_cache["engine"] = ETLEngine()
+    # Fuera del candado: la validación de entornos se repite cuando vence su TTL aunque el motor siga en caché
+    engine.validate()
+    return engine
+
+def submit_etl_job(target=None, percentage=None, trigger='manual', profile=False, subset=None):
+    timeout = load_config().get('settings', {}).get('scheduler', {}).get('timeout_minutes')
+    return jobs.submit('etl', lambda job: get_etl().run_pipeline(target_table=target, override_percent=percentage, job=job, profile=profile, subset=subset), timeout_minutes=timeout, table=target, percentage=percentage, trigger=trigger, profile=profile, subset=subset)
 
 def scheduled_job():
     try:
         config = load_config()
         if config.get('settings', {}).get('scheduler', {}).get('enabled', True):
             logger.info("[CRON] Ejecutando tarea programada...")
-            ETLEngine().run_pipeline()
+            submit_etl_job(trigger='cron')
         else:
             logger.info("[CRON] Tarea omitida.")
     except Exception as e:
         logger.error(f"Error en Cron: {e}")
 
 # --- DASHBOARD ---
+# Caché de respuesta de vida corta: el polling del frontend no toca la base de datos dentro del TTL
+DASHBOARD_CACHE_SECONDS = 5
+_dashboard_cache = {"at": 0, "data": None}
+_dashboard_lock = threading.Lock()
+
+def build_dashboard():
+    config = load_config()
+    etl = get_etl()
+    total_pipelines = len(config.get('tables', []))
+    total_rules = sum(len(t.get('masking_rules', {})) for t in config.get('tables', []))
+    with etl.engine_qa.connect() as conn:
+        # Tasa de éxito sobre ejecuciones terminadas con éxito o error (las omitidas y canceladas no cuentan)
+        res_total, res_ok, res_err = conn.execute(text("SELECT COALESCE(SUM(total_registros), 0), COALESCE(SUM(exitos), 0), COALESCE(SUM(errores), 0) FROM auditoria_resumen")).fetchone()
+        success_rate = int((res_ok / ((res_ok + res_err) or 1)) * 100)
+        chart_data = [{"name": r[0], "value": r[1]} for r in conn.execute(text("SELECT tabla, SUM(total_registros)::bigint as total FROM auditoria_resumen GROUP BY tabla ORDER BY total DESC LIMIT 5"))]
+        recent_activity = [{"table": r[0], "status": status_kind(r[1]), "time": str(r[2]), "records": r[3]} for r in conn.execute(text("SELECT tabla, ultimo_estado, ultima_ejecucion, ultimos_registros FROM auditoria_resumen ORDER BY ultima_ejecucion DESC LIMIT 5"))]
+
+    # Estado de las bases desde el monitor de salud (último sondeo en segundo plano, sin conectar aquí)
+    system_status = { "api": "online", "scheduler": "running", "db_prod": health_monitor.status_for_env(config['databases']['source_db_env_var']), "db_qa": health_monitor.status_for_env(config['databases']['target_db_env_var']) }
+
+    return { "kpi": { "pipelines": total_pipelines, "rules": total_rules, "records": int(res_total), "success_rate": success_rate }, "chart_data": chart_data, "recent_activity": recent_activity, "system_status": system_status }
+
 @app.route('/api/dashboard', methods=['GET'])
 def get_dashboard():
     try:
-        config = load_config()
-        etl = ETLEngine()
-        total_pipelines = len(config.get('tables', []))
-        total_rules = sum(len(t.get('masking_rules', {})) for t in config.get('tables', []))
-        with etl.engine_qa.connect() as conn:
-            res_total = conn.execute(text("SELECT SUM(registros_procesados) FROM auditoria")).scalar() or 0
-            res_ok = conn.execute(text("SELECT COUNT(*) FROM auditoria WHERE estado LIKE 'SUCCESS%'")).scalar() or 0
-            res_count = conn.execute(text("SELECT COUNT(*) FROM auditoria")).scalar() or 1
-            success_rate = int((res_ok / res_count) * 100)
-            chart_data = [{"name": r[0], "value": r[1]} for r in conn.execute(text("SELECT tabla, SUM(registros_procesados) as total FROM auditoria GROUP BY tabla ORDER BY total DESC LIMIT 5"))]
-            recent_activity = [{"table": r[0], "status": "success" if "SUCCESS" in r[1] else "error", "time": str(r[2]), "records": r[3]} for r in conn.execute(text("SELECT tabla, estado, fecha_ejecucion, registros_procesados FROM auditoria ORDER BY fecha_ejecucion DESC LIMIT 5"))]
-
-        system_status = { "api": "online", "scheduler": "running", "db_prod": "unknown", "db_qa": "connected" }
-        try:
-            create_engine(os.getenv(config['databases']['source_db_env_var'])).connect().close()
-            system_status['db_prod'] = "connected"
-        except: system_status['db_prod'] = "disconnected"
-
-        return jsonify({ "kpi": { "pipelines": total_pipelines, "rules": total_rules, "records": res_total, "success_rate": success_rate }, "chart_data": chart_data, "recent_activity": recent_activity, "system_status": system_status })
+        with _dashboard_lock:
+            if _dashboard_cache["data"] is None or time.time() - _dashboard_cache["at"] > DASHBOARD_CACHE_SECONDS:
+                _dashboard_cache["data"] = build_dashboard()
+                _dashboard_cache["at"] = time.time()
+            return jsonify(_dashboard_cache["data"])
     except Exception as e: return jsonify({"error": str(e)}), 500
 
 # --- BACKUP ---
 @app.route('/api/backup', methods=['POST'])
 def trigger_backup():
     try:
-        filename = ETLEngine().create_encrypted_backup()
+        filename = get_etl().create_encrypted_backup()
         return jsonify({"status": "success", "message": "Respaldo CIFRADO creado.", "file": filename}), 200
     except ValueError as ve: return jsonify({"error": str(ve)}), 400
     except Exception as e: return jsonify({"error": str(e)}), 500
 
+@app.route('/api/backups', methods=['GET'])
+def list_backups():
+    backups = []
+    key = os.getenv("BACKUP_ENCRYPTION_KEY", "").encode()
+    if os.path.isdir(BACKUP_DIR):
+        for name in sorted(os.listdir(BACKUP_DIR), reverse=True):
+            if not name.endswith('.dmbk'): continue
+            path = os.path.join(BACKUP_DIR, name)
+            entry = {"file": name, "size": os.path.getsize(path), "tables": None}
+            try: entry["tables"] = {t: i['rows'] for t, i in BackupReader(path, key).manifest['tables'].items()}
+            except Exception as e: entry["error"] = str(e)
+            backups.append(entry)
+    return jsonify(backups)
+
+@app.route('/api/restore', methods=['POST'])
+def trigger_restore():
+    data = request.json or {}
+    if not data.get('file') or not data.get('target'): return jsonify({"error": "Faltan 'file' y 'target'"}), 400
+    tables = data.get('tables') or None
+    workers = get_etl().max_workers
+    def run(job):
+        def progress(table, rows): job.table_update(table, status="success", loaded=rows)
+        return restore_backup(data['file'], data['target'], tables, workers, bool(data.get('allow_production')), progress, bool(data.get('include_meta')))
+    job = jobs.submit('restore', run, file=data['file'], target=data['target'], tables=tables)
+    return jsonify({"status": "accepted", "message": "Restauración encolada", "job_id": job.id}), 202
+
 # --- CONEXIONES ---
 @app.route('/api/connections', methods=['GET', 'POST', 'DELETE'])
 def handle_connections():
     config = load_config()
     if request.method == 'GET':
-        connections = []
-        registry = config['databases'].get('registry', { "prod": {"name": "Producción", "env_var": "SUPABASE_PROD_URI"}, "qa": {"name": "QA", "env_var": "SUPABASE_QA_URI"} })
-        for db_id, db_info in registry.items():
-            uri = os.getenv(db_info['env_var'])
-            status, host, latency, version = "disconnected", "unknown", 0, "Unknown"
-            if uri:
-                try:
-                    if '@' in uri: host = uri.split('@')[1].split(':')[0]
-                    start = time.time()
-                    with create_engine(uri).connect() as conn:
-                        ver = conn.execute(text("SHOW server_version")).scalar()
-                        version = f"PG {ver}"
-                    latency = round((time.time() - start) * 1000)
-                    status = "connected"
-                except: status = "error"
-            connections.append({ "id": db_id, "name": db_info['name'], "host": host, "status": status, "isProduction": db_id == config['databases'].get('active_source', 'prod'), "latency": latency, "version": version, "lastChecked": datetime.now().isoformat() })
-        return jsonify(connections)
+        # Resultado cacheado del monitor; ?refresh=1 fuerza un sondeo (paralelo y con timeout) antes de responder
+        active = config['databases'].get('active_source', 'prod')
+        refresh = request.args.get('refresh', '').lower() in ('1', 'true')
+        return jsonify([{**c, "isProduction": c['id'] == active} for c in health_monitor.snapshot(refresh)])
 
     if request.method == 'POST':
         try:
             data, name, uri = request.json, request.json.get('name'), request.json.get('uri')
             conn_id = name.lower().replace(" ", "_")
             env_var = f"DB_{conn_id.upper()}_URI"
-            with open(os.path.join(BASE_DIR, '.env'), 'a', encoding='utf-8') as f: f.write(f"\n{env_var}={uri}")
-            load_dotenv(os.path.join(BASE_DIR, '.env'), override=True)
-            if 'registry' not in config['databases']: config['databases']['registry'] = {}
-            config['databases']['registry'][conn_id] = {"name": name, "env_var": env_var, "type": "postgresql"}
-            save_config(config)
+            with config_store.lock:
+                with open(os.path.join(BASE_DIR, '.env'), 'a', encoding='utf-8') as f: f.write(f"\n{env_var}={uri}")
+                load_dotenv(os.path.join(BASE_DIR, '.env'), override=True)
+                config = load_config()
+                if 'registry' not in config['databases']: config['databases']['registry'] = {}
+                config['databases']['registry'][conn_id] = {"name": name, "env_var": env_var, "type": "postgresql"}
+                save_config(config)
+            health_monitor.wake()
             return jsonify({"status": "success"}), 201
         except Exception as e: return jsonify({"error": str(e)}), 500
 
     if request.method == 'DELETE':
         try:
             cid = request.json.get('id')
-            if cid in ['prod', 'qa', config['databases'].get('active_source'), config['databases'].get('active_target')]: return jsonify({"error": "Protegida"}), 403
-            if cid in config['databases'].get('registry', {}):
-                del config['databases']['registry'][cid]
-                save_config(config)
-                return jsonify({"status": "success"}), 200
+            with config_store.lock:
+                config = load_config()
+                if cid in ['prod', 'qa', config['databases'].get('active_source'), config['databases'].get('active_target')]: return jsonify({"error": "Protegida"}), 403
+                if cid in config['databases'].get('registry', {}):
+                    del config['databases']['registry'][cid]
+                    save_config(config)
+                    health_monitor.wake()
+                    return jsonify({"status": "success"}), 200
             return jsonify({"error": "No existe"}), 404
         except: return jsonify({"error": "Error interno"}), 500
 
 # --- SETTINGS ---
 @app.route('/api/settings', methods=['GET', 'POST'])
 def handle_settings():
-    if request.method == 'GET': return jsonify(load_config().get('settings', {}))
+    if request.method == 'GET':
+        settings = load_config().get('settings', {})
+        # Tamaño de bloque vigente por tabla (fijo o último ajustado): solo lectura, el POST lo ignora
+        try: batch_sizes = get_etl().list_batch_sizes()
+        except Exception: batch_sizes = []
+        return jsonify({**settings, "batch_sizes": batch_sizes})
     if request.method == 'POST':
         try:
             new_data = request.json
-            config = load_config()
-            for k in ['app_name', 'batch_size', 'extraction_window_days']:
-                if k in new_data: config['settings'][k] = new_data[k]
-            for section in ['notifications', 'security', 'scheduler']:
-                if section in new_data: config['settings'].setdefault(section, {}).update(new_data[section])
-            save_config(config)
+            with config_store.lock:
+                config = load_config()
+                for k in ['app_name', 'batch_size', 'extraction_window_days', 'max_parallel_tables', 'on_failure']:
+                    if k in new_data: config['settings'][k] = new_data[k]
+                for section in ['notifications', 'security', 'scheduler', 'masking', 'health', 'sampling', 'batch_tuning']:
+                    if section in new_data: config['settings'].setdefault(section, {}).update(new_data[section])
+                save_config(config)
             try:
                 scheduler.reschedule_job('etl_job', trigger='interval', minutes=int(config['settings']['scheduler'].get('interval_minutes', 5)))
             except: pass
@@ -152,13 +214,22 @@ def handle_pipelines():
         try:
             pipelines = []
             try:
-                engine = ETLEngine().engine_qa
+                engine = get_etl().engine_qa
                 with engine.connect() as conn:
+                    # Último estado de todas las tablas en una sola consulta; LATERAL usa idx_auditoria_tabla_fecha_id por tabla
+                    latest = {r[0]: r[1:] for r in conn.execute(text("""
+                        SELECT t.tabla, a.estado, a.fecha_ejecucion, a.registros_procesados
+                        FROM unnest(CAST(:tables AS VARCHAR[])) AS t(tabla)
+                        JOIN LATERAL (
+                            SELECT estado, fecha_ejecucion, registros_procesados FROM auditoria
+                            WHERE auditoria.tabla = t.tabla AND estado <> 'CHECKPOINT' ORDER BY fecha_ejecucion DESC LIMIT 1
+                        ) a ON true
+                    """), {"tables": [t['name'] for t in config['tables']]})}
                     for t in config['tables']:
-                        last = conn.execute(text(f"SELECT estado, fecha_ejecucion, registros_procesados FROM auditoria WHERE tabla='{t['name']}' ORDER BY fecha_ejecucion DESC LIMIT 1")).fetchone()
+                        last = latest.get(t['name'])
                         status, date, recs = ("idle", None, 0)
                         if last:
-                            status = "success" if "SUCCESS" in last[0] else "error"
+                            status = status_kind(last[0])
                             date, recs = str(last[1]), last[2]
                         pct = t.get('sample_percent', 100)
                         is_active = t.get('active', True)
@@ -174,44 +245,53 @@ def handle_pipelines():
         if any(t['name'] == data['table'] for t in config['tables']): return jsonify({"error": "Ya existe"}), 409
         try:
             prod_uri = os.getenv(config['databases']['source_db_env_var'])
-            cols = inspect(create_engine(prod_uri)).get_columns(data['table'])
-            masking = {}
-            for c in cols:
-                cn = c['name'].lower()
-                if 'email' in cn: masking[c['name']] = 'hash_email'
-                elif 'telef' in cn: masking[c['name']] = 'preserve_format'
-                elif 'nombre' in cn: masking[c['name']] = 'fake_name'
-                elif 'direc' in cn: masking[c['name']] = 'redact'
-            config['tables'].append({ "name": data['table'], "description": data.get('name'), "pk": "id", "filter_column": "id", "sample_percent": 100, "masking_rules": masking, "active": True })
-            save_config(config)
-            return jsonify({"status": "success", "message": "Pipeline registrado"}), 201
+            info = schema_catalog.table(get_engine(prod_uri), data['table'])
+            if info is None: return jsonify({"error": f"La tabla {data['table']} no existe en el origen"}), 404
+            masking = suggest_masking_rules(info['columns'])
+            pk = info['pk'][0] if len(info['pk']) == 1 else "id"
+            pk_type = next((c['type'] for c in info['columns'] if c['name'] == pk), None) if len(info['pk']) == 1 else None
+            # Incremental por la primera columna de fecha; sin ella, sincronización por checksum de rangos de PK
+            # (solo con una PK entera simple: con otra PK se queda incremental por pk y se avisa)
+            ts_col = next((c['name'] for c in info['columns'] if c['type'].startswith(('timestamp', 'date'))), None)
+            pipeline = { "name": data['table'], "description": data.get('name'), "pk": pk, "filter_column": ts_col or pk, "sample_percent": 100, "masking_rules": masking, "active": True }
+            warning = None
+            if len(info['pk']) != 1: warning = f"{data['table']} no tiene una PK simple ({', '.join(info['pk']) or 'sin PK'}); se usa 'id', revisa pk y filter_column en config.yaml"
+            elif not ts_col and pk_type in CHECKSUM_PK_TYPES: pipeline["sync_mode"] = "checksum"
+            elif not ts_col: warning = f"{data['table']} no tiene columna de fecha y su PK ({pk}: {pk_type}) no es entera; sin sync_mode checksum, incremental por {pk}"
+            if warning: logger.warning(f"[WARN] Alta de pipeline: {warning}")
+            with config_store.lock:
+                config = load_config()
+                if any(t['name'] == data['table'] for t in config['tables']): return jsonify({"error": "Ya existe"}), 409
+                config['tables'].append(pipeline)
+                save_config(config)
+            return jsonify({"status": "success", "message": "Pipeline registrado", **({"warning": warning} if warning else {})}), 201
         except Exception as e: return jsonify({"error": str(e)}), 500
 
 @app.route('/api/pipelines/<pipeline_id>', methods=['DELETE', 'PATCH'])
 def manage_single_pipeline(pipeline_id):
-    config = load_config()
-    if request.method == 'DELETE':
-        original = len(config['tables'])
-        config['tables'] = [t for t in config['tables'] if t['name'] != pipeline_id]
-        if len(config['tables']) < original:
-            save_config(config)
-            return jsonify({"status": "success"})
-        return jsonify({"error": "No encontrado"}), 404
-    if request.method == 'PATCH':
-        for t in config['tables']:
-            if t['name'] == pipeline_id:
-                t['active'] = request.json.get('active')
+    with config_store.lock:
+        config = load_config()
+        if request.method == 'DELETE':
+            original = len(config['tables'])
+            config['tables'] = [t for t in config['tables'] if t['name'] != pipeline_id]
+            if len(config['tables']) < original:
                 save_config(config)
                 return jsonify({"status": "success"})
-        return jsonify({"error": "No encontrado"}), 404
+            return jsonify({"error": "No encontrado"}), 404
+        if request.method == 'PATCH':
+            for t in config['tables']:
+                if t['name'] == pipeline_id:
+                    t['active'] = request.json.get('active')
+                    save_config(config)
+                    return jsonify({"status": "success"})
+            return jsonify({"error": "No encontrado"}), 404
 
 # --- REGLAS ---
 @app.route('/api/rules', methods=['GET', 'POST', 'DELETE'])
 def handle_rules():
-    config_path = os.path.join(BASE_DIR, 'config.yaml')
     if request.method == 'GET':
         try:
-            with open(config_path, 'r', encoding='utf-8') as f: config = yaml.safe_load(f)
+            config = load_config()
             rules = []
             for t in config.get('tables', []):
                 for c, r in t.get('masking_rules', {}).items():
@@ -220,90 +300,313 @@ def handle_rules():
         except: return jsonify([])
     if request.method == 'POST':
         data = request.json
-        config = load_config()
-        for t in config['tables']:
-            if t['name'] == data['table']: t.setdefault('masking_rules', {})[data['column']] = data['type']
-        save_config(config)
+        with config_store.lock:
+            config = load_config()
+            for t in config['tables']:
+                if t['name'] == data['table']: t.setdefault('masking_rules', {})[data['column']] = data['type']
+            save_config(config)
         return jsonify({"status": "success"})
     if request.method == 'DELETE':
         data = request.json
-        config = load_config()
-        for t in config['tables']:
-            if t['name'] == data['table'] and data['column'] in t.get('masking_rules', {}): del t['masking_rules'][data['column']]
-        save_config(config)
+        with config_store.lock:
+            config = load_config()
+            for t in config['tables']:
+                if t['name'] == data['table'] and data['column'] in t.get('masking_rules', {}): del t['masking_rules'][data['column']]
+            save_config(config)
         return jsonify({"status": "success"})
 
 @app.route('/api/rules/reset', methods=['POST'])
 def reset_rules():
-    config = load_config()
     defaults = { "clientes": {"nombre": "fake_name", "email": "hash_email", "telefono": "preserve_format", "direccion": "redact"}, "ordenes": {"total": "none"}, "detalle_ordenes": {"producto": "hash_email", "precio_unitario": "none"}, "inventario": {"producto": "hash_email", "ubicacion": "redact"} }
-    for t in config['tables']:
-        if t['name'] in defaults: t['masking_rules'] = defaults[t['name']]
-    save_config(config)
+    with config_store.lock:
+        config = load_config()
+        for t in config['tables']:
+            if t['name'] in defaults: t['masking_rules'] = defaults[t['name']]
+        save_config(config)
     return jsonify({"status": "success"})
 
 # --- HELPERS ---
+# Descubrimiento de esquema desde el catálogo cacheado (una huella cada 10 s como máximo contra Producción)
+def source_engine():
+    return get_engine(os.getenv(load_config()['databases']['source_db_env_var']))
+
 @app.route('/api/source/tables', methods=['GET'])
 def get_source_tables():
-    try:
-        prod_uri = os.getenv(load_config()['databases']['source_db_env_var'])
-        return jsonify(inspect(create_engine(prod_uri)).get_table_names())
+    try: return jsonify(schema_catalog.table_names(source_engine()))
     except: return jsonify([])
 
 @app.route('/api/source/columns/<table_name>', methods=['GET'])
 def get_cols(table_name):
     try:
-        prod_uri = os.getenv(load_config()['databases']['source_db_env_var'])
-        return jsonify([c['name'] for c in inspect(create_engine(prod_uri)).get_columns(table_name)])
+        info = schema_catalog.table(source_engine(), table_name)
+        return jsonify([c['name'] for c in info['columns']] if info else [])
     except: return jsonify([])
 
+@app.route('/api/source/catalog', methods=['GET'])
+def get_source_catalog():
+    # Catálogo completo + sugerencias de enmascaramiento por tabla; ?refresh=1 fuerza la relectura
+    try:
+        catalog = schema_catalog.get(source_engine(), force=request.args.get('refresh', '').lower() in ('1', 'true'))
+        tables = [{**t, "suggested_rules": suggest_masking_rules(t['columns'])} for t in catalog['tables'].values()]
+        return jsonify({"version": catalog['version'], "loaded_at": catalog['loaded_at'], "tables": tables, "stats": schema_catalog.metrics()})
+    except Exception as e: return jsonify({"error": str(e)}), 500
+
 @app.route('/api/run', methods=['POST'])
 def run_etl():
     try:
         target = request.json.get('table')
         percentage = request.json.get('percentage')
-        logger.info(f"Ejecucion manual: {target or 'TODO'}. Muestreo: {percentage}%")
-        ETLEngine().run_pipeline(target_table=target, override_percent=percentage)
-        return jsonify({"status": "success", "message": "Ejecutado"}), 200
+        profile = bool(request.json.get('profile', False))
+        # subset: muestra cerrada por FKs (hijas filtradas a los padres muestreados); sin valor = settings.sampling.fk_closed
+        subset = request.json.get('subset')
+        if percentage is not None and not 0 <= float(percentage) <= 100: return jsonify({"error": "percentage debe estar entre 0 y 100"}), 400
+        logger.info(f"Ejecucion manual: {target or 'TODO'}. Muestreo: {percentage}%{' (subconjunto por FKs)' if subset else ''}{' (con perfil)' if profile else ''}")
+        job = submit_etl_job(target, percentage, profile=profile, subset=None if subset is None else bool(subset))
+        return jsonify({"status": "accepted", "message": "Ejecución encolada", "job_id": job.id}), 202
     except Exception as e: return jsonify({"error": str(e)}), 500
 
+# --- WATERMARKS ---
+@app.route('/api/watermarks', methods=['GET'])
+def list_watermarks():
+    try: return jsonify([{**w, "actualizado": str(w['actualizado']) if w['actualizado'] else None} for w in get_etl().list_watermarks()])
+    except Exception as e: return jsonify({"error": str(e)}), 500
+
+@app.route('/api/watermarks/<table_name>', methods=['PUT', 'DELETE'])
+def manage_watermark(table_name):
+    # PUT {value, pk?}: rebobina (se reprocesa lo posterior a ese punto); DELETE: la siguiente corrida es completa
+    try:
+        data = (request.get_json(silent=True) or {}) if request.method == 'PUT' else {}
+        if request.method == 'PUT' and data.get('value') is None: return jsonify({"error": "Falta value"}), 400
+        get_etl().set_watermark(table_name, data.get('value'), data.get('pk'))
+        return jsonify({"status": "success"})
+    except ValueError as e: return jsonify({"error": str(e)}), 400
+    except Exception as e: return jsonify({"error": str(e)}), 500
+
+# --- JOBS ---
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(jobs.list())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if not job: return jsonify({"error": "No encontrado"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = jobs.get(job_id)
+    if not job: return jsonify({"error": "No encontrado"}), 404
+    if not job.cancel(): return jsonify({"error": "El job ya terminó"}), 409
+    return jsonify({"status": "success", "message": "Cancelación solicitada"}), 202
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if not job: return jsonify({"error": "No encontrado"}), 404
+    def stream():
+        revision = -1
+        while True:
+            new_revision, snapshot = job.wait_for_change(revision, timeout=15)
+            if new_revision == revision and not job.finished:
+                yield ": keepalive\n\n"
+                continue
+            revision = new_revision
+            yield f"event: progress\ndata: {json.dumps(snapshot, default=str)}\n\n"
+            if job.finished:
+                yield f"event: done\ndata: {json.dumps(snapshot, default=str)}\n\n"
+                break
+    return Response(stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- HISTORIAL DE AUDITORÍA ---
+# Paginación por keyset sobre (fecha_ejecucion, id): cada página es un rango del índice idx_auditoria_fecha_id
+# (o idx_auditoria_tabla_fecha_id con ?table=), sin OFFSET, con el mismo costo en la página 1 que en la 10.000.
+HISTORY_COLUMNS = ['id', 'id_ejecucion', 'fecha_ejecucion', 'tabla', 'registros_procesados', 'registros_fallidos', 'estado', 'mensaje', 'operacion', 'reglas_aplicadas', 'fecha_inicio', 'fecha_fin', 'duracion']
+HISTORY_SELECT = "SELECT id, id_ejecucion, fecha_ejecucion, tabla, registros_procesados, registros_fallidos, estado, mensaje, operacion, reglas_aplicadas, fecha_inicio, fecha_fin, COALESCE(EXTRACT(EPOCH FROM fecha_fin - fecha_inicio), 0)::float8 AS duracion FROM auditoria"
+HISTORY_PAGE_MAX = 500
+EXPORT_BATCH = 2000
+
+def encode_history_cursor(fecha, row_id):
+    return base64.urlsafe_b64encode(f"{fecha.isoformat()}|{row_id}".encode()).decode().rstrip('=')
+
+def decode_history_cursor(cursor):
+    fecha, row_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+    return datetime.fromisoformat(fecha), int(row_id)
+
+def history_filters(args):
+    # ?table=, ?status= (uno o varios separados por coma), ?execution_id=, ?from=&to= (ISO); los CHECKPOINT solo si se piden
+    where, params = ["fecha_ejecucion IS NOT NULL"], {}
+    if args.get('table'): where.append("tabla = :tabla"); params['tabla'] = args['table']
+    if args.get('execution_id'): where.append("id_ejecucion = :eid"); params['eid'] = args['execution_id']
+    statuses = [s.strip().upper() for s in args.get('status', '').split(',') if s.strip()]
+    if statuses: where.append("estado = ANY(:estados)"); params['estados'] = statuses
+    elif args.get('include_checkpoints') not in ('1', 'true'): where.append("estado <> 'CHECKPOINT'")
+    if args.get('from'): where.append("fecha_ejecucion >= :desde"); params['desde'] = datetime.fromisoformat(args['from'])
+    if args.get('to'): where.append("fecha_ejecucion < :hasta"); params['hasta'] = datetime.fromisoformat(args['to'])
+    return where, params
+
+def history_item(r):
+    return {
+        "id": r.id, "id_ejecucion": r.id_ejecucion, "fecha": str(r.fecha_ejecucion), "tabla": r.tabla, "registros": r.registros_procesados,
+        "fallidos": r.registros_fallidos, "estado": r.estado, "mensaje": r.mensaje, "operacion": r.operacion, "reglas": r.reglas_aplicadas,
+        "duration": r.duracion,
+    }
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
+    # ?limit= (máx. 500) y ?cursor= (next_cursor de la página anterior), más los filtros de history_filters
     try:
-        with ETLEngine().engine_qa.connect() as conn:
-            res = conn.execute(text("SELECT fecha_ejecucion, tabla, registros_procesados, estado, mensaje, fecha_inicio, fecha_fin FROM auditoria ORDER BY fecha_ejecucion DESC LIMIT 50"))
-            return jsonify([{
-                "fecha": str(r[0]), "tabla": r[1], "registros": r[2], "estado": r[3], "mensaje": r[4],
-                "duration": (r[6] - r[5]).total_seconds() if r[5] and r[6] else 0
-            } for r in res])
-    except: return jsonify([])
+        where, params = history_filters(request.args)
+        limit = max(1, min(int(request.args.get('limit', 50)), HISTORY_PAGE_MAX))
+        if request.args.get('cursor'):
+            where.append("(fecha_ejecucion, id) < (:cursor_fecha, :cursor_id)")
+            params['cursor_fecha'], params['cursor_id'] = decode_history_cursor(request.args['cursor'])
+    except (ValueError, TypeError, UnicodeDecodeError) as e: return jsonify({"error": f"Parámetro inválido: {e}"}), 400
+    try:
+        with get_etl().engine_qa.connect() as conn:
+            # Una fila de más indica si hay página siguiente sin un COUNT(*) aparte
+            rows = conn.execute(text(f"{HISTORY_SELECT} WHERE {' AND '.join(where)} ORDER BY fecha_ejecucion DESC, id DESC LIMIT :lim"), {**params, "lim": limit + 1}).all()
+    except Exception as e: return jsonify({"error": str(e)}), 500
+    page = rows[:limit]
+    next_cursor = encode_history_cursor(page[-1].fecha_ejecucion, page[-1].id) if len(rows) > limit else None
+    return jsonify({"items": [history_item(r) for r in page], "next_cursor": next_cursor})
+
+@app.route('/api/history/export', methods=['GET'])
+def export_history():
+    # ?format=csv|ndjson con los mismos filtros, en orden cronológico; se lee con cursor del lado del servidor
+    # (yield_per) y se escribe fila por fila: la memoria no depende del tamaño del historial
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'): return jsonify({"error": "Formato inválido (csv o ndjson)"}), 400
+    try: where, params = history_filters(request.args)
+    except ValueError as e: return jsonify({"error": f"Parámetro inválido: {e}"}), 400
+    sql = text(f"{HISTORY_SELECT} WHERE {' AND '.join(where)} ORDER BY fecha_ejecucion, id")
+    engine = get_etl().engine_qa
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv': writer.writerow(HISTORY_COLUMNS)
+        with engine.connect().execution_options(yield_per=EXPORT_BATCH) as conn:
+            for i, r in enumerate(conn.execute(sql, params), 1):
+                if fmt == 'csv': writer.writerow(['' if v is None else v for v in r])
+                else: buffer.write(json.dumps(dict(zip(HISTORY_COLUMNS, r)), default=str, ensure_ascii=False) + '\n')
+                if i % EXPORT_BATCH == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0); buffer.truncate()
+        yield buffer.getvalue()
+    filename = f"historial_auditoria_{datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={filename}", "X-Accel-Buffering": "no"})
+
+SEED_TABLES = ['inventario', 'clientes', 'ordenes', 'detalle_ordenes']
 
 @app.route('/api/source/seed', methods=['POST'])
 def seed_source_data():
-    try:
-        generate_source_data(request.json)
-        return jsonify({"status": "success"}), 200
-    except Exception as e: return jsonify({"error": str(e)}), 500
+    counts = request.json or {}
+    def run(job):
+        # Se reinician las tablas: ninguna puede estar en una ejecución ETL al mismo tiempo
+        locks = [job.table_lock(t) for t in SEED_TABLES]
+        taken = [l for l in locks if l.acquire(blocking=False)]
+        try:
+            if len(taken) < len(locks): raise RuntimeError("Hay una ejecución ETL en curso sobre las tablas de origen")
+            for t in SEED_TABLES: job.table_update(t, status="running", loaded=0)
+            def progress(table, rows):
+                job.check()
+                job.table_progress(table, loaded=rows)
+            totals = generate_source_data(counts, counts.get('seed'), counts.get('workers'), progress)
+            for t in SEED_TABLES: job.table_update(t, status="success")
+            return totals
+        finally:
+            for l in taken: l.release()
+    job = jobs.submit('seed', run, **{k: counts.get(k) for k in ['productos', 'clientes', 'ordenes', 'detalles', 'seed']})
+    return jsonify({"status": "accepted", "message": "Sembrado encolado", "job_id": job.id}), 202
 
 @app.route('/api/notifications/report', methods=['GET'])
 def download_report():
+    # ?from=&to= (ISO), ?table=, ?status=, ?format=jsonl; se transmite evento por evento sin cargar la bitácora completa
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError: return jsonify({"error": "Fecha inválida"}), 400
+    events = event_log.read(start, end, table_name=request.args.get('table'), status=request.args.get('status'))
+    if request.args.get('format') == 'jsonl':
+        return Response((json.dumps(e, ensure_ascii=False) + '\n' for e in events), mimetype='application/x-ndjson',
+                        headers={"Content-Disposition": "attachment; filename=reporte_auditoria.jsonl"})
+    def generate():
+        yield '['
+        for i, e in enumerate(events): yield (',\n' if i else '\n') + json.dumps(e, ensure_ascii=False, indent=4)
+        yield '\n]'
+    return Response(generate(), mimetype='application/json', headers={"Content-Disposition": "attachment; filename=reporte_auditoria.json"})
+
+@app.route('/api/pools', methods=['GET'])
+def get_pool_stats():
+    return jsonify(pool_stats())
+
+@app.route('/api/audit/sink', methods=['GET'])
+def get_audit_sink_stats():
+    return jsonify(get_etl().audit.metrics())
+
+@app.route('/api/masking/cache', methods=['GET'])
+def get_masking_cache():
+    return jsonify(get_etl().masker.dictionary.metrics())
+
+# --- MÉTRICAS (PROMETHEUS) ---
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@registry.collector
+def _collect_runtime():
+    engine = _etl_cache["engine"]
+    if engine is not None:
+        sink = engine.audit.metrics()
+        for k in ['pending', 'written', 'spilled', 'dropped']: registry.gauge(f"audit_sink_{k}", f"Escritor de auditoría: {k}").set(sink[k])
+        cache = engine.masker.dictionary.metrics()
+        for k in ['hits', 'misses', 'evictions', 'size']: registry.gauge(f"masking_cache_{k}", f"Diccionario de enmascaramiento: {k}").set(cache[k])
+    counts = {}
+    for job in jobs.list(): counts[(job['kind'], job['status'])] = counts.get((job['kind'], job['status']), 0) + 1
+    gauge = registry.gauge("jobs", "Jobs en memoria por tipo y estado", ("kind", "status"))
+    with registry.lock: gauge.values.clear()
+    for (kind, status), n in counts.items(): gauge.set(n, kind=kind, status=status)
+
+def _scheduler_lag(event):
+    # Retraso entre la hora programada y el envío del cron al executor de APScheduler
+    for run_time in event.scheduled_run_times: SCHEDULER_LAG.observe(max(0.0, (datetime.now(run_time.tzinfo) - run_time).total_seconds()))
+
+scheduler.add_listener(_scheduler_lag, EVENT_JOB_SUBMITTED)
+
+@app.route('/api/executions/<execution_id>/checkpoints', methods=['GET'])
+def get_execution_checkpoints(execution_id):
+    try: return jsonify([{**c, "fecha": str(c['fecha'])} for c in get_etl().list_checkpoints(execution_id)])
+    except Exception as e: return jsonify({"error": str(e)}), 500
+
+@app.route('/api/executions/<execution_id>/stages', methods=['GET'])
+def get_execution_stages(execution_id):
+    # Desglose por etapa (y por regla de enmascaramiento) de cada intento de tabla
     try:
-        path = os.path.join(BASE_DIR, 'notifications_log.json')
-        if not os.path.exists(path): 
-            with open(path, 'w', encoding='utf-8') as f: f.write('[]')
-        return send_file(path, as_attachment=True, download_name='reporte_auditoria.json')
-    except: return jsonify({"error": "No log"}), 404
+        qa_uri = os.getenv(load_config()['databases']['target_db_env_var'])
+        with get_engine(qa_uri).connect() as conn:
+            rows = conn.execute(text("""
+                SELECT tabla, etapa, regla, intento, estado, segundos, filas, llamadas, fecha FROM etl_tiempos_etapa
+                WHERE id_ejecucion = :eid ORDER BY tabla, intento, etapa = 'total', segundos DESC
+            """), {"eid": execution_id}).mappings().all()
+        return jsonify([{**r, "fecha": str(r['fecha'])} for r in rows])
+    except Exception as e: return jsonify({"error": str(e)}), 500
 
 @app.route('/health', methods=['GET'])
 def health(): return jsonify({"status": "online"}), 200
 
 if __name__ == '__main__':
     print("Servidor Maestro listo en http://localhost:5000")
+    # El monitor de conexiones arranca primero: /api/connections y el dashboard solo leen su último resultado
+    health_monitor.start()
     try:
         conf = load_config()
         interval = int(conf.get('settings', {}).get('scheduler', {}).get('interval_minutes', 5))
         scheduler.add_job(func=scheduled_job, trigger='interval', minutes=interval, id='etl_job')
         scheduler.start()
         atexit.register(lambda: scheduler.shutdown())
+        atexit.register(jobs.shutdown)
+        atexit.register(dispose_all)
+        atexit.register(health_monitor.dispose)
     except: pass
     app.run(debug=True, port=5000, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,103 @@
+from sqlalchemy import text
+
+# --- ESQUEMA DE AUDITORÍA Y TABLAS etl_* (QA) ---
+# Única definición del DDL: la usan ETLEngine al arrancar, init_db al preparar QA y el esquema de los respaldos.
+# Todo es idempotente (IF NOT EXISTS), así que sirve también como migración de un QA existente.
+AUDITORIA_DDL = """
+    CREATE TABLE IF NOT EXISTS auditoria (
+        id SERIAL PRIMARY KEY, id_ejecucion VARCHAR(50), fecha_ejecucion TIMESTAMP, tabla VARCHAR(50), registros_procesados INTEGER,
+        registros_fallidos INTEGER DEFAULT 0, estado VARCHAR(100), mensaje TEXT, operacion VARCHAR(50), reglas_aplicadas TEXT,
+        fecha_inicio TIMESTAMP, fecha_fin TIMESTAMP
+    )
+"""
+# Columnas agregadas después de la primera versión de auditoria
+AUDIT_COLUMNS = [
+    "ALTER TABLE auditoria ADD COLUMN IF NOT EXISTS registros_fallidos INTEGER DEFAULT 0",
+    "ALTER TABLE auditoria ADD COLUMN IF NOT EXISTS id_ejecucion VARCHAR(50)",
+    "ALTER TABLE auditoria ADD COLUMN IF NOT EXISTS reglas_aplicadas TEXT",
+]
+# Los de (fecha_ejecucion, id) sirven al keyset de /api/history y reemplazan a los anteriores sin id (mismo prefijo)
+AUDIT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_auditoria_tabla_fecha_id ON auditoria (tabla, fecha_ejecucion DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_auditoria_fecha_id ON auditoria (fecha_ejecucion DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_auditoria_ejecucion ON auditoria (id_ejecucion)",
+    "CREATE INDEX IF NOT EXISTS idx_auditoria_estado_fecha_id ON auditoria (estado, fecha_ejecucion DESC, id DESC)",
+]
+LEGACY_INDEXES = ["DROP INDEX IF EXISTS idx_auditoria_tabla_fecha", "DROP INDEX IF EXISTS idx_auditoria_fecha"]
+# auditoria_resumen: acumulado por tabla y día para el dashboard, actualizado en la misma transacción que auditoria
+AUDIT_ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS auditoria_resumen (
+        tabla VARCHAR(50), dia DATE, total_registros BIGINT DEFAULT 0, exitos INTEGER DEFAULT 0, errores INTEGER DEFAULT 0,
+        ejecuciones INTEGER DEFAULT 0, ultima_ejecucion TIMESTAMP, ultimo_estado VARCHAR(100), ultimos_registros INTEGER,
+        PRIMARY KEY (tabla, dia)
+    )
+"""
+# Último (filter_column, pk) extraído por tabla; se actualiza en la misma transacción que la carga
+WATERMARK_DDL = """
+    CREATE TABLE IF NOT EXISTS etl_watermarks (
+        tabla VARCHAR(50), columna VARCHAR(50), valor_filtro TEXT, valor_pk TEXT, actualizado TIMESTAMP,
+        PRIMARY KEY (tabla, columna)
+    )
+"""
+# Tiempos por etapa de cada intento de tabla (extract, mask por regla, delete, load, commit, total)
+TIMINGS_DDL = [
+    """CREATE TABLE IF NOT EXISTS etl_tiempos_etapa (
+        id SERIAL PRIMARY KEY, id_ejecucion VARCHAR(50), tabla VARCHAR(50), etapa VARCHAR(50), regla VARCHAR(50),
+        intento INTEGER, estado VARCHAR(20), segundos DOUBLE PRECISION, filas BIGINT, llamadas INTEGER, fecha TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_tiempos_ejecucion ON etl_tiempos_etapa (id_ejecucion)",
+    "CREATE INDEX IF NOT EXISTS idx_tiempos_tabla_fecha ON etl_tiempos_etapa (tabla, fecha DESC)",
+]
+# Hash de cada fila de origen tal como se cargó (sync_mode: checksum); el dato en QA está enmascarado y no sirve para comparar
+ROW_HASHES_DDL = "CREATE TABLE IF NOT EXISTS etl_row_hashes (tabla VARCHAR(50), pk BIGINT, hash CHAR(32), PRIMARY KEY (tabla, pk))"
+# Bloques confirmados por ejecución y tabla: un reintento o un reinicio continúa desde el último PARCIAL
+CHECKPOINTS_DDL = [
+    """CREATE TABLE IF NOT EXISTS etl_checkpoints (
+        id SERIAL PRIMARY KEY, id_ejecucion VARCHAR(50), tabla VARCHAR(50), intento INTEGER, bloque INTEGER,
+        desde TEXT, hasta TEXT, filas INTEGER, modo VARCHAR(50), estado VARCHAR(20), fecha TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_checkpoints_tabla_estado ON etl_checkpoints (tabla, estado, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_checkpoints_ejecucion ON etl_checkpoints (id_ejecucion, tabla)",
+]
+# Último tamaño de bloque ajustado por tabla (punto de partida de la siguiente corrida)
+BATCH_SIZES_DDL = """
+    CREATE TABLE IF NOT EXISTS etl_batch_sizes (
+        tabla VARCHAR(50) PRIMARY KEY, filas INTEGER, filas_por_seg DOUBLE PRECISION, bytes_por_fila DOUBLE PRECISION,
+        bloques INTEGER, actualizado TIMESTAMP
+    )
+"""
+# Diccionario persistente de enmascaramiento (settings.masking.persist)
+MASK_DICTIONARY_DDL = """
+    CREATE TABLE IF NOT EXISTS mascaras_diccionario (
+        regla VARCHAR(50), digest CHAR(64), valor TEXT, creado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (regla, digest)
+    )
+"""
+
+SCHEMA_TABLES = ['auditoria', 'auditoria_resumen', 'etl_watermarks', 'etl_tiempos_etapa', 'etl_row_hashes', 'etl_checkpoints', 'etl_batch_sizes', 'mascaras_diccionario']
+# Estado que describe las filas ya cargadas en QA: deja de aplicar cuando se recrean las tablas de negocio
+RUN_STATE_TABLES = ['etl_watermarks', 'etl_row_hashes', 'etl_checkpoints']
+
+def schema_statements():
+    return [AUDITORIA_DDL, *AUDIT_COLUMNS, *AUDIT_INDEXES, *LEGACY_INDEXES, AUDIT_ROLLUP_DDL, WATERMARK_DDL, *TIMINGS_DDL,
+            ROW_HASHES_DDL, *CHECKPOINTS_DDL, BATCH_SIZES_DDL, MASK_DICTIONARY_DDL]
+
+def schema_sql():
+    # Versión en script para el esquema de los respaldos
+    return ''.join(f"{' '.join(ddl.split())};\n" for ddl in schema_statements())
+
+def ensure_audit_schema(conn):
+    for ddl in schema_statements(): conn.execute(text(ddl))
+    # Backfill único desde el historial existente (QA creados antes del resumen)
+    if not conn.execute(text("SELECT EXISTS (SELECT 1 FROM auditoria_resumen)")).scalar(): rebuild_audit_rollup(conn)
+
+def rebuild_audit_rollup(conn):
+    conn.execute(text("DELETE FROM auditoria_resumen"))
+    conn.execute(text("""
+        INSERT INTO auditoria_resumen (tabla, dia, total_registros, exitos, errores, ejecuciones, ultima_ejecucion, ultimo_estado, ultimos_registros)
+        SELECT tabla, fecha_ejecucion::date, COALESCE(SUM(registros_procesados), 0),
+               COUNT(*) FILTER (WHERE estado LIKE 'SUCCESS%'), COUNT(*) FILTER (WHERE estado IS NULL OR (estado NOT LIKE 'SUCCESS%' AND estado NOT IN ('SKIPPED', 'CANCELLED'))), COUNT(*),
+               MAX(fecha_ejecucion), (array_agg(estado ORDER BY fecha_ejecucion DESC))[1], (array_agg(registros_procesados ORDER BY fecha_ejecucion DESC))[1]
+        FROM auditoria WHERE tabla IS NOT NULL AND fecha_ejecucion IS NOT NULL AND estado IS DISTINCT FROM 'CHECKPOINT'
+        GROUP BY tabla, fecha_ejecucion::date
+    """))
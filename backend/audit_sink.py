@@ -0,0 +1,240 @@
+import os
+import json
+import hashlib
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import text
+from event_log import event_log
+
+logger = logging.getLogger(__name__)
+
+# --- ESCRITOR DE AUDITORÍA POR LOTES ---
+# Los eventos se encolan en memoria y un hilo los escribe en lotes (inserción multi-fila + resumen agregado)
+# cuando se junta FLUSH_SIZE o pasan FLUSH_SECONDS. Si QA no responde, el lote va a un archivo local
+# (audit_spill_<hash>.jsonl) que se reintenta en el siguiente ciclo. Lo que no cabe en la cola se cuenta como descartado.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FLUSH_SIZE = 200
+FLUSH_SECONDS = 2.0
+MAX_QUEUE = 10000
+# Estado de los eventos de bloque confirmado: van a auditoria pero no cuentan como ejecuciones en el resumen
+CHECKPOINT_STATUS = 'CHECKPOINT'
+# Tablas omitidas (padre con error) o canceladas: cuentan como ejecuciones pero no como errores
+NON_ERROR_STATUSES = ('SKIPPED', 'CANCELLED')
+
+AUDIT_INSERT = text("""
+    INSERT INTO auditoria (
+        id_ejecucion, fecha_ejecucion, tabla, registros_procesados, registros_fallidos,
+        estado, mensaje, operacion, reglas_aplicadas, fecha_inicio, fecha_fin
+    ) VALUES (:eid, :f, :t, :r, :rf, :s, :m, :op, :rules, :fi, :ff)
+""")
+
+# Un lote puede traer eventos viejos (reintento del spill): el "último estado" solo avanza si es más reciente
+ROLLUP_UPSERT = text("""
+    INSERT INTO auditoria_resumen (tabla, dia, total_registros, exitos, errores, ejecuciones, ultima_ejecucion, ultimo_estado, ultimos_registros)
+    VALUES (:t, :d, :r, :ok, :err, :n, :f, :s, :lr)
+    ON CONFLICT (tabla, dia) DO UPDATE SET
+        total_registros = auditoria_resumen.total_registros + EXCLUDED.total_registros,
+        exitos = auditoria_resumen.exitos + EXCLUDED.exitos,
+        errores = auditoria_resumen.errores + EXCLUDED.errores,
+        ejecuciones = auditoria_resumen.ejecuciones + EXCLUDED.ejecuciones,
+        ultimo_estado = CASE WHEN EXCLUDED.ultima_ejecucion >= auditoria_resumen.ultima_ejecucion THEN EXCLUDED.ultimo_estado ELSE auditoria_resumen.ultimo_estado END,
+        ultimos_registros = CASE WHEN EXCLUDED.ultima_ejecucion >= auditoria_resumen.ultima_ejecucion THEN EXCLUDED.ultimos_registros ELSE auditoria_resumen.ultimos_registros END,
+        ultima_ejecucion = GREATEST(auditoria_resumen.ultima_ejecucion, EXCLUDED.ultima_ejecucion)
+""")
+
+TIMINGS_INSERT = text("""
+    INSERT INTO etl_tiempos_etapa (id_ejecucion, tabla, etapa, regla, intento, estado, segundos, filas, llamadas, fecha)
+    VALUES (:eid, :t, :etapa, :regla, :intento, :estado, :seg, :filas, :llamadas, :f)
+""")
+
+def status_kind(status):
+    # success / skipped / cancelled / error, para la API y el resumen
+    status = str(status or '')
+    if status.startswith('SUCCESS'): return 'success'
+    if status in NON_ERROR_STATUSES: return status.lower()
+    return 'error'
+
+def rollup_rows(rows):
+    groups = {}
+    for row in rows:
+        if row['s'] == CHECKPOINT_STATUS: continue
+        f = datetime.fromisoformat(row['f']) if isinstance(row['f'], str) else row['f']
+        g = groups.setdefault((row['t'], f.date()), {"t": row['t'], "d": f.date(), "r": 0, "ok": 0, "err": 0, "n": 0, "f": f, "s": row['s'], "lr": row['r'] or 0})
+        kind = status_kind(row['s'])
+        g['r'] += row['r'] or 0
+        g['ok'] += int(kind == 'success')
+        g['err'] += int(kind == 'error')
+        g['n'] += 1
+        if f >= g['f']: g.update(f=f, s=row['s'], lr=row['r'] or 0)
+    return list(groups.values())
+
+class AuditSink:
+    def __init__(self, engine, spill_path, flush_size=FLUSH_SIZE, flush_seconds=FLUSH_SECONDS, max_queue=MAX_QUEUE):
+        self.engine = engine
+        self.spill_path = spill_path
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_queue = max_queue
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "spilled": 0, "replayed": 0, "dropped": 0, "notifications": 0, "timings": 0, "last_error": None}
+        self._queue = deque()
+        self._notes = deque()
+        self._timings = deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name='audit-sink', daemon=True)
+        self._thread.start()
+
+    # --- Encolado (ruta caliente: sin I/O) ---
+    def emit(self, row):
+        self._enqueue(self._queue, row)
+
+    def notify(self, event):
+        self._enqueue(self._notes, event)
+
+    def emit_timings(self, rows):
+        # Tiempos por etapa: telemetría de mejor esfuerzo (sin archivo local si QA no responde)
+        for row in rows: self._enqueue(self._timings, row)
+
+    def _enqueue(self, queue, item):
+        with self._cond:
+            if self._closed or self._pending() >= self.max_queue:
+                self.stats["dropped"] += 1
+                logger.warning(f"[WARN] Auditoría: evento descartado (cola llena o cerrada), total descartados {self.stats['dropped']}")
+                return
+            queue.append(item)
+            self.stats["queued"] += 1
+            if len(queue) >= self.flush_size: self._cond.notify_all()
+
+    def _pending(self):
+        return len(self._queue) + len(self._notes) + len(self._timings)
+
+    # --- Hilo de escritura ---
+    def _loop(self):
+        while True:
+            with self._cond:
+                if not self._closed and max(len(self._queue), len(self._notes), len(self._timings)) < self.flush_size:
+                    self._cond.wait(self.flush_seconds)
+                rows = [self._queue.popleft() for _ in range(min(len(self._queue), self.flush_size))]
+                notes = [self._notes.popleft() for _ in range(min(len(self._notes), self.flush_size))]
+                timings = [self._timings.popleft() for _ in range(min(len(self._timings), self.flush_size))]
+                closing = self._closed and not self._pending()
+                self._busy = bool(rows or notes or timings)
+            try:
+                # El archivo local se reintenta antes del lote nuevo para conservar el orden
+                try: self._replay_spill()
+                except Exception as e:
+                    logger.error(f"[ERROR] Auditoría: no se pudo reintentar el archivo local: {e}")
+                    self._count(last_error=str(e))
+                if rows: self._write_or_spill(rows)
+                if timings: self._write_timings(timings)
+                for event in notes: self._write_note(event)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+            if closing: return
+
+    def _write(self, rows):
+        with self.engine.connect() as conn:
+            conn.execute(AUDIT_INSERT, rows)
+            rollup = rollup_rows(rows)
+            if rollup: conn.execute(ROLLUP_UPSERT, rollup)
+            conn.commit()
+
+    def _write_or_spill(self, rows):
+        try:
+            self._write(rows)
+            self._count(written=len(rows), batches=1)
+        except Exception as e:
+            logger.error(f"[ERROR] Auditoría: QA no disponible, {len(rows)} eventos al archivo local: {e}")
+            self._count(last_error=str(e))
+            try:
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    for row in rows: f.write(json.dumps(row, default=str) + '\n')
+                self._count(spilled=len(rows))
+            except Exception as spill_error:
+                logger.error(f"[ERROR] Auditoría: {len(rows)} eventos perdidos, no se pudo escribir el archivo local: {spill_error}")
+                self._count(dropped=len(rows), last_error=str(spill_error))
+
+    def _replay_spill(self):
+        if not os.path.exists(self.spill_path): return
+        with open(self.spill_path, 'r', encoding='utf-8') as f: pending = [json.loads(line) for line in f if line.strip()]
+        done = 0
+        try:
+            for i in range(0, len(pending), self.flush_size):
+                batch = pending[i:i + self.flush_size]
+                self._write(batch)
+                done += len(batch)
+        except Exception as e: self._count(last_error=str(e))
+        # Lo que sí se escribió sale del archivo; el resto espera al siguiente ciclo
+        if done == len(pending): os.remove(self.spill_path)
+        elif done:
+            tmp = self.spill_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for row in pending[done:]: f.write(json.dumps(row, default=str) + '\n')
+            os.replace(tmp, self.spill_path)
+        if done:
+            self._count(replayed=done, written=done)
+            logger.info(f"[OK] Auditoría: {done} eventos recuperados del archivo local")
+
+    def _write_timings(self, rows):
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(TIMINGS_INSERT, rows)
+                conn.commit()
+            self._count(timings=len(rows))
+        except Exception as e:
+            logger.error(f"[ERROR] Auditoría: {len(rows)} tiempos por etapa perdidos: {e}")
+            self._count(dropped=len(rows), last_error=str(e))
+
+    def _write_note(self, event):
+        try:
+            event_log.append(event)
+            self._count(notifications=1)
+        except Exception as e:
+            logger.error(f"[ERROR] Bitácora de notificaciones: evento perdido: {e}")
+            self._count(dropped=1, last_error=str(e))
+
+    def _count(self, **deltas):
+        with self._cond:
+            for k, v in deltas.items():
+                if k == 'last_error': self.stats[k] = v
+                else: self.stats[k] += v
+
+    # --- Sincronización ---
+    def flush(self, timeout=10):
+        with self._cond:
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending() and not self._busy, timeout)
+
+    def close(self, timeout=10):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def metrics(self):
+        with self._cond:
+            return {**self.stats, "pending": self._pending(), "spill_file": os.path.exists(self.spill_path)}
+
+# Un escritor por base de auditoría (proceso completo)
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+def get_audit_sink(engine):
+    key = str(engine.url)
+    with _sinks_lock:
+        if key not in _sinks:
+            digest = hashlib.sha256(key.encode()).hexdigest()[:8]
+            _sinks[key] = AuditSink(engine, os.path.join(BASE_DIR, f'audit_spill_{digest}.jsonl'))
+        return _sinks[key]
+
+def close_all():
+    with _sinks_lock: sinks = list(_sinks.values())
+    for sink in sinks: sink.close()
+
+atexit.register(close_all)
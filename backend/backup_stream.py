@@ -0,0 +1,192 @@
+import os
+import json
+import zlib
+import struct
+import hashlib
+import threading
+from datetime import datetime
+from cryptography.fernet import Fernet
+
+# --- FORMATO DE RESPALDO POR FRAMES ---
+# MAGIC | frame* | offset_manifest (u64) | TRAILER
+# frame = tipo (1 byte) | índice de tabla (u16) | largo (u32) | token Fernet
+# Cada token cifra (cabecera del frame + payload); los datos van en texto COPY comprimido con zlib
+# en bloques de FRAME_SIZE, así la memoria no depende del tamaño de la base.
+MAGIC = b"DMBK1\n"
+TRAILER = b"DMBKEND"
+FRAME_SIZE = 1024 * 1024
+FRAME_HEADER = struct.Struct('>cHI')
+NO_TABLE = 0xFFFF
+
+FRAME_SCHEMA = b'S'
+FRAME_TABLE = b'T'
+FRAME_DATA = b'D'
+FRAME_END = b'E'
+FRAME_MANIFEST = b'M'
+
+class BackupWriter:
+    def __init__(self, path, key):
+        self.path = path
+        self.fernet = Fernet(key)
+        self.manifest = {"format": 1, "created_at": datetime.now().isoformat(), "schema": None, "tables": {}}
+        self._lock = threading.Lock()
+        self._next_index = 0
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+
+    def write_frame(self, kind, payload, table_index=NO_TABLE):
+        header = FRAME_HEADER.pack(kind, table_index, 0)[:3]
+        token = self.fernet.encrypt(header + payload)
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(FRAME_HEADER.pack(kind, table_index, len(token)))
+            self._file.write(token)
+        return offset
+
+    def write_json(self, kind, obj, table_index=NO_TABLE):
+        return self.write_frame(kind, json.dumps(obj, default=str).encode('utf-8'), table_index)
+
+    def write_schema(self, sql):
+        data = sql.encode('utf-8')
+        self.manifest["schema"] = hashlib.sha256(data).hexdigest()
+        self.write_frame(FRAME_SCHEMA, zlib.compress(data))
+
+    def open_table(self, table, source, columns):
+        with self._lock:
+            index = self._next_index
+            self._next_index += 1
+        return TableStream(self, index, table, source, columns)
+
+    def close(self):
+        offset = self.write_json(FRAME_MANIFEST, self.manifest)
+        with self._lock:
+            self._file.write(struct.pack('>Q', offset) + TRAILER)
+            self._file.close()
+
+    def abort(self):
+        with self._lock:
+            if not self._file.closed: self._file.close()
+        if os.path.exists(self.path): os.remove(self.path)
+
+class TableStream:
+    # Objeto tipo archivo para cursor.copy_expert("COPY ... TO STDOUT", stream)
+    def __init__(self, writer, index, table, source, columns):
+        self.writer = writer
+        self.index = index
+        self.table = table
+        self.source = source
+        self.columns = columns
+        self.rows = 0
+        self.raw_bytes = 0
+        self.frames = 0
+        self._sha = hashlib.sha256()
+        self._buf = bytearray()
+        writer.write_json(FRAME_TABLE, {"table": table, "source": source, "columns": columns}, index)
+
+    def write(self, data):
+        if isinstance(data, str): data = data.encode('utf-8')
+        self._sha.update(data)
+        self.rows += data.count(b'\n')
+        self.raw_bytes += len(data)
+        self._buf += data
+        if len(self._buf) >= FRAME_SIZE: self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self._buf: return
+        # Solo se corta en fin de línea para que cada frame contenga filas completas
+        cut = self._buf.rfind(b'\n') + 1
+        if cut == 0: return
+        self.writer.write_frame(FRAME_DATA, zlib.compress(bytes(self._buf[:cut]), 6), self.index)
+        del self._buf[:cut]
+        self.frames += 1
+
+    def close(self):
+        self.flush()
+        if self._buf: raise ValueError(f"Datos COPY incompletos en {self.table}")
+        info = {"index": self.index, "source": self.source, "columns": self.columns, "rows": self.rows, "bytes": self.raw_bytes, "frames": self.frames, "sha256": self._sha.hexdigest()}
+        self.writer.write_json(FRAME_END, info, self.index)
+        with self.writer._lock: self.writer.manifest["tables"][self.table] = info
+        return info
+
+class BackupReader:
+    def __init__(self, path, key):
+        self.path = path
+        self.fernet = Fernet(key)
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC: raise ValueError("Formato de respaldo no reconocido")
+            f.seek(-(8 + len(TRAILER)), os.SEEK_END)
+            tail = f.read()
+            if tail[8:] != TRAILER: raise ValueError("Respaldo incompleto: no tiene manifiesto")
+            self.manifest_offset = struct.unpack('>Q', tail[:8])[0]
+            f.seek(self.manifest_offset)
+            kind, _, payload = self._read_frame(f)
+        if kind != FRAME_MANIFEST: raise ValueError("Manifiesto dañado")
+        self.manifest = json.loads(payload)
+
+    def _read_frame(self, f, want=None):
+        header = f.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size: raise ValueError("Frame truncado")
+        kind, index, length = FRAME_HEADER.unpack(header)
+        # Los frames que no interesan se saltan sin descifrarlos
+        if want and not want(kind, index):
+            f.seek(length, os.SEEK_CUR)
+            return kind, index, None
+        plain = self.fernet.decrypt(f.read(length))
+        if plain[:3] != header[:3]: raise ValueError("Cabecera de frame alterada")
+        return kind, index, plain[3:]
+
+    def frames(self, want=None):
+        with open(self.path, 'rb') as f:
+            f.seek(len(MAGIC))
+            while f.tell() < self.manifest_offset:
+                kind, index, payload = self._read_frame(f, want)
+                if payload is not None: yield kind, index, payload
+
+    def schema_sql(self):
+        for _, _, payload in self.frames(lambda k, i: k == FRAME_SCHEMA):
+            data = zlib.decompress(payload)
+            if hashlib.sha256(data).hexdigest() != self.manifest.get("schema"): raise ValueError("Checksum del esquema no coincide")
+            return data.decode('utf-8')
+        return None
+
+    def table_chunks(self, table):
+        index = self.manifest["tables"][table]["index"]
+        for _, _, payload in self.frames(lambda k, i: k == FRAME_DATA and i == index):
+            yield zlib.decompress(payload)
+
+class VerifyingStream:
+    # Objeto tipo archivo para cursor.copy_expert("COPY ... FROM STDIN", stream); cuenta filas y calcula el hash al vuelo
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buf = bytearray()
+        self._sha = hashlib.sha256()
+        self.rows = 0
+        self.bytes = 0
+
+    def _next(self):
+        chunk = next(self._chunks, None)
+        if chunk is None: return False
+        self._sha.update(chunk)
+        self.rows += chunk.count(b'\n')
+        self.bytes += len(chunk)
+        self._buf += chunk
+        return True
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buf) < size) and self._next(): pass
+        if size < 0: size = len(self._buf)
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def readline(self, size=-1):
+        while b'\n' not in self._buf and self._next(): pass
+        cut = self._buf.find(b'\n') + 1 or len(self._buf)
+        data = bytes(self._buf[:cut])
+        del self._buf[:cut]
+        return data
+
+    @property
+    def sha256(self):
+        return self._sha.hexdigest()
@@ -0,0 +1,67 @@
+from metrics import BATCH_ROWS
+
+# --- TAMAÑO DE BLOQUE ADAPTATIVO ---
+# Un ajustador por tabla y corrida. Después de cada bloque se miden las filas/s (de la extracción al commit) y los
+# bytes por fila del DataFrame. El siguiente bloque apunta a target_seconds sin pasar de max_chunk_mb en memoria.
+# Las medidas se suavizan con una media exponencial y el tamaño cambia como mucho x2 (o /2) por bloque.
+# El tamaño final se guarda en QA (etl_batch_sizes) y es el punto de partida de la siguiente corrida.
+TARGET_SECONDS = 2.0
+MAX_CHUNK_MB = 64
+MIN_ROWS = 100
+MAX_ROWS = 50000
+SMOOTHING = 0.5
+MAX_STEP = 2.0
+
+def tuning_settings(settings):
+    tuning = settings.get('batch_tuning', {})
+    return {
+        "enabled": bool(tuning.get('enabled', True)),
+        "target_seconds": float(tuning.get('target_seconds', TARGET_SECONDS)),
+        "max_chunk_mb": float(tuning.get('max_chunk_mb', MAX_CHUNK_MB)),
+        "min_rows": int(tuning.get('min_rows', MIN_ROWS)),
+        "max_rows": int(tuning.get('max_rows', MAX_ROWS)),
+    }
+
+class BatchTuner:
+    def __init__(self, table, rows, pinned=False, target_seconds=TARGET_SECONDS, max_chunk_mb=MAX_CHUNK_MB, min_rows=MIN_ROWS, max_rows=MAX_ROWS, enabled=True):
+        self.table = table
+        self.pinned = pinned or not enabled
+        self.target_seconds = target_seconds
+        self.max_bytes = max_chunk_mb * 1024 * 1024
+        self.min_rows, self.max_rows = min_rows, max(min_rows, max_rows)
+        self.rows = max(1, int(rows)) if self.pinned else self._clamp(rows)
+        self.initial = self.rows
+        self.rows_per_second = None
+        self.bytes_per_row = None
+        self.chunks = 0
+        BATCH_ROWS.set(self.rows, table=table)
+
+    def _clamp(self, rows):
+        return max(self.min_rows, min(self.max_rows, int(rows)))
+
+    def _smooth(self, previous, value):
+        return value if previous is None else SMOOTHING * value + (1 - SMOOTHING) * previous
+
+    def observe(self, rows, seconds, nbytes):
+        # rows/seconds/nbytes del bloque recién confirmado; devuelve el tamaño del siguiente
+        self.chunks += 1
+        if self.pinned or rows <= 0 or seconds <= 0: return self.rows
+        self.bytes_per_row = self._smooth(self.bytes_per_row, nbytes / rows)
+        # El último bloque de la tabla suele venir incompleto: su costo fijo distorsiona las filas/s
+        if rows < self.rows // 2: return self.rows
+        self.rows_per_second = self._smooth(self.rows_per_second, rows / seconds)
+        wanted = min(max(self.rows_per_second * self.target_seconds, self.rows / MAX_STEP), self.rows * MAX_STEP)
+        # El techo de memoria manda sobre el amortiguamiento: si el bloque no cabe, se reduce de inmediato
+        self.rows = self._clamp(min(wanted, self.max_bytes / max(self.bytes_per_row, 1)))
+        BATCH_ROWS.set(self.rows, table=self.table)
+        return self.rows
+
+    @property
+    def measured(self):
+        return not self.pinned and self.rows_per_second is not None
+
+    def describe(self):
+        if self.pinned: return f"bloque fijo de {self.rows} filas"
+        if not self.measured: return f"bloque de {self.rows} filas (sin medición)"
+        return f"bloque {self.initial} -> {self.rows} filas ({self.rows_per_second:.0f} filas/s, {self.bytes_per_row:.0f} B/fila)"
+
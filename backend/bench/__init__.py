@@ -0,0 +1 @@
+# Benchmarks reproducibles del flujo extracción -> enmascaramiento -> carga (python -m bench --help)
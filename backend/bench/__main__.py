@@ -0,0 +1,53 @@
+import sys
+import json
+import argparse
+from bench.harness import compare, print_report, print_comparison
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks del flujo ETL")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Siembra bases locales desechables y mide cada etapa")
+    run.add_argument("--sizes", default="10000,50000", help="Tamaños (clientes) separados por coma")
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--loader", choices=["copy", "insert"], default="copy")
+    run.add_argument("--skip", default="", help="Etapas a omitir: pipeline,mask_value,backup,endpoints")
+    run.add_argument("--output", help="Ruta del JSON de resultados (por defecto bench/results/)")
+    run.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    run.add_argument("--threshold", type=float, default=0.15, help="Caída de filas/s tolerada antes de fallar")
+
+    cmp = sub.add_parser("compare", help="Compara dos JSON de resultados")
+    cmp.add_argument("current")
+    cmp.add_argument("baseline")
+    cmp.add_argument("--threshold", type=float, default=0.15)
+
+    loader = sub.add_parser("loader", help="Compara los loaders insert y copy sobre una tabla temporal en una base desechable")
+    loader.add_argument("--dsn", help="URI de la base desechable (por defecto BENCH_TARGET_URI)")
+    loader.add_argument("--rows", type=int, default=100000)
+    loader.add_argument("--chunk", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == "loader":
+        from bench.loader import main as run_loader
+        return run_loader(args.rows, args.chunk, args.dsn)
+
+    if args.command == "run":
+        from bench.suite import run_suite
+        sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+        bench = run_suite(sizes, args.seed, args.loader, {s.strip() for s in args.skip.split(',') if s.strip()})
+        current = bench.to_dict()
+        print_report(current)
+        print(f"\n[OK] Resultados en {bench.save(args.output)}")
+        baseline_path = args.baseline
+    else:
+        with open(args.current, encoding='utf-8') as f: current = json.load(f)
+        baseline_path = args.baseline
+
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f: baseline = json.load(f)
+        rows, regressions = compare(current, baseline, args.threshold)
+        print_comparison(rows, regressions, args.threshold)
+        if regressions: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
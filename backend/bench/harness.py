@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+
+# --- MEDICIÓN POR ETAPA ---
+# Cada etapa acumula muestras (segundos, filas); el reporte da filas/s, p50/p95 por llamada y el pico de RSS.
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+def peak_rss_mb():
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+        self.rows = 0
+
+    def add(self, seconds, rows=0):
+        self.samples.append(seconds)
+        self.rows += rows
+
+    def summary(self):
+        total = float(np.sum(self.samples)) if self.samples else 0.0
+        ms = np.array(self.samples) * 1000
+        return {
+            "calls": len(self.samples), "rows": self.rows, "seconds": round(total, 4),
+            "rows_per_sec": round(self.rows / total, 1) if total and self.rows else None,
+            "p50_ms": round(float(np.percentile(ms, 50)), 3) if len(ms) else None,
+            "p95_ms": round(float(np.percentile(ms, 95)), 3) if len(ms) else None,
+        }
+
+class BenchRun:
+    def __init__(self, params):
+        self.params = params
+        self.sizes = {}
+        self.started = datetime.now()
+
+    def stages(self, size):
+        return self.sizes.setdefault(str(size), {"stages": {}, "peak_rss_mb": None})["stages"]
+
+    def stage(self, size, name):
+        stages = self.stages(size)
+        if name not in stages: stages[name] = Stage(name)
+        return stages[name]
+
+    @contextmanager
+    def timed(self, size, name, rows=0):
+        start = time.perf_counter()
+        yield
+        self.stage(size, name).add(time.perf_counter() - start, rows)
+
+    def mark_rss(self, size):
+        self.sizes[str(size)]["peak_rss_mb"] = peak_rss_mb()
+
+    def to_dict(self):
+        return {
+            "created_at": self.started.isoformat(), "commit": _git_commit(), "python": platform.python_version(),
+            "machine": platform.machine(), "cpus": os.cpu_count(), "params": self.params,
+            "sizes": {size: {"peak_rss_mb": data["peak_rss_mb"], "stages": {n: s.summary() for n, s in data["stages"].items()}} for size, data in self.sizes.items()},
+        }
+
+    def save(self, path=None):
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = path or os.path.join(RESULTS_DIR, f"bench_{self.started.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f: json.dump(self.to_dict(), f, indent=2)
+        return path
+
+def _git_commit():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except Exception: return None
+
+# --- COMPARACIÓN CONTRA UNA LÍNEA BASE ---
+def compare(current, baseline, threshold=0.15):
+    # Regresión = filas/s por debajo de (1 - threshold) de la base, en etapas presentes en ambos reportes
+    regressions, rows = [], []
+    for size, data in current["sizes"].items():
+        base_stages = baseline.get("sizes", {}).get(size, {}).get("stages", {})
+        for name, s in data["stages"].items():
+            b = base_stages.get(name)
+            if not b or not s["rows_per_sec"] or not b["rows_per_sec"]: continue
+            ratio = s["rows_per_sec"] / b["rows_per_sec"]
+            rows.append((size, name, b["rows_per_sec"], s["rows_per_sec"], ratio))
+            if ratio < 1 - threshold: regressions.append((size, name, ratio))
+    return rows, regressions
+
+def print_report(result):
+    for size, data in result["sizes"].items():
+        print(f"\n== Tamaño {size} (pico RSS {data['peak_rss_mb']} MB) ==")
+        print(f"  {'etapa':<28}{'llamadas':>9}{'filas':>11}{'seg':>9}{'filas/s':>13}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, s in data["stages"].items():
+            rps = f"{s['rows_per_sec']:,.0f}" if s['rows_per_sec'] else '-'
+            print(f"  {name:<28}{s['calls']:>9}{s['rows']:>11}{s['seconds']:>9.2f}{rps:>13}{s['p50_ms'] or 0:>10.2f}{s['p95_ms'] or 0:>10.2f}")
+
+def print_comparison(rows, regressions, threshold):
+    print(f"\n== Comparación contra la base (umbral {threshold:.0%}) ==")
+    for size, name, base, cur, ratio in rows:
+        flag = "  << REGRESIÓN" if ratio < 1 - threshold else ""
+        print(f"  {size:>8} {name:<28}{base:>13,.0f}{cur:>13,.0f}{ratio:>8.2f}x{flag}")
+    print(f"  {len(regressions)} regresiones" if regressions else "  Sin regresiones")
@@ -0,0 +1,60 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from config_store import config_store
+from etl_core import ETLEngine
+from bench.suite import guard_bench_uri
+
+# Benchmark de carga: compara el loader 'insert' (DELETE IN + to_sql multi) contra 'copy' (COPY + upsert)
+# Uso: python -m bench loader --dsn postgresql://postgres@localhost:5433/bench_dst --rows 100000 --chunk 10000
+# Corre contra una base desechable (--dsn o BENCH_TARGET_URI), con la misma protección que la suite: nunca contra QA/Producción
+TABLE = "_bench_loader"
+
+def build_frame(rows):
+    rng = np.random.default_rng(42)
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "nombre": [f"Cliente {i}" for i in range(rows)],
+        "email": [f"user{i}@anon.com" for i in range(rows)],
+        "total": rng.uniform(100, 5000, rows).round(2),
+        "fecha": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 86400 * 365, rows), unit="s"),
+    })
+
+def run(etl, df, loader, preload, chunk):
+    with etl.engine_qa.connect() as conn:
+        conn.execute(text(f"TRUNCATE {TABLE}"))
+        if preload: etl.load_chunk(conn, TABLE, "id", df.copy(), 'copy')
+        conn.commit()
+    start = time.perf_counter()
+    with etl.engine_qa.connect() as conn:
+        conn.execute(text("SET session_replication_role = 'replica';"))
+        for i in range(0, len(df), chunk): etl.load_chunk(conn, TABLE, "id", df.iloc[i:i + chunk].copy(), loader)
+        conn.execute(text("SET session_replication_role = 'origin';"))
+        conn.commit()
+    return time.perf_counter() - start
+
+def main(rows=100000, chunk=10000, dsn=None):
+    dsn = dsn or os.getenv('BENCH_TARGET_URI')
+    if not dsn: raise SystemExit("Indica --dsn (o BENCH_TARGET_URI) con una base local desechable")
+    guard_bench_uri(dsn)
+    # El motor ETL lee QA por nombre de variable: en este proceso apunta a la base del benchmark
+    os.environ[config_store.get()['databases']['target_db_env_var']] = dsn
+    etl = ETLEngine()
+    etl.batch_size = chunk
+    df = build_frame(rows)
+    with etl.engine_qa.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(text(f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY, nombre VARCHAR(100), email VARCHAR(200), total DECIMAL(10, 2), fecha TIMESTAMP)"))
+        conn.commit()
+    try:
+        print(f"Filas: {rows} | Bloque: {chunk}")
+        for scenario, preload in [("carga inicial", False), ("upsert (filas existentes)", True)]:
+            for loader in ['insert', 'copy']:
+                elapsed = run(etl, df, loader, preload, chunk)
+                print(f"  {scenario:<28} {loader:<7} {elapsed:8.2f}s  {rows / elapsed:12,.0f} filas/s")
+    finally:
+        with etl.engine_qa.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+            conn.commit()
@@ -0,0 +1,137 @@
+import os
+import time
+from cryptography.fernet import Fernet
+from sqlalchemy import text
+from config_store import config_store
+from db_registry import get_engine
+from init_db import seed_bulk
+from etl_core import ETLEngine, MASKING_RULES, BASE_DIR
+from bench.harness import BenchRun
+
+# --- SUITE EXTRACCIÓN -> ENMASCARAMIENTO -> CARGA ---
+# Siembra un PostgreSQL local desechable (BENCH_SOURCE_URI / BENCH_TARGET_URI) con el esquema de
+# _get_schema_definition y mide cada etapa por separado. Nunca corre contra bases con huella _db_meta.
+ENDPOINTS = ['/api/dashboard', '/api/history', '/api/pipelines', '/api/watermarks']
+
+def scaled_counts(size):
+    # size = clientes; el resto conserva las proporciones del sembrado por defecto
+    return {"productos": max(30, size // 10), "clientes": size, "ordenes": int(size * 2.5), "detalles": int(size * 7.5)}
+
+def guard_bench_uri(uri):
+    # Solo bases desechables: ni las conexiones configuradas ni bases con huella de entorno en _db_meta
+    databases = config_store.get()['databases']
+    if uri in {os.getenv(databases['source_db_env_var']), os.getenv(databases['target_db_env_var'])}:
+        raise SystemExit("⛔ El benchmark no puede usar las conexiones de Producción/QA configuradas")
+    with get_engine(uri).connect() as conn:
+        if conn.execute(text("SELECT to_regclass('public._db_meta')")).scalar() and conn.execute(text("SELECT value FROM _db_meta WHERE key='env'")).scalar():
+            raise SystemExit(f"⛔ {get_engine(uri).url.database} tiene huella de entorno en _db_meta; usa una base desechable")
+
+def bench_engines():
+    source, target = os.getenv('BENCH_SOURCE_URI'), os.getenv('BENCH_TARGET_URI')
+    if not source or not target: raise SystemExit("Define BENCH_SOURCE_URI y BENCH_TARGET_URI (bases locales desechables)")
+    if source == target: raise SystemExit("BENCH_SOURCE_URI y BENCH_TARGET_URI deben ser bases distintas")
+    for uri in (source, target): guard_bench_uri(uri)
+    databases = config_store.get()['databases']
+    # El motor ETL lee las URIs por nombre de variable: en este proceso apuntan a las bases del benchmark
+    os.environ[databases['source_db_env_var']] = source
+    os.environ[databases['target_db_env_var']] = target
+    if not os.getenv('BACKUP_ENCRYPTION_KEY'): os.environ['BACKUP_ENCRYPTION_KEY'] = Fernet.generate_key().decode()
+
+def prepare(run, size, seed):
+    etl = ETLEngine()
+    schema = etl._get_schema_definition()
+    for engine in (etl.engine_prod, etl.engine_qa):
+        with engine.connect() as conn:
+            conn.exec_driver_sql(schema)
+            conn.commit()
+    counts = scaled_counts(size)
+    with etl.engine_prod.connect() as conn:
+        start = time.perf_counter()
+        conn.execute(text("SET session_replication_role = 'replica';"))
+        totals = seed_bulk(conn, counts, seed, workers=1)
+        conn.commit()
+        run.stage(size, 'seed').add(time.perf_counter() - start, sum(totals.values()))
+    etl.ensure_audit_schema()
+    return etl
+
+def bench_stages(run, size, etl, loader):
+    # Extracción, enmascaramiento por tipo de regla, borrado y carga, medidos por bloque
+    etl.masker.dictionary.clear()
+    for conf in etl.config['tables']:
+        table, pk, filter_col = conf['name'], conf.get('pk', 'id'), conf.get('filter_column')
+        with etl.engine_qa.connect() as conn:
+            conn.execute(text("SET session_replication_role = 'replica';"))
+            chunks = etl.extract_table(table, filter_col, pk, None)
+            while True:
+                start = time.perf_counter()
+                item = next(chunks, None)
+                if item is None: break
+                df = item[0]
+                run.stage(size, 'extract').add(time.perf_counter() - start, len(df))
+                for col, rule in conf.get('masking_rules', {}).items():
+                    if col not in df.columns or rule not in MASKING_RULES: continue
+                    with run.timed(size, f'mask:{rule}', len(df)): df[col] = etl.masker.mask_column(df[col], rule)
+                if loader == 'copy':
+                    with run.timed(size, 'load:copy', len(df)): etl.copy_upsert_chunk(conn, table, pk, df)
+                else:
+                    with run.timed(size, 'delete', len(df)): etl.delete_chunk(conn, table, pk, df)
+                    with run.timed(size, 'load:insert', len(df)): etl.insert_chunk(conn, table, df)
+            conn.execute(text("SET session_replication_role = 'origin';"))
+            conn.commit()
+    for conf in etl.config['tables']:
+        with run.timed(size, 'audit:emit', 1): etl.log_audit(conf['name'], 0, "BENCH", None, None, None, 'bench', 'BENCH', None, 0)
+    with run.timed(size, 'audit:flush', len(etl.config['tables'])): etl.audit.flush()
+
+def bench_pipeline(run, size, etl):
+    # Extremo a extremo: process_table por tabla con el loader configurado
+    with etl.engine_qa.connect() as conn:
+        conn.execute(text("TRUNCATE detalle_ordenes, ordenes, inventario, clientes, etl_watermarks, etl_row_hashes CASCADE"))
+        conn.commit()
+    etl.masker.dictionary.clear()
+    for conf in etl.config['tables']:
+        with etl.engine_prod.connect() as conn: rows = conn.execute(text(f"SELECT COUNT(*) FROM {conf['name']}")).scalar()
+        with run.timed(size, 'process_table', rows): etl.process_table(conf, 100, 'bench')
+    etl.audit.flush()
+
+def bench_mask_value(run, size, etl, calls=2000):
+    # Latencia de mask_value (un solo valor) por regla; valores distintos para no medir solo aciertos de caché
+    for rule in MASKING_RULES:
+        stage = run.stage(size, f'mask_value:{rule}')
+        for i in range(calls):
+            start = time.perf_counter()
+            etl.mask_value(f"valor-{size}-{i}", rule)
+            stage.add(time.perf_counter() - start, 1)
+
+def bench_backup(run, size, etl):
+    with etl.engine_prod.connect() as conn: rows = sum(conn.execute(text(f"SELECT COUNT(*) FROM {t}")).scalar() for t in ['clientes', 'inventario', 'ordenes', 'detalle_ordenes'])
+    start = time.perf_counter()
+    filename = etl.create_encrypted_backup()
+    run.stage(size, 'backup').add(time.perf_counter() - start, rows)
+    os.remove(os.path.join(BASE_DIR, 'backups', filename))
+
+def bench_endpoints(run, size, requests=30):
+    import app as flask_app
+    client = flask_app.app.test_client()
+    for path in ENDPOINTS:
+        stage = run.stage(size, f'GET {path}')
+        for _ in range(requests):
+            flask_app._dashboard_cache["at"] = 0  # sin la caché de 5 s: se mide el costo real
+            start = time.perf_counter()
+            response = client.get(path)
+            stage.add(time.perf_counter() - start, 1)
+            if response.status_code != 200: raise RuntimeError(f"{path} respondió {response.status_code}")
+
+def run_suite(sizes, seed=42, loader='copy', skip=()):
+    bench_engines()
+    run = BenchRun({"sizes": sizes, "seed": seed, "loader": loader, "skip": sorted(skip)})
+    for size in sizes:
+        print(f"[INFO] Benchmark tamaño {size}: {scaled_counts(size)}")
+        etl = prepare(run, size, seed)
+        run.params["batch_size"] = etl.batch_size
+        bench_stages(run, size, etl, loader)
+        if 'pipeline' not in skip: bench_pipeline(run, size, etl)
+        if 'mask_value' not in skip: bench_mask_value(run, size, etl)
+        if 'backup' not in skip: bench_backup(run, size, etl)
+        if 'endpoints' not in skip: bench_endpoints(run, size)
+        run.mark_rss(size)
+    return run
@@ -0,0 +1,70 @@
+import os
+import copy
+import hashlib
+import tempfile
+import threading
+import logging
+import yaml
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURACIÓN EN MEMORIA ---
+# config.yaml se parsea solo cuando cambia (mtime/tamaño y luego hash del contenido).
+# `version` sube en cada cambio real: quien derive datos de la config puede reutilizarlos mientras no cambie.
+class ConfigStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.version = 0
+        self._config = None
+        self._stat = None
+        self._digest = None
+
+    def _refresh(self):
+        st = os.stat(self.path)
+        stat_key = (st.st_mtime_ns, st.st_size)
+        if stat_key == self._stat: return
+        with open(self.path, 'rb') as f: raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest != self._digest:
+            self._config = yaml.safe_load(raw.decode('utf-8')) or {}
+            self._digest = digest
+            self.version += 1
+            logger.info(f"[CONFIG] config.yaml cargado (versión {self.version})")
+        self._stat = stat_key
+
+    def snapshot(self):
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self._config), self.version
+
+    def get(self):
+        return self.snapshot()[0]
+
+    def current_version(self):
+        with self.lock:
+            self._refresh()
+            return self.version
+
+    def save(self, config):
+        # Escritura atómica: archivo temporal en el mismo directorio + os.replace
+        with self.lock:
+            raw = yaml.dump(config, sort_keys=False, allow_unicode=True).encode('utf-8')
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.config.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(raw)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+            self._config = copy.deepcopy(config)
+            self._digest = hashlib.sha256(raw).hexdigest()
+            st = os.stat(self.path)
+            self._stat = (st.st_mtime_ns, st.st_size)
+            self.version += 1
+
+config_store = ConfigStore(os.path.join(BASE_DIR, 'config.yaml'))
@@ -0,0 +1,85 @@
+import time
+import threading
+import logging
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from metrics import registry, POOL_WAIT
+
+logger = logging.getLogger(__name__)
+
+# --- REGISTRO DE ENGINES (UNO POR URI, COMPARTIDO POR TODO EL PROCESO) ---
+# Pool dimensionado para los workers del planificador (prod + QA por tabla) más las peticiones de la API
+POOL_SETTINGS = {
+    "pool_pre_ping": True,
+    "pool_size": 8,
+    "max_overflow": 8,
+    "pool_timeout": 30,
+    "pool_recycle": 1800,
+    "connect_args": {"connect_timeout": 10},
+}
+VALIDATION_TTL = 300
+
+class TimedQueuePool(QueuePool):
+    # Mide la espera de checkout (incluye crear la conexión cuando el pool no tiene libres)
+    def _do_get(self):
+        start = time.perf_counter()
+        try: return super()._do_get()
+        finally: POOL_WAIT.observe(time.perf_counter() - start, db=self._db_label)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._db_label = self._db_label
+        return pool
+
+_engines = {}
+_validated = {}
+_lock = threading.Lock()
+
+def get_engine(uri):
+    if not uri: raise ValueError("URI de base de datos vacía")
+    with _lock:
+        engine = _engines.get(uri)
+        if engine is None:
+            engine = _engines[uri] = create_engine(uri, poolclass=TimedQueuePool, **POOL_SETTINGS)
+            engine.pool._db_label = engine.url.database
+            logger.info(f"[POOL] Engine creado para {engine.url.host}")
+        return engine
+
+def validate_once(key, check, ttl=VALIDATION_TTL):
+    # Solo se cachea el éxito: un fallo se vuelve a comprobar en la siguiente llamada
+    with _lock: last_ok = _validated.get(key)
+    if last_ok and time.time() - last_ok < ttl: return
+    check()
+    with _lock: _validated[key] = time.time()
+
+def invalidate(key=None):
+    with _lock:
+        if key is None: _validated.clear()
+        else: _validated.pop(key, None)
+
+def pool_stats():
+    with _lock: engines = list(_engines.values())
+    stats = []
+    for engine in engines:
+        pool = engine.pool
+        stats.append({
+            "url": engine.url.render_as_string(hide_password=True),
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    return stats
+
+def dispose_all():
+    with _lock:
+        for engine in _engines.values(): engine.dispose()
+        _engines.clear()
+        _validated.clear()
+
+@registry.collector
+def _collect_pools():
+    size = registry.gauge("db_pool_connections", "Conexiones del pool por estado", ("db", "state"))
+    for engine_stats in pool_stats():
+        db = engine_stats["url"].rsplit('/', 1)[-1].split('?')[0]
+        for state in ("checked_in", "checked_out", "overflow"): size.set(engine_stats[state], db=db, state=state)
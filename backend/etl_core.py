@@ -1,45 +1,285 @@
 import os
-import yaml
 import hashlib
 import logging
 import pandas as pd
+import numpy as np
 import time
 import json
 import uuid
+import io
+import random
+from contextlib import contextmanager, ExitStack
+import cProfile
+import pstats
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+import threading
+from collections import OrderedDict
+from sqlalchemy import text
 from faker import Faker
 from dotenv import load_dotenv
-from cryptography.fernet import Fernet
+from backup_stream import BackupWriter
+from db_registry import get_engine, validate_once
+from config_store import config_store
+from event_log import event_log
+from audit_sink import get_audit_sink, CHECKPOINT_STATUS
+from schema_catalog import schema_catalog
+from metrics import StageTimings, TABLE_RUNS, TABLE_ROWS_PER_SECOND, RETRIES
+from batch_tuner import BatchTuner, tuning_settings
+import audit_schema
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILES_DIR = os.path.join(BASE_DIR, 'profiles')
+SAMPLE_SEED = 42
+CHECKSUM_FANOUT = 32
+RETRY_MAX_WAIT = 60
+CHECKSUM_LEAF_ROWS = 500
+CHECKSUM_PK_TYPES = ('integer', 'bigint', 'smallint')
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# --- MOTOR DE ENMASCARAMIENTO VECTORIZADO ---
+# Cada regla recibe los valores únicos (sin nulos) que faltan en el diccionario y devuelve un arreglo del mismo largo.
+# Las reglas son deterministas por (salt, regla, valor): el mismo dato real da el mismo valor enmascarado en
+# cualquier tabla y corrida, lo que mantiene la integridad referencial entre tablas.
+# Para agregar un tipo de regla basta con decorar una función: @register_masking_rule('mi_regla')
+MASKING_RULES = {}
+
+def register_masking_rule(name, cached=True):
+    def decorator(fn):
+        fn.cached = cached
+        MASKING_RULES[name] = fn
+        return fn
+    return decorator
+
+@register_masking_rule('hash_email')
+def _mask_hash_email(masker, values):
+    return np.array([hashlib.sha256(str(v).encode() + masker.salt).hexdigest()[:12] + "@anon.com" for v in values], dtype=object)
+
+@register_masking_rule('fake_name')
+def _mask_fake_name(masker, values):
+    return masker.name_pool[masker.seeds('fake_name', values) % len(masker.name_pool)]
+
+@register_masking_rule('preserve_format')
+def _mask_preserve_format(masker, values):
+    ladas = pd.Series(55 + masker.seeds('preserve_format', values) % 45).astype(str)
+    return ("+52 (" + ladas + ") ***-****").to_numpy(dtype=object)
+
+@register_masking_rule('redact', cached=False)
+def _mask_redact(masker, values):
+    return np.full(len(values), "****", dtype=object)
+
+# --- DICCIONARIO DE ENMASCARAMIENTO ---
+# LRU en memoria compartida por todas las tablas, delante de una tabla opcional en QA (mascaras_diccionario).
+# La llave es el digest con salt de (regla, valor): el dato real nunca se guarda.
+class MaskingDictionary:
+    STORE_DDL = audit_schema.MASK_DICTIONARY_DDL
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.store = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "store_hits": 0, "computed": 0, "evictions": 0}
+
+    def configure(self, capacity=None, store=None):
+        with self._lock:
+            if capacity: self.capacity = int(capacity)
+            if store is not None and store is not self.store:
+                with store.connect() as conn:
+                    conn.execute(text(self.STORE_DDL))
+                    conn.commit()
+            self.store = store
+            self._evict()
+
+    def clear(self):
+        with self._lock: self._cache.clear()
+
+    def _evict(self):
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def lookup(self, rule, digests):
+        found = {}
+        with self._lock:
+            for d in digests:
+                key = (rule, d)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[d] = self._cache[key]
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(digests) - len(found)
+        return found
+
+    def put(self, rule, mapping):
+        with self._lock:
+            for d, v in mapping.items():
+                self._cache[(rule, d)] = v
+                self._cache.move_to_end((rule, d))
+            self._evict()
+
+    def load(self, rule, digests):
+        if not self.store or not digests: return {}
+        with self.store.connect() as conn:
+            rows = conn.execute(text("SELECT digest, valor FROM mascaras_diccionario WHERE regla = :r AND digest = ANY(:d)"), {"r": rule, "d": list(digests)})
+            found = {r[0]: r[1] for r in rows}
+        with self._lock: self.stats["store_hits"] += len(found)
+        return found
+
+    def save(self, rule, mapping):
+        if not self.store or not mapping: return
+        with self.store.connect() as conn:
+            conn.execute(text("INSERT INTO mascaras_diccionario (regla, digest, valor) VALUES (:r, :d, :v) ON CONFLICT (regla, digest) DO NOTHING"),
+                         [{"r": rule, "d": d, "v": v} for d, v in mapping.items()])
+            conn.commit()
+
+    def resolve(self, rule, digests, compute):
+        # Orden de búsqueda: LRU -> tabla persistente -> cálculo; lo nuevo se escribe en ambos niveles
+        found = self.lookup(rule, digests)
+        missing = [d for d in digests if d not in found]
+        if missing:
+            stored = self.load(rule, missing)
+            found.update(stored)
+            pending = [d for d in missing if d not in stored]
+            computed = dict(zip(pending, compute(pending))) if pending else {}
+            found.update(computed)
+            with self._lock: self.stats["computed"] += len(computed)
+            self.save(rule, computed)
+            self.put(rule, {d: found[d] for d in missing})
+        return found
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "size": len(self._cache), "capacity": self.capacity, "persistent": self.store is not None,
+                    "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else None}
+
+class MaskingEngine:
+    def __init__(self, salt, faker, name_pool_size=2000):
+        self.salt = salt
+        self.faker = faker
+        self.name_pool_size = name_pool_size
+        self.dictionary = MaskingDictionary()
+        self._name_pool = None
+
+    @property
+    def name_pool(self):
+        # Pool de nombres generado una vez por motor con semilla derivada del salt: estable entre procesos
+        if self._name_pool is None:
+            pool_faker = Faker('es_MX')
+            pool_faker.seed_instance(int.from_bytes(hashlib.sha256(self.salt).digest()[:8], 'big'))
+            self._name_pool = np.array([pool_faker.name() for _ in range(self.name_pool_size)], dtype=object)
+        return self._name_pool
+
+    def digest(self, rule, value):
+        return hashlib.sha256(self.salt + b"\x00" + rule.encode() + b"\x00" + str(value).encode()).hexdigest()
+
+    def seeds(self, rule, values):
+        # Entero de 64 bits por valor, derivado del digest con salt (para elegir de forma determinista)
+        return np.array([int(self.digest(rule, v)[:16], 16) for v in values], dtype=np.uint64)
+
+    def mask_column(self, series, rule):
+        fn = MASKING_RULES.get(rule)
+        if fn is None: return series
+        not_null = series.notna()
+        if not not_null.any(): return series
+        out = series.astype(object)
+        # Cada valor único se resuelve una sola vez y se mapea de regreso con los códigos de factorize
+        codes, uniques = pd.factorize(series[not_null])
+        if fn.cached:
+            digests = [self.digest(rule, u) for u in uniques]
+            by_digest = dict(zip(digests, uniques))
+            mapping = self.dictionary.resolve(rule, list(by_digest), lambda pending: fn(self, [by_digest[d] for d in pending]))
+            masked = np.array([mapping[d] for d in digests], dtype=object)
+        else: masked = np.asarray(fn(self, list(uniques)), dtype=object)
+        out[not_null] = masked[codes]
+        return out
+
+    def mask_frame(self, df, masking_rules, timings=None):
+        for col, rule in masking_rules.items():
+            if col not in df.columns or rule not in MASKING_RULES: continue
+            if timings is None: df[col] = self.mask_column(df[col], rule)
+            else:
+                with timings.stage('mask', len(df), rule): df[col] = self.mask_column(df[col], rule)
+        return df
+
+def _to_python(value):
+    # Escalares de numpy/pandas a tipos que psycopg2 sabe adaptar
+    if pd.isna(value): return None
+    if isinstance(value, pd.Timestamp): return value.to_pydatetime()
+    return value.item() if hasattr(value, 'item') else value
+
+class JobCancelled(Exception):
+    pass
+
+# Un solo motor de enmascaramiento por salt: el pool de nombres y Faker se construyen una vez por proceso
+_maskers = {}
+_maskers_lock = threading.Lock()
+
+def get_masker(salt):
+    with _maskers_lock:
+        if salt not in _maskers: _maskers[salt] = MaskingEngine(salt, Faker('es_MX'))
+        return _maskers[salt]
+
+# --- SUBDIVISIÓN DE RANGOS (CHECKSUM) ---
+# range_sums(lo, hi, width) devuelve {cubeta: (filas, suma)} de origen y de QA para [lo, hi] en cubetas de width claves.
+# Las cubetas distintas con más de leaf_rows filas se vuelven a dividir; el resto son hojas a comparar fila por fila.
+def narrow_ranges(lo, hi, range_sums, fanout=CHECKSUM_FANOUT, leaf_rows=CHECKSUM_LEAF_ROWS):
+    stack, leaves, compared = [(lo, hi)], [], 0
+    while stack:
+        lo, hi = stack.pop()
+        width = max(1, -(-(hi - lo + 1) // fanout))
+        source, target = range_sums(lo, hi, width)
+        compared += 1
+        for bucket in sorted(set(source) | set(target)):
+            if source.get(bucket) == target.get(bucket): continue
+            b_lo = lo + bucket * width
+            b_hi = min(hi, b_lo + width - 1)
+            rows = max(source.get(bucket, (0,))[0], target.get(bucket, (0,))[0])
+            if rows <= leaf_rows or width == 1: leaves.append((b_lo, b_hi))
+            else: stack.append((b_lo, b_hi))
+    return sorted(leaves), compared
+
 class ETLEngine:
     def __init__(self):
-        config_path = os.path.join(BASE_DIR, 'config.yaml')
-        with open(config_path, 'r', encoding='utf-8') as f:
-            self.config = yaml.safe_load(f)
-        
+        self.config, self.config_version = config_store.snapshot()
+
         settings = self.config.get('settings', {})
         self.app_name = settings.get('app_name', 'DataMask ETL')
         self.batch_size = int(settings.get('batch_size', 1000))
-        self.faker = Faker('es_MX')
+        self.batch_tuning = tuning_settings(settings)
         self.salt = os.getenv("HASH_SALT", "default").encode()
+        self.masker = get_masker(self.salt)
+        self.faker = self.masker.faker
         self.encryption_key = os.getenv("BACKUP_ENCRYPTION_KEY")
         self.max_retries = 3 if settings.get('scheduler', {}).get('auto_retry', False) else 1
-        self.retry_wait = 2
+        self.retry_wait = float(settings.get('scheduler', {}).get('retry_wait_seconds', 2))
+        self.max_workers = max(1, int(settings.get('max_parallel_tables', 4)))
+        self.on_failure = settings.get('on_failure', 'continue')
+        sampling = settings.get('sampling', {})
+        self.sample_method = sampling.get('method', 'hash')
+        self.sample_fk_closed = bool(sampling.get('fk_closed', False))
         
         try:
-            self.engine_prod = create_engine(os.getenv(self.config['databases']['source_db_env_var']), pool_pre_ping=True)
-            self.engine_qa = create_engine(os.getenv(self.config['databases']['target_db_env_var']), pool_pre_ping=True)
-            self.validate_environments()
+            self.engine_prod = get_engine(os.getenv(self.config['databases']['source_db_env_var']))
+            self.engine_qa = get_engine(os.getenv(self.config['databases']['target_db_env_var']))
+            self.validate()
         except Exception as e:
             logger.error(f"[CRITICAL] Error: {e}")
             raise
+        try: validate_once(('audit_schema', str(self.engine_qa.url)), self.ensure_audit_schema, ttl=float('inf'))
+        except Exception as e: logger.warning(f"[WARN] No se pudo preparar el esquema de auditoría en QA: {e}")
+        self.audit = get_audit_sink(self.engine_qa)
+        masking = settings.get('masking', {})
+        try: self.masker.dictionary.configure(masking.get('cache_size', 100000), self.engine_qa if masking.get('persist', False) else None)
+        except Exception as e: logger.warning(f"[WARN] Diccionario de enmascaramiento solo en memoria: {e}")
+
+    def validate(self):
+        # Se llama en cada uso del motor compartido (get_etl) y en cada corrida: vuelve a validar al vencer el TTL
+        validate_once((str(self.engine_prod.url), str(self.engine_qa.url)), self.validate_environments)
 
     def validate_environments(self):
         try:
@@ -56,181 +296,718 @@ class ETLEngine:
 
     def mask_value(self, value, rule):
         if value is None: return None
-        if rule == 'hash_email': return hashlib.sha256(str(value).encode() + self.salt).hexdigest()[:12] + "@anon.com"
-        elif rule == 'fake_name': return self.faker.name()
-        elif rule == 'preserve_format': return f"+52 ({self.faker.random_int(55,99)}) ***-****"
-        elif rule == 'redact': return "****"
-        return value
+        return self.masker.mask_column(pd.Series([value], dtype=object), rule).iloc[0]
 
     def _get_schema_definition(self):
+        # Tablas de negocio + auditoría/etl_* (estas desde audit_schema, la misma definición que usa ensure_audit_schema)
         return """
-DROP TABLE IF EXISTS detalle_ordenes, ordenes, inventario, clientes, auditoria, _db_meta CASCADE;
+DROP TABLE IF EXISTS detalle_ordenes, ordenes, inventario, clientes, _db_meta, {etl_tables} CASCADE;
 CREATE TABLE clientes (id INTEGER PRIMARY KEY, nombre VARCHAR(100), email VARCHAR(100), telefono VARCHAR(50), direccion VARCHAR(200), fecha_registro TIMESTAMP);
 CREATE TABLE inventario (id INTEGER PRIMARY KEY, producto VARCHAR(100) UNIQUE, stock INTEGER, ubicacion VARCHAR(50), fecha_registro TIMESTAMP);
 CREATE TABLE ordenes (id INTEGER PRIMARY KEY, cliente_id INTEGER REFERENCES clientes(id), total DECIMAL(10, 2), fecha TIMESTAMP);
 CREATE TABLE detalle_ordenes (id INTEGER PRIMARY KEY, orden_id INTEGER REFERENCES ordenes(id), producto VARCHAR(100) REFERENCES inventario(producto), cantidad INTEGER, precio_unitario DECIMAL(10, 2));
-CREATE TABLE IF NOT EXISTS auditoria (id SERIAL PRIMARY KEY, id_ejecucion VARCHAR(50), fecha_ejecucion TIMESTAMP, tabla VARCHAR(50), registros_procesados INTEGER, registros_fallidos INTEGER, estado VARCHAR(100), mensaje TEXT, operacion VARCHAR(50), reglas_aplicadas TEXT, fecha_inicio TIMESTAMP, fecha_fin TIMESTAMP);
 CREATE TABLE _db_meta (key VARCHAR PRIMARY KEY, value VARCHAR);
-"""
-    def _generate_table_sql(self, engine, table_name):
-        try:
-            df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
-            if df.empty: return f"\n-- Tabla {table_name} vacía.\n"
-            sql = [f"\n-- Datos: {table_name}"]
-            for _, row in df.iterrows():
-                vals = []
-                for val in row:
-                    if pd.isna(val): vals.append("NULL")
-                    elif isinstance(val, (int, float)): vals.append(str(val))
-                    else: vals.append(f"'{str(val).replace("'", "''")}'")
-                sql.append(f"INSERT INTO {table_name} VALUES ({', '.join(vals)});")
-            return "\n".join(sql) + "\n"
-        except: return ""
+""".format(etl_tables=', '.join(audit_schema.SCHEMA_TABLES)) + audit_schema.schema_sql()
+    # --- RESPALDO CIFRADO POR STREAMING ---
+    BACKUP_TABLES = {"prod": ['_db_meta', 'clientes', 'inventario', 'ordenes', 'detalle_ordenes'], "qa": ['auditoria']}
+
+    @contextmanager
+    def _backup_snapshots(self):
+        # Una transacción REPEATABLE READ por origen exporta su snapshot y queda abierta durante todo el respaldo;
+        # cada hilo de volcado lo adopta, así todas las tablas de un origen salen del mismo instante (FK consistentes)
+        with ExitStack() as stack:
+            snapshots = {}
+            for source in self.BACKUP_TABLES:
+                conn = stack.enter_context((self.engine_prod if source == 'prod' else self.engine_qa).connect())
+                conn.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"))
+                snapshots[source] = conn.execute(text("SELECT pg_export_snapshot()")).scalar()
+            yield snapshots
+
+    def _dump_table(self, writer, source, table, snapshot=None):
+        engine = self.engine_prod if source == 'prod' else self.engine_qa
+        with engine.connect() as conn:
+            if snapshot:
+                conn.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"))
+                conn.execute(text("SET TRANSACTION SNAPSHOT :s"), {"s": snapshot})
+            if not conn.execute(text("SELECT to_regclass(:t)"), {"t": f"public.{table}"}).scalar():
+                logger.warning(f"   [SKIP] Respaldo: tabla {table} no existe en {source}")
+                return None
+            columns = list(conn.execute(text(f"SELECT * FROM {table} LIMIT 0")).keys())
+            col_list = ', '.join(f'"{c}"' for c in columns)
+            stream = writer.open_table(table, source, columns)
+            cursor = conn.connection.dbapi_connection.cursor()
+            try: cursor.copy_expert(f"COPY {table} ({col_list}) TO STDOUT", stream)
+            finally: cursor.close()
+            conn.rollback()
+            return stream.close()
 
     def create_encrypted_backup(self):
         if not self.encryption_key: raise ValueError("Falta BACKUP_ENCRYPTION_KEY")
-        try:
-            backup_dir = os.path.join(BASE_DIR, 'backups')
-            if not os.path.exists(backup_dir): os.makedirs(backup_dir)
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"backup_{ts}.sql.enc"
-            
-            full_sql = f"-- RESPALDO {ts}\n" + self._get_schema_definition()
-            for t in ['_db_meta', 'clientes', 'inventario', 'ordenes', 'detalle_ordenes']: full_sql += self._generate_table_sql(self.engine_prod, t)
-            for t in ['auditoria']: full_sql += self._generate_table_sql(self.engine_qa, t)
+        backup_dir = os.path.join(BASE_DIR, 'backups')
+        if not os.path.exists(backup_dir): os.makedirs(backup_dir)
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"backup_{ts}.dmbk"
 
-            fernet = Fernet(self.encryption_key.encode())
-            with open(os.path.join(backup_dir, filename), 'wb') as f: f.write(fernet.encrypt(full_sql.encode('utf-8')))
-            return filename
-        except Exception as e: raise e
+        writer = BackupWriter(os.path.join(backup_dir, filename), self.encryption_key.encode())
+        try:
+            writer.write_schema(f"-- RESPALDO {ts}\n" + self._get_schema_definition())
+            tasks = [(source, t) for source, tables in self.BACKUP_TABLES.items() for t in tables]
+            with self._backup_snapshots() as snapshots, ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='backup') as pool:
+                for future in [pool.submit(self._dump_table, writer, source, t, snapshots[source]) for source, t in tasks]: future.result()
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        logger.info(f"[OK] Respaldo {filename}: " + ", ".join(f"{t}={i['rows']}" for t, i in writer.manifest['tables'].items()))
+        return filename
 
     def cleanup_old_logs(self):
         try:
             days = self.config.get('settings', {}).get('security', {}).get('log_retention_days', 90)
             cutoff = datetime.now() - timedelta(days=int(days))
-            with self.engine_qa.connect() as conn: conn.execute(text("DELETE FROM auditoria WHERE fecha_ejecucion < :c"), {"c": cutoff}); conn.commit()
+            with self.engine_qa.connect() as conn:
+                conn.execute(text("DELETE FROM auditoria WHERE fecha_ejecucion < :c"), {"c": cutoff})
+                conn.execute(text("DELETE FROM auditoria_resumen WHERE dia < :d"), {"d": cutoff.date()})
+                conn.execute(text("DELETE FROM etl_tiempos_etapa WHERE fecha < :c"), {"c": cutoff})
+                conn.execute(text("DELETE FROM etl_checkpoints WHERE fecha < :c AND estado = 'COMPLETO'"), {"c": cutoff})
+                conn.commit()
+            # La retención de la bitácora JSONL borra segmentos completos aquí, no en cada escritura
+            event_log.prune(cutoff)
         except: pass
 
     # --- LOG A BASE DE DATOS ---
+    def ensure_audit_schema(self):
+        with self.engine_qa.connect() as conn:
+            audit_schema.ensure_audit_schema(conn)
+            conn.commit()
+
     def log_audit(self, table, records, status, error=None, start_time=None, end_time=None, execution_id=None, operation=None, rules=None, failed=0):
-        try:
-            with self.engine_qa.connect() as conn:
-                conn.execute(text("""
-                    INSERT INTO auditoria (
-                        id_ejecucion, fecha_ejecucion, tabla, registros_procesados, registros_fallidos,
-                        estado, mensaje, operacion, reglas_aplicadas, fecha_inicio, fecha_fin
-                    ) VALUES (:eid, :f, :t, :r, :rf, :s, :m, :op, :rules, :fi, :ff)
-                """), {
-                    "eid": execution_id, "f": datetime.now(), "t": table, "r": records, "rf": failed,
-                    "s": status, "m": str(error)[:500] if error else "OK", "op": operation, "rules": rules,
-                    "fi": start_time, "ff": end_time
-                })
-                conn.commit()
-        except: pass
+        # Se encola; el hilo de AuditSink lo escribe en lote junto con el resumen del dashboard
+        self.audit.emit({
+            "eid": execution_id, "f": datetime.now(), "t": table, "r": records, "rf": failed,
+            "s": status, "m": str(error)[:500] if error else "OK", "op": operation, "rules": rules,
+            "fi": start_time, "ff": end_time
+        })
 
     # --- LOG A JSON (ESTRUCTURADO PARA EL ASESOR) ---
     def save_json_report(self, table, status, records, mode, error_msg=None, start_time=None, end_time=None, execution_id=None, rules=None, failed=0):
-        try:
-            if not self.config.get('settings', {}).get('notifications', {}).get('enabled', False): return
-            path = os.path.join(BASE_DIR, 'notifications_log.json')
-            days = self.config.get('settings', {}).get('security', {}).get('log_retention_days', 90)
-            cutoff = datetime.now() - timedelta(days=int(days))
-            
-            # Estructura Solicitada
-            event = {
-                "execution_id": execution_id,
-                "timestamp": datetime.now().isoformat(),
-                "table_name": table,
-                "status": status,
-                "operation_mode": mode,
-                "start_time": start_time.isoformat() if start_time else None,
-                "end_time": end_time.isoformat() if end_time else None,
-                "records_updated": records,
-                "records_failed": failed,
-                "masking_applied": rules,
-                "details": error_msg or "OK"
-            }
-            
-            history = []
-            if os.path.exists(path):
-                with open(path, 'r', encoding='utf-8') as f: history = json.load(f)
-            history.insert(0, event)
-            history = [h for h in history if datetime.fromisoformat(h['timestamp']) > cutoff][:1000]
-            with open(path, 'w', encoding='utf-8') as f: json.dump(history, f, indent=4)
-        except: pass
+        if not self.config.get('settings', {}).get('notifications', {}).get('enabled', False): return
+        # Estructura Solicitada (se escribe en la bitácora desde el hilo de AuditSink)
+        event = {
+            "execution_id": execution_id,
+            "timestamp": datetime.now().isoformat(),
+            "table_name": table,
+            "status": status,
+            "operation_mode": mode,
+            "start_time": start_time.isoformat() if start_time else None,
+            "end_time": end_time.isoformat() if end_time else None,
+            "records_updated": records,
+            "records_failed": failed,
+            "masking_applied": rules,
+            "details": error_msg or "OK"
+        }
+        self.audit.notify(event)
+
+    # --- WATERMARKS PERSISTENTES ---
+    # Último (filter_column, pk) extraído por tabla; se actualiza en la misma transacción que la carga
+    def get_watermark(self, table, filter_col, pk):
+        with self.engine_qa.connect() as conn:
+            row = conn.execute(text("SELECT valor_filtro, valor_pk FROM etl_watermarks WHERE tabla = :t AND columna = :c"), {"t": table, "c": filter_col}).fetchone()
+            if row: return (row[0], row[1]) if row[0] is not None else None
+            # Sin watermark guardado: se arranca una sola vez desde la última fila ya cargada en QA
+            if not conn.execute(text("SELECT to_regclass(:t)"), {"t": f"public.{table}"}).scalar(): return None
+            last = conn.execute(text(f"SELECT {filter_col}, {pk} FROM {table} WHERE {filter_col} IS NOT NULL ORDER BY {filter_col} DESC, {pk} DESC LIMIT 1")).fetchone()
+            if not last: return None
+            mark = (last[0], last[1])
+            self.save_watermark(conn, table, filter_col, mark)
+            conn.commit()
+            return mark
 
-    def get_max_date(self, table, col):
+    def save_watermark(self, conn, table, filter_col, mark):
+        conn.execute(text("""
+            INSERT INTO etl_watermarks (tabla, columna, valor_filtro, valor_pk, actualizado) VALUES (:t, :c, :f, :p, :now)
+            ON CONFLICT (tabla, columna) DO UPDATE SET valor_filtro = EXCLUDED.valor_filtro, valor_pk = EXCLUDED.valor_pk, actualizado = EXCLUDED.actualizado
+        """), {"t": table, "c": filter_col, "f": None if mark[0] is None else str(mark[0]), "p": None if mark[1] is None else str(mark[1]), "now": datetime.now()})
+
+    def list_watermarks(self):
+        with self.engine_qa.connect() as conn:
+            return [dict(r._mapping) for r in conn.execute(text("SELECT tabla, columna, valor_filtro, valor_pk, actualizado FROM etl_watermarks ORDER BY tabla"))]
+
+    def set_watermark(self, table, filter_value=None, pk_value=None):
+        # Sin valor = reinicio (se guarda vacío y la siguiente corrida es completa); con valor = rebobinar a ese punto
+        conf = next((t for t in self.config['tables'] if t['name'] == table), None)
+        if not conf or not conf.get('filter_column'): raise ValueError(f"{table} no tiene filter_column configurada")
+        with self.engine_qa.connect() as conn:
+            self.save_watermark(conn, table, conf['filter_column'], (filter_value, pk_value if filter_value is not None else None))
+            conn.commit()
+
+    # --- EXTRACCIÓN POR BLOQUES ---
+    def extract_chunks(self, query, params=None, size=None):
+        # Cursor del lado del servidor (stream_results): en memoria solo vive un bloque. size() se lee antes de cada
+        # bloque, así el tamaño ajustado tras el bloque anterior aplica al siguiente sin reabrir la consulta
+        size = size or (lambda: self.batch_size)
+        with self.engine_prod.connect().execution_options(stream_results=True, max_row_buffer=self.batch_size) as conn:
+            result = conn.execute(text(query), params or {})
+            columns = list(result.keys())
+            while True:
+                rows = result.fetchmany(size())
+                if not rows: return
+                # Sin coerce_float: NUMERIC llega como Decimal y se carga sin pasar por float (mismo criterio en todas las rutas)
+                yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=False)
+
+    def _after_mark(self, filter_col, keys, last):
+        where, params = f"{filter_col} IS NOT NULL", {}
+        if last is not None and (len(keys) == 1 or last[1] is None):
+            # Watermark sin pk (rebobinado manual): todo lo posterior al valor de filtro
+            where += f" AND {filter_col} > :k0"
+            params["k0"] = last[0]
+        elif last is not None:
+            where += f" AND ({', '.join(keys)}) > (:k0, :k1)"
+            params.update({"k0": last[0], "k1": last[1]})
+        return where, params
+
+    def extract_keyset(self, source, filter_col, pk, start=None, size=None):
+        # Una sola consulta ordenada por (filter_column, pk) en streaming desde el watermark: el orden se resuelve una vez
+        # (no una búsqueda + top-N por página, que sin índice en el origen es un scan completo por bloque) y la marca
+        # avanza con la última fila de cada bloque. Con muestra, el plan de la muestra/semi-join también se calcula una vez.
+        keys = [filter_col] if filter_col == pk else [filter_col, pk]
+        where, params = self._after_mark(filter_col, keys, start)
+        if source[1]: where += f" AND {source[1]}"
+        for df in self.extract_chunks(f"SELECT * FROM {source[0]} WHERE {where} ORDER BY {', '.join(keys)}", params, size):
+            if df.empty: continue
+            tail = df.iloc[-1]
+            yield df, (_to_python(tail[keys[0]]), _to_python(tail[keys[-1]]))
+
+    def extract_table(self, table, filter_col, pk, start=None, sample=None, include_nulls=None, size=None):
+        source = sample or (table, None)
+        if not filter_col:
+            # Sin watermark: orden por pk para poder reanudar desde el último bloque confirmado (start = (pk,))
+            where = [source[1]] if source[1] else []
+            if start is not None: where.append(f"{pk} > :k0")
+            query = f"SELECT * FROM {source[0]}" + (f" WHERE {' AND '.join(where)}" if where else "") + f" ORDER BY {pk}"
+            for df in self.extract_chunks(query, {"k0": start[0]} if start is not None else None, size): yield df, None
+            return
+        yield from self.extract_keyset(source, filter_col, pk, start, size)
+        # En carga completa también van las filas sin valor en filter_column (no entran al watermark)
+        if include_nulls is None: include_nulls = start is None
+        if include_nulls:
+            for df in self.extract_chunks(f"SELECT * FROM {source[0]} WHERE {filter_col} IS NULL" + (f" AND {source[1]}" if source[1] else ""), None, size): yield df, None
+
+    # --- MUESTREO EN ORIGEN ---
+    def _sample_percent(self, table, override_percent=None):
+        conf = next((t for t in self.config['tables'] if t['name'] == table), None)
+        if conf is None: return 100.0
+        return float(override_percent) if override_percent is not None else float(conf.get('sample_percent', 100))
+
+    def sample_source(self, table, override_percent=None, fk_closed=None, _seen=()):
+        # (FROM, WHERE) de la muestra en Producción; None = tabla completa.
+        # hash: hash estable de la PK (misma muestra en cada corrida, compatible con incrementales).
+        # system: TABLESAMPLE SYSTEM por bloques (más barato, cambia si las filas se mueven de página).
+        # fk_closed: las tablas hijas solo traen filas cuyos padres están en la muestra de sus padres.
+        conf = next((t for t in self.config['tables'] if t['name'] == table), {})
+        fk_closed = self.sample_fk_closed if fk_closed is None else fk_closed
+        if fk_closed and table not in _seen:
+            parents = []
+            for fk in (schema_catalog.table(self.engine_prod, table) or {}).get('fks', []):
+                if fk['ref_table'] == table: continue
+                parent = self.sample_source(fk['ref_table'], override_percent, True, _seen + (table,))
+                if parent is None: continue
+                cols, refs = ', '.join(fk['columns']), ', '.join(fk['ref_columns'])
+                nulls = ' OR '.join(f"{c} IS NULL" for c in fk['columns'])
+                subquery = f"SELECT {refs} FROM {parent[0]}" + (f" WHERE {parent[1]}" if parent[1] else "")
+                parents.append(f"({nulls} OR ({cols}) IN ({subquery}))")
+            if parents: return (table, ' AND '.join(parents))
+        percent = self._sample_percent(table, override_percent)
+        if percent >= 100: return None
+        if not 0 <= percent < 100: raise ValueError(f"Porcentaje de muestra inválido para {table}: {percent}")
+        if conf.get('sample_method', self.sample_method) == 'system':
+            return (f"{table} TABLESAMPLE SYSTEM ({percent}) REPEATABLE ({SAMPLE_SEED})", None)
+        pk = conf.get('pk', 'id')
+        return (table, f"((hashtextextended({pk}::text, {SAMPLE_SEED}) % 10000) + 10000) % 10000 < {int(round(percent * 100))}")
+
+    def sample_keeps_watermark(self, table, sample):
+        # El watermark solo avanza con la muestra configurada de la tabla y si es determinista (hash de la PK).
+        # Una corrida puntual con otro porcentaje o subset, o con TABLESAMPLE (cambia entre corridas), no lo mueve:
+        # si lo hiciera, las filas que quedaron fuera no se cargarían nunca en las corridas incrementales siguientes.
+        if sample is None: return True
+        if 'TABLESAMPLE' in ' '.join(filter(None, sample)): return False
+        return sample == self.sample_source(table)
+
+    # --- CARGA A QA ---
+    def load_chunk(self, conn, table, pk, df, loader='insert', timings=None):
+        timings = timings or StageTimings(table)
+        if loader == 'copy':
+            with timings.stage('load', len(df)): return self.copy_upsert_chunk(conn, table, pk, df)
+        with timings.stage('delete', len(df)): self.delete_chunk(conn, table, pk, df)
+        with timings.stage('load', len(df)): self.insert_chunk(conn, table, df)
+
+    def delete_chunk(self, conn, table, pk, df):
+        ids = [str(x) for x in df[pk].tolist()]
+        conn.execute(text(f"DELETE FROM {table} WHERE {pk} IN ({','.join(ids)})"))
+
+    def insert_chunk(self, conn, table, df):
+        df.to_sql(table, conn, if_exists='append', index=False, method='multi', chunksize=self.batch_size)
+
+    def _to_copy_buffer(self, df):
+        # Enteros con NULL llegan como float (5.0) y COPY los rechaza en columnas INTEGER
+        for col in df.select_dtypes(include='float').columns:
+            values = df[col].dropna()
+            if len(values) and (values % 1 == 0).all(): df[col] = df[col].astype('Int64')
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=False, na_rep='\\N')
+        buf.seek(0)
+        return buf
+
+    def copy_upsert_chunk(self, conn, table, pk, df):
+        # COPY FROM STDIN a una tabla temporal y un solo MERGE set-based hacia el destino
+        stage = f"_stage_{table}"
+        cols = [f'"{c}"' for c in df.columns]
+        col_list = ', '.join(cols)
+        conn.execute(text(f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"))
+        conn.execute(text(f"TRUNCATE {stage}"))
+        cursor = conn.connection.dbapi_connection.cursor()
         try:
-            with self.engine_qa.connect() as conn: return conn.execute(text(f"SELECT MAX({col}) FROM {table}")).scalar()
-        except: return None
+            cursor.copy_expert(f"COPY {stage} ({col_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", self._to_copy_buffer(df))
+        finally: cursor.close()
+        updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in cols if c != f'"{pk}"')
+        on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        conn.execute(text(f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM {stage} ON CONFLICT ({pk}) {on_conflict}"))
+
+    # --- SINCRONIZACIÓN POR CHECKSUM (RANGOS DE PK) ---
+    # Para tablas sin columna de fecha confiable: se compara la suma de hashes por rango de PK entre el origen
+    # (md5 de la fila) y etl_row_hashes en QA (hash de lo que se cargó). Los rangos distintos se subdividen
+    # (CHECKSUM_FANOUT por nivel) hasta tener <= CHECKSUM_LEAF_ROWS filas; ahí se compara fila por fila.
+    # Se recargan las filas nuevas o cambiadas y se borran de QA las que ya no existen en el origen.
+    # Con la muestra configurada de la tabla (hash de la PK, estable) el origen es solo la muestra: cond es su predicado.
+    # Cada grupo recargado o borrado se confirma junto con sus hashes (commit): un reintento solo compara lo que aún difiere.
+    RANGE_SUM = "COUNT(*), SUM(('x' || substr({h}, 1, 15))::bit(60)::bigint)"
+
+    def _range_sums(self, src, qa, table, pk, lo, hi, width, cond=""):
+        params = {"lo": lo, "hi": hi, "w": width, "t": table}
+        source = {r[0]: (r[1], r[2]) for r in src.execute(text(f"SELECT ({pk} - :lo) / :w, {self.RANGE_SUM.format(h='md5(t::text)')} FROM {table} t WHERE {pk} BETWEEN :lo AND :hi{cond} GROUP BY 1"), params)}
+        target = {r[0]: (r[1], r[2]) for r in qa.execute(text(f"SELECT (pk - :lo) / :w, {self.RANGE_SUM.format(h='hash')} FROM etl_row_hashes WHERE tabla = :t AND pk BETWEEN :lo AND :hi GROUP BY 1"), params)}
+        return source, target
+
+    def diff_ranges(self, src, qa, table, pk, cond=""):
+        # Rangos hoja [lo, hi] cuyo contenido difiere entre origen y QA
+        lo_s, hi_s = src.execute(text(f"SELECT MIN({pk}), MAX({pk}) FROM {table} t WHERE TRUE{cond}")).fetchone()
+        lo_q, hi_q = qa.execute(text("SELECT MIN(pk), MAX(pk) FROM etl_row_hashes WHERE tabla = :t"), {"t": table}).fetchone()
+        bounds = [b for b in (lo_s, hi_s, lo_q, hi_q) if b is not None]
+        if not bounds: return [], 0
+        return narrow_ranges(min(bounds), max(bounds), lambda lo, hi, width: self._range_sums(src, qa, table, pk, lo, hi, width, cond))
+
+    def checksum_sync(self, conn, table_conf, timings, job=None, batch_rows=None, sample=None, commit=None):
+        table, pk = table_conf['name'], table_conf['pk']
+        loader, masking_rules = table_conf.get('loader', 'insert'), table_conf.get('masking_rules', {})
+        info = schema_catalog.table(self.engine_prod, table) or {}
+        pk_type = next((c['type'] for c in info.get('columns', []) if c['name'] == pk), None)
+        if pk_type not in CHECKSUM_PK_TYPES: raise ValueError(f"sync_mode checksum requiere una PK entera en {table} (tipo: {pk_type})")
+        batch_rows = batch_rows or self.batch_size
+        cond = f" AND ({sample[1]})" if sample and sample[1] else ""
+        commit = commit or (lambda rows, key_range: None)
+        stats = {"ranges": 0, "leaves": 0, "changed": 0, "deleted": 0}
+        # Si la tabla de QA se vació o se cargó por otra vía, los hashes guardados ya no la describen: se recarga completa
+        # (se confirma con el primer grupo y con session_replication_role = replica, las hijas no se tocan)
+        loaded = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+        if loaded != conn.execute(text("SELECT COUNT(*) FROM etl_row_hashes WHERE tabla = :t"), {"t": table}).scalar():
+            logger.warning(f"   [WARN] {table}: los hashes de QA no coinciden con la tabla, se recarga completa")
+            conn.execute(text(f"DELETE FROM {table}"))
+            conn.execute(text("DELETE FROM etl_row_hashes WHERE tabla = :t"), {"t": table})
+        with self.engine_prod.connect() as src:
+            with timings.stage('checksum'): leaves, stats["ranges"] = self.diff_ranges(src, conn, table, pk, cond)
+            stats["leaves"] = len(leaves)
+            changed, deleted = [], []
+            for lo, hi in leaves:
+                with timings.stage('checksum'):
+                    params = {"lo": lo, "hi": hi, "t": table}
+                    source = dict(src.execute(text(f"SELECT {pk}, md5(t::text) FROM {table} t WHERE {pk} BETWEEN :lo AND :hi{cond}"), params).fetchall())
+                    target = dict(conn.execute(text("SELECT pk, hash FROM etl_row_hashes WHERE tabla = :t AND pk BETWEEN :lo AND :hi"), params).fetchall())
+                changed += [k for k, h in source.items() if target.get(k) != h]
+                deleted += [k for k in target if k not in source]
+                if len(changed) >= batch_rows:
+                    stats["changed"] += self._reload_rows(src, conn, table_conf, changed, timings, job, cond, commit)
+                    changed = []
+            if changed: stats["changed"] += self._reload_rows(src, conn, table_conf, changed, timings, job, cond, commit)
+        for i in range(0, len(deleted), batch_rows):
+            ids = deleted[i:i + batch_rows]
+            with timings.stage('delete', len(ids)):
+                conn.execute(text(f"DELETE FROM {table} WHERE {pk} = ANY(:ids)"), {"ids": ids})
+                conn.execute(text("DELETE FROM etl_row_hashes WHERE tabla = :t AND pk = ANY(:ids)"), {"t": table, "ids": ids})
+            commit(len(ids), (min(ids), max(ids)))
+            stats["deleted"] += len(ids)
+        return stats
+
+    def _reload_rows(self, src, conn, table_conf, ids, timings, job=None, cond="", commit=None):
+        table, pk = table_conf['name'], table_conf['pk']
+        with timings.stage('extract', len(ids)):
+            df = pd.read_sql(text(f"SELECT t.*, md5(t::text) AS _row_hash FROM {table} t WHERE {pk} = ANY(:ids){cond}"), src, params={"ids": ids}, coerce_float=False)
+        if df.empty: return 0
+        hashes = [{"t": table, "pk": int(k), "h": h} for k, h in zip(df[pk], df.pop('_row_hash'))]
+        if job: job.check(); job.table_progress(table, extracted=len(df))
+        self.masker.mask_frame(df, table_conf.get('masking_rules', {}), timings)
+        self.load_chunk(conn, table, pk, df, table_conf.get('loader', 'insert'), timings)
+        with timings.stage('checksum', len(hashes)):
+            conn.execute(text("INSERT INTO etl_row_hashes (tabla, pk, hash) VALUES (:t, :pk, :h) ON CONFLICT (tabla, pk) DO UPDATE SET hash = EXCLUDED.hash"), hashes)
+        # Filas y hashes en la misma transacción
+        if commit: commit(len(df), (min(h["pk"] for h in hashes), max(h["pk"] for h in hashes)))
+        if job: job.table_progress(table, masked=len(df), loaded=len(df))
+        return len(df)
+
+    # --- PUNTOS DE CONTROL POR BLOQUE ---
+    @contextmanager
+    def qa_replica_session(self):
+        # Sesión QA sin triggers de FK. Con commits por bloque el SET sobrevive a la transacción: se restaura siempre
+        with self.engine_qa.connect() as conn:
+            conn.execute(text("SET session_replication_role = 'replica';"))
+            try: yield conn
+            finally:
+                try:
+                    conn.rollback()
+                    conn.execute(text("SET session_replication_role = 'origin';"))
+                    conn.commit()
+                except Exception: conn.invalidate()
+
+    def save_checkpoint(self, conn, execution_id, table, attempt, block, key_range, rows, mode):
+        conn.execute(text("""
+            INSERT INTO etl_checkpoints (id_ejecucion, tabla, intento, bloque, desde, hasta, filas, modo, estado, fecha)
+            VALUES (:eid, :t, :a, :b, :d, :h, :r, :m, 'PARCIAL', :f)
+        """), {"eid": execution_id, "t": table, "a": attempt, "b": block, "d": key_range[0], "h": key_range[1], "r": rows, "m": mode, "f": datetime.now()})
+
+    def resume_point(self, table):
+        # Último bloque confirmado de una carga que no terminó (reintento o proceso caído)
+        with self.engine_qa.connect() as conn:
+            row = conn.execute(text("SELECT id_ejecucion, bloque, hasta, modo FROM etl_checkpoints WHERE tabla = :t AND estado = 'PARCIAL' ORDER BY id DESC LIMIT 1"), {"t": table}).fetchone()
+            if row is None: return None
+            done = conn.execute(text("SELECT COALESCE(SUM(filas), 0) FROM etl_checkpoints WHERE tabla = :t AND estado = 'PARCIAL' AND id_ejecucion = :e"), {"t": table, "e": row[0]}).scalar()
+        return {"execution_id": row[0], "block": row[1], "hasta": row[2], "mode": row[3], "rows": int(done)}
+
+    def complete_checkpoints(self, table):
+        with self.engine_qa.connect() as conn:
+            conn.execute(text("UPDATE etl_checkpoints SET estado = 'COMPLETO' WHERE tabla = :t AND estado = 'PARCIAL'"), {"t": table})
+            conn.commit()
+
+    def list_checkpoints(self, execution_id):
+        with self.engine_qa.connect() as conn:
+            return [dict(r._mapping) for r in conn.execute(text("SELECT tabla, intento, bloque, desde, hasta, filas, modo, estado, fecha FROM etl_checkpoints WHERE id_ejecucion = :e ORDER BY tabla, bloque"), {"e": execution_id})]
+
+    @staticmethod
+    def _chunk_range(df, filter_col, pk):
+        keys = [filter_col, pk] if filter_col and filter_col != pk else [pk]
+        return tuple("|".join(str(_to_python(df[k].iloc[i])) for k in keys) for i in (0, -1))
 
-    def process_table(self, table_conf, override_percent=None, execution_id=None):
+    def retry_delay(self, attempt):
+        # Backoff exponencial con jitter (evita que varias tablas reintenten al mismo tiempo)
+        wait = min(self.retry_wait * 2 ** (attempt - 1), RETRY_MAX_WAIT)
+        return wait + random.uniform(0, wait * 0.1)
+
+    # --- TAMAÑO DE BLOQUE POR TABLA ---
+    def batch_tuner(self, table_conf):
+        # batch_size en la tabla lo fija; si no, parte del último tamaño ajustado (o de settings.batch_size)
+        table = table_conf['name']
+        if table_conf.get('batch_size'): return BatchTuner(table, table_conf['batch_size'], pinned=True)
+        saved = None
+        if self.batch_tuning['enabled']:
+            try:
+                with self.engine_qa.connect() as conn: saved = conn.execute(text("SELECT filas FROM etl_batch_sizes WHERE tabla = :t"), {"t": table}).scalar()
+            except Exception as e: logger.warning(f"   [WARN] {table}: no se pudo leer el tamaño de bloque guardado: {e}")
+        return BatchTuner(table, saved or self.batch_size, **self.batch_tuning)
+
+    def save_batch_size(self, conn, tuner):
+        if not tuner.measured: return
+        conn.execute(text("""
+            INSERT INTO etl_batch_sizes (tabla, filas, filas_por_seg, bytes_por_fila, bloques, actualizado) VALUES (:t, :r, :rps, :bpr, :n, :now)
+            ON CONFLICT (tabla) DO UPDATE SET filas = EXCLUDED.filas, filas_por_seg = EXCLUDED.filas_por_seg, bytes_por_fila = EXCLUDED.bytes_por_fila,
+                bloques = EXCLUDED.bloques, actualizado = EXCLUDED.actualizado
+        """), {"t": tuner.table, "r": tuner.rows, "rps": tuner.rows_per_second, "bpr": tuner.bytes_per_row, "n": tuner.chunks, "now": datetime.now()})
+
+    def list_batch_sizes(self):
+        with self.engine_qa.connect() as conn:
+            saved = {r[0]: r for r in conn.execute(text("SELECT tabla, filas, filas_por_seg, bytes_por_fila, bloques, actualizado FROM etl_batch_sizes"))}
+        out = []
+        for t in self.config['tables']:
+            row = saved.get(t['name'])
+            pinned = bool(t.get('batch_size')) or not self.batch_tuning['enabled']
+            out.append({
+                "table": t['name'], "mode": "fijo" if pinned else "auto",
+                "rows": int(t.get('batch_size') or self.batch_size) if pinned else (row[1] if row else self.batch_size),
+                "rows_per_second": round(row[2], 1) if row and row[2] else None, "bytes_per_row": round(row[3]) if row and row[3] else None,
+                "chunks": row[4] if row else None, "updated": row[5].isoformat() if row and row[5] else None,
+            })
+        return out
+
+    def process_table(self, table_conf, override_percent=None, execution_id=None, job=None, subset=None):
         table = table_conf['name']
         pk = table_conf['pk']
         filter_col = table_conf.get('filter_column')
-        sample_percent = float(override_percent) if override_percent is not None else table_conf.get('sample_percent', 100)
+        loader = table_conf.get('loader', 'insert')
+        checksum = table_conf.get('sync_mode') == 'checksum'
         
         # Datos para auditoría
         masking_rules = table_conf.get('masking_rules', {})
         rules_str = json.dumps(masking_rules) if masking_rules else "None"
-        op_mode = "ETL_FULL"
+        op_mode = "ETL_CHECKSUM" if checksum else "ETL_FULL"
+        # Un solo ajustador para todos los intentos: un reintento sigue con el tamaño ya ajustado
+        tuner = self.batch_tuner(table_conf)
 
         for attempt in range(1, self.max_retries + 1):
             start_time = datetime.now()
+            total = 0
+            timings = StageTimings(table)
+            if job: job.table_update(table, status="running", attempt=attempt, extracted=0, masked=0, loaded=0, batch_rows=tuner.rows)
             try:
                 logger.info(f"[INFO] Procesando {table}...")
-                last_date = self.get_max_date(table, filter_col)
-                query = f"SELECT * FROM {table}"
-                if last_date and filter_col:
-                    query += f" WHERE {filter_col} > '{last_date}'"
-                    op_mode = "ETL_INCREMENTAL"
-                
-                df = pd.read_sql(query, self.engine_prod)
-                if df.empty: 
-                    logger.info(f"   [SKIP] {table}: Sin cambios.")
-                    return 
+                detail = None
+                with timings.stage('sample'): sample = self.sample_source(table, override_percent, subset)
+                if sample: logger.info(f"   [INFO] {table}: muestra en origen -> {sample[0]}" + (f" WHERE {sample[1]}" if sample[1] else ""))
+                # checksum compara contra la muestra configurada (hash de la PK); una muestra puntual, subset o TABLESAMPLE
+                # va por extracción completa ordenada por pk: la siguiente corrida checksum detecta la diferencia y la corrige
+                run_checksum = checksum and self.sample_keeps_watermark(table, sample)
+                if checksum and not run_checksum:
+                    op_mode = "ETL_FULL"
+                    logger.info(f"   [INFO] {table}: muestra puntual o no determinista, se extrae por pk en lugar de checksum")
+                if run_checksum:
+                    # Reintento: los grupos ya confirmados no vuelven a diferir, solo se cuentan
+                    with timings.stage('checkpoint'): resume = self.resume_point(table)
+                    same_run = resume and resume['mode'] == op_mode and resume['execution_id'] == execution_id
+                    block, done = (resume['block'], resume['rows']) if same_run else (0, 0)
+                    chunk_start = datetime.now()
+                    with self.qa_replica_session() as conn:
+                        def confirm(rows, key_range):
+                            # Grupo confirmado: filas + hashes + punto de control en la misma transacción
+                            nonlocal block, chunk_start
+                            block += 1
+                            key_range = tuple(str(k) for k in key_range)
+                            with timings.stage('commit', rows):
+                                self.save_checkpoint(conn, execution_id, table, attempt, block, key_range, rows, op_mode)
+                                conn.commit()
+                            self.log_audit(table, rows, CHECKPOINT_STATUS, f"bloque {block}: {key_range[0]} -> {key_range[1]} ({rows} filas)", chunk_start, datetime.now(), execution_id, op_mode, rules_str, 0)
+                            chunk_start = datetime.now()
+                        stats = self.checksum_sync(conn, table_conf, timings, job, tuner.rows, sample, confirm)
+                        with timings.stage('commit'): conn.commit()
+                    self.complete_checkpoints(table)
+                    total = done + stats["changed"] + stats["deleted"]
+                    detail = f"checksum: {stats['ranges']} rangos comparados, {stats['leaves']} distintos, {stats['changed']} filas recargadas, {stats['deleted']} borradas"
+                    if same_run: detail += f" (reanudada: {done} filas ya confirmadas en {resume['block']} bloques)"
+                    logger.info(f"   [INFO] {table}: {detail}")
+                else:
+                    # Reanudación: las tablas con watermark siguen desde el último bloque confirmado (el watermark se guarda
+                    # con el bloque); las demás desde el último pk confirmado. Una carga completa interrumpida sigue siendo completa.
+                    with timings.stage('checkpoint'): resume = self.resume_point(table)
+                    if checksum and resume and resume['mode'] == "ETL_CHECKSUM": resume = None
+                    filter_col = None if checksum else filter_col
+                    with timings.stage('watermark'): start = self.get_watermark(table, filter_col, pk) if filter_col else None
+                    if start: op_mode = "ETL_INCREMENTAL"
+                    include_nulls = None
+                    if resume:
+                        op_mode = resume['mode']
+                        if resume['execution_id'] == execution_id: total = resume['rows']
+                        if not filter_col: start = (resume['hasta'],)
+                        elif op_mode == "ETL_FULL": include_nulls = True
+                        detail = f"reanudada desde el bloque {resume['block']} ({resume['hasta']})"
+                        logger.info(f"   [INFO] {table}: {detail}")
+                    block = resume['block'] if resume and resume['execution_id'] == execution_id else 0
+                    keep_mark = not filter_col or self.sample_keeps_watermark(table, sample)
+                    if not keep_mark: logger.info(f"   [INFO] {table}: muestra puntual o no determinista, el watermark no avanza")
 
-                if sample_percent < 100: df = df.sample(frac=sample_percent/100, random_state=42)
+                    with self.qa_replica_session() as conn:
+                        # Sin watermark previo se guarda uno vacío: así la siguiente corrida no lo deduce de las filas muestreadas en QA
+                        if not keep_mark and start is None: self.save_watermark(conn, table, filter_col, (None, None))
+                        chunk_start = datetime.now()
+                        extracted = self.extract_table(table, filter_col, pk, start, sample, include_nulls, size=lambda: tuner.rows)
+                        for df, mark in timings.iterate('extract', extracted, rows=lambda item: len(item[0])):
+                            if job: job.check(); job.table_progress(table, extracted=len(df))
+                            # Con la muestra configurada (hash) lo que quedó fuera seguirá fuera: el watermark puede avanzar
+                            if mark and keep_mark:
+                                with timings.stage('watermark'): self.save_watermark(conn, table, filter_col, mark)
+                            if df.empty: continue
+                            # Memoria del bloque tal como llegó del origen (antes de enmascarar)
+                            chunk_bytes = int(df.memory_usage(index=False, deep=True).sum()) if not tuner.pinned else 0
+                            self.masker.mask_frame(df, masking_rules, timings)
+                            if job: job.table_progress(table, masked=len(df))
+                            self.load_chunk(conn, table, pk, df, loader, timings)
+                            # Bloque confirmado: carga + watermark + punto de control en la misma transacción
+                            block += 1
+                            key_range = self._chunk_range(df, filter_col, pk)
+                            with timings.stage('commit', len(df)):
+                                self.save_checkpoint(conn, execution_id, table, attempt, block, key_range, len(df), op_mode)
+                                conn.commit()
+                            chunk_end = datetime.now()
+                            requested = tuner.rows
+                            tuner.observe(len(df), (chunk_end - chunk_start).total_seconds(), chunk_bytes)
+                            resized = f", siguiente bloque {tuner.rows} filas" if tuner.rows != requested else ""
+                            self.log_audit(table, len(df), CHECKPOINT_STATUS, f"bloque {block}: {key_range[0]} -> {key_range[1]} ({len(df)} filas{resized})", chunk_start, chunk_end, execution_id, op_mode, rules_str, 0)
+                            chunk_start = datetime.now()
+                            if job: job.table_progress(table, loaded=len(df)); job.table_update(table, batch_rows=tuner.rows)
+                            total += len(df)
+                        with timings.stage('commit'):
+                            self.save_batch_size(conn, tuner)
+                            conn.commit()
+                    self.complete_checkpoints(table)
+                    if tuner.chunks:
+                        detail = '; '.join(filter(None, [detail, tuner.describe()]))
+                        logger.info(f"   [INFO] {table}: {tuner.describe()}")
 
-                for col, rule in masking_rules.items():
-                    if col in df.columns: df[col] = df[col].apply(lambda x: self.mask_value(x, rule))
+                if total == 0:
+                    logger.info(f"   [SKIP] {table}: Sin cambios.")
+                    self._finish_timings(timings, execution_id, attempt, "SKIPPED", 0)
+                    return True
 
-                with self.engine_qa.connect() as conn:
-                    conn.execute(text("SET session_replication_role = 'replica';"))
-                    if not df.empty:
-                        ids = [str(x) for x in df[pk].tolist()]
-                        conn.execute(text(f"DELETE FROM {table} WHERE {pk} IN ({','.join(ids)})"))
-                    df.to_sql(table, conn, if_exists='append', index=False, method='multi', chunksize=self.batch_size)
-                    conn.execute(text("SET session_replication_role = 'origin';"))
-                    conn.commit()
-                
                 end_time = datetime.now()
-                self.log_audit(table, len(df), f"SUCCESS", None, start_time, end_time, execution_id, op_mode, rules_str, 0)
-                self.save_json_report(table, "SUCCESS", len(df), op_mode, None, start_time, end_time, execution_id, rules_str, 0)
-                logger.info(f"[OK] {table}")
-                return 
+                with timings.stage('audit'):
+                    self.log_audit(table, total, f"SUCCESS", detail, start_time, end_time, execution_id, op_mode, rules_str, 0)
+                    self.save_json_report(table, "SUCCESS", total, op_mode, detail, start_time, end_time, execution_id, rules_str, 0)
+                self._finish_timings(timings, execution_id, attempt, "SUCCESS", total)
+                logger.info(f"[OK] {table} ({total} registros)")
+                return True
 
+            except JobCancelled: raise
             except Exception as e:
                 end_time = datetime.now()
                 logger.error(f"[ERROR] {table}: {e}")
+                self._finish_timings(timings, execution_id, attempt, "ERROR", total)
                 if attempt == self.max_retries:
-                    self.log_audit(table, 0, "ERROR", str(e), start_time, end_time, execution_id, op_mode, rules_str, len(df) if 'df' in locals() else 0)
-                    self.save_json_report(table, "ERROR", 0, op_mode, str(e), start_time, end_time, execution_id, rules_str, len(df) if 'df' in locals() else 0)
-                else: time.sleep(self.retry_wait)
+                    self.log_audit(table, 0, "ERROR", str(e), start_time, end_time, execution_id, op_mode, rules_str, total)
+                    self.save_json_report(table, "ERROR", 0, op_mode, str(e), start_time, end_time, execution_id, rules_str, total)
+                else:
+                    RETRIES.inc(table=table)
+                    delay = self.retry_delay(attempt)
+                    logger.info(f"   [INFO] {table}: reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s (continúa desde el último bloque confirmado)")
+                    if job: job.sleep(delay)
+                    else: time.sleep(delay)
+        return False
+
+    def _finish_timings(self, timings, execution_id, attempt, status, total):
+        # Métricas del proceso + filas de etl_tiempos_etapa (se escriben por lotes con la auditoría)
+        rows = timings.to_rows(execution_id, attempt, status, total)
+        TABLE_RUNS.inc(table=timings.table, status=status)
+        seconds = rows[-1]["seg"]
+        if status == "SUCCESS" and seconds: TABLE_ROWS_PER_SECOND.set(round(total / seconds, 1), table=timings.table)
+        self.audit.emit_timings(rows)
+
+    # --- PLANIFICADOR DAG (DEPENDENCIAS POR FK) ---
+    def get_fk_dependencies(self):
+        # Hijo -> padres, leído de las FKs del esquema destino
+        try: return schema_catalog.fk_graph(self.engine_qa)
+        except Exception as e:
+            logger.warning(f"[WARN] No se pudieron leer las FKs de QA: {e}")
+            return {}
+
+    def resolve_dependencies(self, table_confs):
+        # Sin memo propio: el catálogo ya es una caché que detecta cambios de FKs en QA
+        names = {t['name'] for t in table_confs}
+        fk_deps = self.get_fk_dependencies() if any('depends_on' not in t for t in table_confs) else {}
+        deps = {}
+        for t in table_confs:
+            parents = t['depends_on'] if 'depends_on' in t else fk_deps.get(t['name'], set())
+            deps[t['name']] = {p for p in parents if p in names and p != t['name']}
+        return deps
 
-    def run_pipeline(self, target_table=None, override_percent=None):
+    def _run_table(self, table_conf, override_percent, execution_id, job=None, profile=False, subset=None):
+        table = table_conf['name']
+        # Candado por tabla compartido entre jobs (manual y cron no pueden cargar la misma tabla a la vez)
+        # Si otro job la tiene, se espera a que termine (la espera es cancelable): un choque de candado no es un fallo
+        lock = job.table_lock(table) if job else None
+        acquired = False
+        profiler = cProfile.Profile() if profile else None
+        try:
+            if lock and not lock.acquire(blocking=False):
+                logger.info(f"   [INFO] {table}: en ejecución por otro job, esperando a que termine")
+                job.table_update(table, status="waiting", message="En ejecución por otro job")
+                job.acquire(lock)
+            acquired = lock is not None
+            if profiler: profiler.enable()
+            ok = self.process_table(table_conf, override_percent, execution_id, job, subset)
+            if job: job.table_update(table, status="success" if ok else "error")
+            return ok
+        except JobCancelled as e:
+            logger.warning(f"[CANCEL] {table}: {e}")
+            now = datetime.now()
+            self.log_audit(table, 0, "CANCELLED", str(e), now, now, execution_id, "ETL_CANCELLED", None, 0)
+            if job: job.table_update(table, status="cancelled")
+            return False
+        except Exception as e:
+            logger.error(f"[ERROR] {table}: {e}")
+            if job: job.table_update(table, status="error")
+            return False
+        finally:
+            if profiler: self._dump_profile(profiler, execution_id, table)
+            if acquired: lock.release()
+
+    def _dump_profile(self, profiler, execution_id, table):
+        # Perfil cProfile por tabla (hilo propio): .prof para snakeviz/pstats y un resumen .txt por tiempo acumulado
+        profiler.disable()
+        try:
+            os.makedirs(PROFILES_DIR, exist_ok=True)
+            path = os.path.join(PROFILES_DIR, f"{execution_id}_{table}.prof")
+            profiler.dump_stats(path)
+            with open(path[:-5] + '.txt', 'w', encoding='utf-8') as f: pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+            logger.info(f"[INFO] Perfil de {table}: {path}")
+        except Exception as e: logger.warning(f"[WARN] No se pudo guardar el perfil de {table}: {e}")
+
+    def _skip_table(self, table, reason, execution_id, job=None):
+        logger.warning(f"   [SKIP] {table}: {reason}")
+        now = datetime.now()
+        self.log_audit(table, 0, "SKIPPED", reason, now, now, execution_id, "ETL_SKIPPED", None, 0)
+        if job: job.table_update(table, status="skipped", message=reason)
+
+    def run_pipeline(self, target_table=None, override_percent=None, job=None, profile=False, subset=None):
         logger.info(f"[START] Pipeline ({self.app_name})...")
+        self.validate()
         self.cleanup_old_logs()
         execution_id = str(uuid.uuid4())
-        
+
+        selected = []
         for table_conf in self.config['tables']:
             is_active = table_conf.get('active', True)
             is_forced = (target_table == table_conf['name'])
             
             if not is_active and not is_forced: continue
             if target_table and table_conf['name'] != target_table: continue 
-            
-            self.process_table(table_conf, override_percent, execution_id)
+            selected.append(table_conf)
+        if job:
+            job.execution_id = execution_id
+            for t in selected: job.table_update(t['name'], status="pending", extracted=0, masked=0, loaded=0)
+
+        deps = self.resolve_dependencies(selected)
+        pending = {t['name']: t for t in selected}
+        done, failed, running = set(), set(), {}
+
+        # Las tablas independientes corren en paralelo; cada dependiente arranca cuando terminan sus padres
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='etl') as pool:
+            while pending or running:
+                stop_reason = job.stop_reason() if job else None
+                if stop_reason or (failed and self.on_failure == 'fail_fast'):
+                    for name in list(pending):
+                        failed.add(name)
+                        self._skip_table(name, f"Cancelada ({stop_reason or 'fail_fast'})", execution_id, job)
+                    pending.clear()
+                else:
+                    blocked = [n for n in pending if deps[n] & failed]
+                    while blocked:
+                        for name in blocked:
+                            pending.pop(name)
+                            failed.add(name)
+                            self._skip_table(name, f"Dependencia fallida: {', '.join(sorted(deps[name] & failed))}", execution_id, job)
+                        blocked = [n for n in pending if deps[n] & failed]
+                    for name in [n for n in pending if deps[n] <= done]:
+                        running[pool.submit(self._run_table, pending.pop(name), override_percent, execution_id, job, profile, subset)] = name
+                    if pending and not running:
+                        # Ciclo de dependencias: se libera la primera tabla en orden de configuración
+                        name = next(iter(pending))
+                        logger.warning(f"[WARN] Ciclo de dependencias en {sorted(pending)}; se ejecuta {name}")
+                        running[pool.submit(self._run_table, pending.pop(name), override_percent, execution_id, job, profile, subset)] = name
+                if not running: break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    (done if future.result() else failed).add(name)
+
+        # El historial queda completo al terminar el job (la escritura es por lotes)
+        if not self.audit.flush(): logger.warning("[WARN] Auditoría pendiente de escribir al cerrar el pipeline")
+        logger.info(f"[END] Pipeline: {len(done)} OK, {len(failed)} con error/omitidas.")
+        result = {"execution_id": execution_id, "success": sorted(done), "failed": sorted(failed)}
+        if profile: result["profiles"] = sorted(f for f in os.listdir(PROFILES_DIR) if f.startswith(execution_id)) if os.path.isdir(PROFILES_DIR) else []
+        return result
 
 if __name__ == "__main__":
     ETLEngine().run_pipeline()
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+
+# --- BITÁCORA DE EVENTOS APPEND-ONLY (JSON LINES) ---
+# Cada evento es una línea en el segmento activo; el segmento rota por tamaño o por antigüedad.
+# Cada proceso escribe solo en segmentos propios (el pid va en el nombre), así varios escritores no se mezclan.
+# La fuente de verdad son los archivos de segmento: index.json es solo un caché del rango de timestamps de cada
+# uno. Antes de leer, rotar o podar se reconstruye la lista desde el directorio y solo se re-escanea lo que creció,
+# así un index.json sobrescrito por otro proceso nunca hace perder segmentos.
+# La retención borra segmentos completos y se aplica fuera de la ruta de escritura (prune).
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEGMENT_MAX_BYTES = 5 * 1024 * 1024
+SEGMENT_MAX_AGE = timedelta(days=1)
+INDEX_FILE = 'index.json'
+SEGMENT_PREFIX = 'events-'
+
+class EventLog:
+    def __init__(self, directory, max_bytes=SEGMENT_MAX_BYTES, max_age=SEGMENT_MAX_AGE, legacy_path=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._own = None
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        with self._lock: self._refresh()
+        if not self.segments and legacy_path and os.path.exists(legacy_path): self._import_legacy(legacy_path)
+
+    # --- Índice ---
+    def _index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path()): return []
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f: return json.load(f)
+        except ValueError: return []
+
+    def _refresh(self):
+        # Lista de segmentos desde el directorio; el caché (memoria o index.json) vale mientras el tamaño coincida
+        on_disk = {s['file']: s for s in self._load_index()}
+        cached = {**on_disk, **{s['file']: s for s in self.segments}}
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith('.jsonl')): continue
+            segment = cached.get(name) or {"file": name, "created": self._created(name), "first_ts": None, "last_ts": None, "count": 0, "bytes": 0}
+            # El segmento activo de este proceso ya está al día en memoria; los demás solo se re-escanean desde donde crecieron
+            if name != self._own:
+                try: size = os.path.getsize(self._segment_path(segment))
+                except FileNotFoundError: continue
+                if size != segment['bytes']: segment = self._scan(segment) if size > segment['bytes'] else self._scan({**segment, "first_ts": None, "last_ts": None, "count": 0, "bytes": 0})
+            segments.append(segment)
+        self.segments = sorted(segments, key=lambda s: (s['created'], s['file']))
+        # Si el caché en disco quedó viejo (otro proceso lo sobrescribió o hubo que re-escanear) se reescribe
+        if any(on_disk.get(s['file']) != s for s in self.segments if s['file'] != self._own) or len(on_disk) != len(self.segments): self._save_index()
+
+    def _save_index(self):
+        tmp = f"{self._index_path()}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f: json.dump(self.segments, f)
+        os.replace(tmp, self._index_path())
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, segment['file'])
+
+    def _created(self, name):
+        # events-YYYYmmdd-HHMMSS-ffffff[-pid].jsonl
+        try: return datetime.strptime('-'.join(name[len(SEGMENT_PREFIX):-len('.jsonl')].split('-')[:3]), '%Y%m%d-%H%M%S-%f').isoformat()
+        except ValueError: return datetime.fromtimestamp(os.path.getmtime(os.path.join(self.directory, name))).isoformat()
+
+    def _scan(self, segment):
+        # Continúa desde segment['bytes'] (siempre un fin de línea) y solo cuenta líneas completas
+        first, last, count, offset = segment['first_ts'], segment['last_ts'], segment['count'], segment['bytes']
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'): break
+                offset += len(line)
+                try: ts = json.loads(line)['timestamp']
+                except (ValueError, KeyError): continue
+                first = first or ts
+                last = ts
+                count += 1
+        return {**segment, "first_ts": first, "last_ts": last, "count": count, "bytes": offset}
+
+    def _new_segment(self):
+        now = datetime.now()
+        segment = {"file": f"{SEGMENT_PREFIX}{now.strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}.jsonl", "created": now.isoformat(), "first_ts": None, "last_ts": None, "count": 0, "bytes": 0}
+        open(self._segment_path(segment), 'ab').close()
+        self._own = segment['file']
+        # El refresco incluye el segmento nuevo y reescribe index.json
+        self._refresh()
+        return next(s for s in self.segments if s['file'] == self._own)
+
+    def _active(self):
+        segment = next((s for s in self.segments if s['file'] == self._own), None) if self._own else None
+        if segment is None or segment['bytes'] >= self.max_bytes or datetime.now() - datetime.fromisoformat(segment['created']) > self.max_age:
+            segment = self._new_segment()
+        return segment
+
+    # --- Escritura ---
+    def append(self, event):
+        line = json.dumps(event, default=str, ensure_ascii=False) + '\n'
+        data = line.encode('utf-8')
+        with self._lock:
+            segment = self._active()
+            with open(self._segment_path(segment), 'ab') as f: f.write(data)
+            segment['first_ts'] = segment['first_ts'] or event['timestamp']
+            segment['last_ts'] = event['timestamp']
+            segment['count'] += 1
+            segment['bytes'] += len(data)
+
+    def _import_legacy(self, path):
+        # notifications_log.json anterior (arreglo, más reciente primero): se copia una sola vez en orden cronológico
+        with open(path, 'r', encoding='utf-8') as f: history = json.load(f)
+        for event in sorted((h for h in history if h.get('timestamp')), key=lambda h: h['timestamp']): self.append(event)
+        with self._lock: self._save_index()
+
+    # --- Retención ---
+    def prune(self, cutoff):
+        with self._lock:
+            self._refresh()
+            cutoff = cutoff.isoformat()
+            # Un segmento sigue activo (aquí o en otro proceso) mientras no pase max_age desde su creación
+            rotated = (datetime.now() - self.max_age).isoformat()
+            keep, removed = [], 0
+            for segment in self.segments:
+                is_active = segment['file'] == self._own or segment['created'] > rotated
+                if not is_active and segment['last_ts'] and segment['last_ts'] < cutoff:
+                    os.remove(self._segment_path(segment))
+                    removed += 1
+                else: keep.append(segment)
+            self.segments = keep
+            self._save_index()
+            return removed
+
+    # --- Lectura ---
+    def read(self, start=None, end=None, newest_first=True, **filters):
+        # Solo se abren los segmentos cuyo rango [first_ts, last_ts] cruza con [start, end]
+        start = start.isoformat() if start else None
+        end = end.isoformat() if end else None
+        with self._lock:
+            self._refresh()
+            segments = [dict(s) for s in self.segments if s['count'] and (not start or s['last_ts'] >= start) and (not end or s['first_ts'] <= end)]
+        if newest_first: segments.reverse()
+        for segment in segments:
+            with open(self._segment_path(segment), 'rb') as f:
+                # Se lee hasta el tamaño conocido: una escritura concurrente no deja líneas a medias
+                lines = f.read(segment['bytes']).decode('utf-8').splitlines()
+            if newest_first: lines.reverse()
+            for line in lines:
+                try: event = json.loads(line)
+                except ValueError: continue
+                ts = event.get('timestamp', '')
+                if (start and ts < start) or (end and ts > end): continue
+                if any(v is not None and event.get(k) != v for k, v in filters.items()): continue
+                yield event
+
+event_log = EventLog(os.path.join(BASE_DIR, 'notifications'), legacy_path=os.path.join(BASE_DIR, 'notifications_log.json'))
@@ -0,0 +1,160 @@
+import os
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from config_store import config_store
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# --- MONITOR DE SALUD DE CONEXIONES ---
+# Un hilo sondea todas las conexiones registradas en paralelo, con timeout estricto de conexión y de sentencia.
+# /api/connections y el dashboard leen el último resultado (con su antigüedad) sin tocar la red; el hilo arranca
+# junto con la app y, hasta su primer sondeo, las conexiones se reportan como "unknown".
+# Los sondeos usan engines propios sin pool: una base caída no ocupa conexiones del pool del ETL.
+DEFAULT_REGISTRY = {"prod": {"name": "Producción", "env_var": "SUPABASE_PROD_URI"}, "qa": {"name": "QA", "env_var": "SUPABASE_QA_URI"}}
+PROBE_INTERVAL = 30
+PROBE_TIMEOUT = 3
+HISTORY_SIZE = 20
+
+def connection_registry(config=None):
+    config = config or config_store.get()
+    return config['databases'].get('registry', DEFAULT_REGISTRY)
+
+def _host(uri):
+    return uri.split('@')[1].split(':')[0].split('/')[0] if '@' in uri else "unknown"
+
+class HealthMonitor:
+    def __init__(self):
+        self.results = {}
+        self._engines = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._probing = threading.Lock()
+        self._thread = None
+        self._last_probe = None
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='health')
+
+    def settings(self):
+        health = config_store.get().get('settings', {}).get('health', {})
+        return float(health.get('interval_seconds', PROBE_INTERVAL)), float(health.get('timeout_seconds', PROBE_TIMEOUT))
+
+    # --- Sondeo ---
+    def _probe_engine(self, uri, timeout):
+        key = (uri, timeout)
+        with self._lock:
+            if key not in self._engines:
+                self._engines[key] = create_engine(uri, poolclass=NullPool, connect_args={"connect_timeout": max(1, int(timeout)), "options": f"-c statement_timeout={int(timeout * 1000)}"})
+            return self._engines[key]
+
+    def _probe(self, db_id, db_info, timeout):
+        uri = os.getenv(db_info['env_var'])
+        result = {"id": db_id, "name": db_info['name'], "env_var": db_info['env_var'], "host": "unknown", "status": "disconnected", "latency": 0, "version": "Unknown", "error": None}
+        if not uri: return result
+        result["host"] = _host(uri)
+        start = time.perf_counter()
+        try:
+            with self._probe_engine(uri, timeout).connect() as conn:
+                result["version"] = f"PG {conn.execute(text('SHOW server_version')).scalar()}"
+            result.update(status="connected", latency=round((time.perf_counter() - start) * 1000))
+        except Exception as e: result.update(status="error", error=str(e).splitlines()[0][:200])
+        return result
+
+    def probe_all(self, requested=None):
+        # Un solo sondeo a la vez: un refresh manual durante el ciclo espera a que termine y reutiliza su resultado
+        with self._probing:
+            if requested and self._last_probe and self._last_probe >= requested: return
+            _, timeout = self.settings()
+            targets = connection_registry()
+            futures = {self._executor.submit(self._probe, db_id, info, timeout): db_id for db_id, info in targets.items()}
+            finished, pending = wait(futures, timeout=timeout + 2)
+            now = datetime.now()
+            with self._lock:
+                for db_id in [k for k in self.results if k not in targets]: self.results.pop(db_id)
+                for future, db_id in futures.items():
+                    result = future.result() if future in finished else {"id": db_id, "name": targets[db_id]['name'], "env_var": targets[db_id]['env_var'], "host": _host(os.getenv(targets[db_id]['env_var']) or ''), "status": "error", "latency": 0, "version": "Unknown", "error": "Timeout del sondeo"}
+                    previous = self.results.get(db_id, {})
+                    history = previous.get("history") or deque(maxlen=HISTORY_SIZE)
+                    history.append(result["latency"] if result["status"] == "connected" else None)
+                    failures = 0 if result["status"] == "connected" else previous.get("failures", 0) + 1
+                    # La versión se conserva si la base cae después de haberse leído
+                    if result["version"] == "Unknown": result["version"] = previous.get("version", "Unknown")
+                    self.results[db_id] = {**result, "checked_at": now, "history": history, "failures": failures}
+                    if failures == 1 and result["status"] == "error": logger.warning(f"[WARN] Conexión {db_id} no responde: {result['error']}")
+                    elif not failures and previous.get("failures"): logger.info(f"[OK] Conexión {db_id} recuperada ({result['latency']} ms)")
+                self._last_probe = datetime.now()
+
+    # --- Hilo de fondo ---
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive(): return
+            self._thread = threading.Thread(target=self._loop, name='health-monitor', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            try: self.probe_all()
+            except Exception as e: logger.error(f"[ERROR] Monitor de conexiones: {e}")
+            interval, _ = self.settings()
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    # --- Lectura ---
+    def snapshot(self, refresh=False):
+        # Nunca sondea por su cuenta: hasta el primer resultado del hilo, cada conexión sale como "unknown"
+        requested = datetime.now()
+        self.start()
+        if refresh: self.probe_all(requested)
+        interval, _ = self.settings()
+        now = datetime.now()
+        out = []
+        with self._lock:
+            for db_id, info in connection_registry().items():
+                r = self.results.get(db_id)
+                if r is None:
+                    out.append({
+                        "id": db_id, "name": info['name'], "env_var": info['env_var'], "host": _host(os.getenv(info['env_var']) or ''), "status": "unknown", "latency": 0,
+                        "version": "Unknown", "error": None, "lastChecked": None, "ageSeconds": None, "stale": False, "consecutiveFailures": 0,
+                        "latencyHistory": [], "latencyAvg": None, "availability": None,
+                    })
+                    continue
+                samples = [l for l in r["history"] if l is not None]
+                age = (now - r["checked_at"]).total_seconds()
+                out.append({
+                    "id": db_id, "name": r["name"], "env_var": r["env_var"], "host": r["host"], "status": r["status"], "latency": r["latency"],
+                    "version": r["version"], "error": r["error"], "lastChecked": r["checked_at"].isoformat(), "ageSeconds": round(age, 1),
+                    "stale": age > 2 * interval, "consecutiveFailures": r["failures"], "latencyHistory": list(r["history"]),
+                    "latencyAvg": round(sum(samples) / len(samples)) if samples else None,
+                    "availability": round(100 * len(samples) / len(r["history"])) if r["history"] else None,
+                })
+        return out
+
+    def status_for_env(self, env_var):
+        for r in self.snapshot():
+            if r["env_var"] == env_var: return r["status"]
+        return "unknown"
+
+    def wake(self):
+        # Cambió el registro de conexiones: el siguiente ciclo corre de inmediato
+        self._wake.set()
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values(): engine.dispose()
+            self._engines.clear()
+
+health_monitor = HealthMonitor()
+
+@registry.collector
+def _collect_health():
+    up = registry.gauge("db_up", "1 si el último sondeo de la conexión fue exitoso", ("db",))
+    latency = registry.gauge("db_probe_latency_ms", "Latencia del último sondeo exitoso", ("db",))
+    with health_monitor._lock: results = list(health_monitor.results.items())
+    for db_id, r in results:
+        up.set(int(r["status"] == "connected"), db=db_id)
+        latency.set(r["latency"], db=db_id)
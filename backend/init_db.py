@@ -1,19 +1,27 @@
 import os
-import yaml
-import random
+import io
+import re
+import sys
+import pickle
+import signal
+import argparse
+import subprocess
+import unicodedata
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
 from faker import Faker
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_registry import get_engine
+from config_store import config_store
+from audit_schema import ensure_audit_schema, RUN_STATE_TABLES
+from seed_worker import faker_clients
 
-# 1. Cargar configuración con UTF-8
+# 1. Cargar entorno (la configuración se lee del config_store en cada siembra)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 
-with open(os.path.join(BASE_DIR, 'config.yaml'), 'r', encoding='utf-8') as f:
-    config = yaml.safe_load(f)
-
-fake = Faker('es_MX')
-
 def check_db_identity(engine, expected_tag, db_name_for_log):
     try:
         with engine.connect() as conn:
@@ -30,15 +38,165 @@ def check_db_identity(engine, expected_tag, db_name_for_log):
     except Exception as e:
         raise e
 
-def generate_source_data(counts=None):
+# --- SEMBRADO MASIVO ---
+# Cada tabla se genera en bloques columnares (numpy) y se carga con COPY. Lo que requiere Faker (nombres y
+# direcciones) se reparte en un pool de procesos (seed_worker); cada bloque tiene su propia semilla derivada de
+# la semilla global, así el resultado es el mismo sin importar cuántos workers se usen.
+CHUNK_ROWS = 50000
+DEFAULT_SEED = 42
+# Fechas generadas en los 2 años previos a este corte fijo (no a "ahora"): misma semilla = mismos datos
+SEED_END_DATE = datetime(2025, 12, 31, 23, 59, 59)
+EMAIL_DOMAINS = np.array(['gmail.com', 'hotmail.com', 'outlook.com', 'yahoo.com.mx', 'prodigy.net.mx'], dtype=object)
+
+PROD_SCHEMA = """
+    CREATE TABLE clientes (id SERIAL PRIMARY KEY, nombre VARCHAR(100), email VARCHAR(100), telefono VARCHAR(50), direccion VARCHAR(200), fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    CREATE TABLE inventario (id SERIAL PRIMARY KEY, producto VARCHAR(100) UNIQUE, stock INTEGER, ubicacion VARCHAR(50), fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    CREATE TABLE ordenes (id SERIAL PRIMARY KEY, cliente_id INTEGER REFERENCES clientes(id), total DECIMAL(10, 2), fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    CREATE TABLE detalle_ordenes (id SERIAL PRIMARY KEY, orden_id INTEGER REFERENCES ordenes(id), producto VARCHAR(100) REFERENCES inventario(producto), cantidad INTEGER, precio_unitario DECIMAL(10, 2));
+"""
+
+def _rng(seed, *stream):
+    return np.random.default_rng([seed, *stream])
+
+def _slug(name):
+    return '.'.join(re.findall(r'[a-z0-9]+', unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()))
+
+def _faker_results(chunks, workers):
+    # Con un solo worker se genera aquí mismo; con más, en un proceso seed_worker aparte (ver seed_worker.py)
+    if workers <= 1:
+        yield from map(faker_clients, chunks)
+        return
+    # Sesión propia: si hay que cortarlo, se corta el grupo completo (el pool de seed_worker no queda huérfano)
+    proc = subprocess.Popen([sys.executable, '-m', 'seed_worker'], cwd=BASE_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, start_new_session=True)
+    received = 0
+    try:
+        pickle.dump((chunks, workers), proc.stdin)
+        proc.stdin.close()
+        while received < len(chunks):
+            try: result = pickle.load(proc.stdout)
+            except EOFError: raise RuntimeError(f"seed_worker terminó antes de tiempo (código {proc.wait()})")
+            received += 1
+            yield result
+    finally:
+        # Si el sembrado se interrumpe se corta el proceso; si terminó, se espera a que cierre su pool
+        if received < len(chunks) and proc.poll() is None:
+            if hasattr(os, 'killpg'): os.killpg(proc.pid, signal.SIGKILL)
+            else: proc.kill()
+        proc.stdout.close()
+        proc.wait()
+
+def _copy_frame(conn, table, df):
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, na_rep='\\N')
+    buf.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try: cursor.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+    finally: cursor.close()
+    return len(df)
+
+def _random_dates(rng, size, start, end):
+    span = (end - start).total_seconds()
+    return pd.Timestamp(start) + pd.to_timedelta(rng.uniform(0, span, size), unit='s').floor('s')
+
+def _products(rng, words, n):
+    # Nombres "Palabra palabra-NNN": con más productos que combinaciones el ciclo nunca terminaría
+    space = len(set(words)) ** 2 * 900
+    if n > space: raise ValueError(f"No se pueden generar {n} productos únicos: el diccionario solo admite {space} combinaciones")
+    # Unicidad con un set: solo se regeneran los nombres repetidos
+    seen, names = set(), []
+    while len(names) < n:
+        k = n - len(names)
+        batch = pd.Series(rng.choice(words, k)).str.capitalize() + " " + rng.choice(words, k) + "-" + rng.integers(100, 1000, k).astype(str)
+        for p in batch:
+            if p not in seen:
+                seen.add(p)
+                names.append(p)
+    return np.array(names[:n], dtype=object)
+
+def seed_bulk(conn, counts, seed=DEFAULT_SEED, workers=None, progress=None):
+    n_prod, n_cli = max(1, int(counts.get('productos', 30))), max(1, int(counts.get('clientes', 50)))
+    n_ord, n_det = int(counts.get('ordenes', 100)), int(counts.get('detalles', 300))
+    now = SEED_END_DATE
+    report = lambda table, rows: progress(table, rows) if progress else None
+
+    # Inventario: nombres únicos + precio base por producto (los detalles lo usan)
+    rng = _rng(seed, 0)
+    productos = _products(rng, Faker('es_MX').get_words_list(), n_prod)
+    precios = rng.lognormal(np.log(120), 0.8, n_prod).clip(10, 5000).round(2)
+    for a in range(0, n_prod, CHUNK_ROWS):
+        b = min(a + CHUNK_ROWS, n_prod)
+        report('inventario', _copy_frame(conn, 'inventario', pd.DataFrame({
+            "id": np.arange(a + 1, b + 1), "producto": productos[a:b], "stock": rng.integers(0, 501, b - a),
+            "ubicacion": "Pasillo " + pd.Series(rng.integers(1, 11, b - a)).astype(str),
+            "fecha_registro": _random_dates(rng, b - a, now - timedelta(days=730), now)})))
+
+    # Clientes: Faker en el pool de procesos, el resto vectorizado
+    registro = np.empty(n_cli, dtype='datetime64[s]')
+    chunks = [(seed, a, min(CHUNK_ROWS, n_cli - a)) for a in range(0, n_cli, CHUNK_ROWS)]
+    workers = min(workers if workers is not None else (os.cpu_count() or 1), len(chunks))
+    results = _faker_results(chunks, workers)
+    try:
+        for (_, a, size), (names, addresses) in zip(chunks, results):
+            crng = _rng(seed, 1, a)
+            ids = np.arange(a + 1, a + size + 1)
+            fechas = _random_dates(crng, size, now - timedelta(days=730), now)
+            registro[a:a + size] = fechas.to_numpy(dtype='datetime64[s]')
+            emails = pd.Series([f"{_slug(n)}.{i}" for n, i in zip(names, ids)]) + "@" + crng.choice(EMAIL_DOMAINS, size)
+            report('clientes', _copy_frame(conn, 'clientes', pd.DataFrame({
+                "id": ids, "nombre": names, "email": emails,
+                "telefono": "+52 55" + pd.Series(crng.integers(10000000, 100000000, size)).astype(str),
+                "direccion": addresses, "fecha_registro": fechas})))
+    finally: results.close()
+
+    # Órdenes y detalles: pocos clientes concentran muchas órdenes (pesos log-normales) y cada orden
+    # tiene al menos un renglón; el total de la orden es la suma de sus renglones.
+    rng = _rng(seed, 2)
+    peso_cliente = rng.lognormal(0, 1.2, n_cli)
+    cliente_ids = rng.choice(n_cli, n_ord, p=peso_cliente / peso_cliente.sum()) + 1
+    lineas = np.zeros(n_ord, dtype=np.int64)
+    if n_ord and n_det:
+        con_lineas = rng.permutation(n_ord)[:min(n_ord, n_det)]
+        lineas[con_lineas] = 1
+        extra = n_det - len(con_lineas)
+        if extra:
+            peso_orden = np.where(lineas > 0, rng.lognormal(0, 0.7, n_ord), 0)
+            lineas += rng.multinomial(extra, peso_orden / peso_orden.sum())
+    peso_producto = rng.lognormal(0, 1.0, n_prod)
+    peso_producto /= peso_producto.sum()
+    det_id = 0
+    for a in range(0, n_ord, CHUNK_ROWS):
+        b = min(a + CHUNK_ROWS, n_ord)
+        orng = _rng(seed, 3, a)
+        ids = np.arange(a + 1, b + 1)
+        alta = registro[cliente_ids[a:b] - 1].astype('datetime64[s]').astype(np.int64)
+        fechas = pd.to_datetime(alta + (orng.uniform(0, 1, b - a) * (np.int64(now.timestamp()) - alta)).astype(np.int64), unit='s')
+        orden_id = np.repeat(ids, lineas[a:b])
+        prod_idx = orng.choice(n_prod, len(orden_id), p=peso_producto)
+        cantidad = np.minimum(orng.geometric(0.35, len(orden_id)), 10)
+        precio = (precios[prod_idx] * orng.uniform(0.9, 1.1, len(orden_id))).round(2)
+        total = np.bincount(orden_id - a - 1, weights=cantidad * precio, minlength=b - a).round(2)
+        report('ordenes', _copy_frame(conn, 'ordenes', pd.DataFrame({"id": ids, "cliente_id": cliente_ids[a:b], "total": total, "fecha": fechas})))
+        if len(orden_id):
+            report('detalle_ordenes', _copy_frame(conn, 'detalle_ordenes', pd.DataFrame({
+                "id": np.arange(det_id + 1, det_id + len(orden_id) + 1), "orden_id": orden_id, "producto": productos[prod_idx],
+                "cantidad": cantidad, "precio_unitario": precio})))
+            det_id += len(orden_id)
+
+    for table in ['inventario', 'clientes', 'ordenes', 'detalle_ordenes']:
+        conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"))
+    return {"inventario": n_prod, "clientes": n_cli, "ordenes": n_ord, "detalle_ordenes": det_id}
+
+def generate_source_data(counts=None, seed=None, workers=None, progress=None):
     if not counts:
         counts = { "productos": 30, "clientes": 50, "ordenes": 100, "detalles": 300 }
+    seed = int(seed if seed is not None else counts.get('seed', DEFAULT_SEED))
 
+    config = config_store.get()
     prod_uri = os.getenv(config['databases']['source_db_env_var'])
     qa_uri = os.getenv(config['databases']['target_db_env_var'])
     
-    engine_prod = create_engine(prod_uri)
-    engine_qa = create_engine(qa_uri)
+    engine_prod = get_engine(prod_uri)
+    engine_qa = get_engine(qa_uri)
     
     print("🛡️ Verificando entornos...")
     check_db_identity(engine_prod, 'production', 'PROD')
@@ -49,36 +207,15 @@ def generate_source_data(counts=None):
         conn.execute(text("DROP TABLE IF EXISTS detalle_ordenes, ordenes, inventario, clientes, _db_meta CASCADE"))
         conn.execute(text("CREATE TABLE _db_meta (key VARCHAR PRIMARY KEY, value VARCHAR)"))
         conn.execute(text("INSERT INTO _db_meta VALUES ('env', 'production')"))
-        
-        conn.execute(text("""
-            CREATE TABLE clientes (id SERIAL PRIMARY KEY, nombre VARCHAR(100), email VARCHAR(100), telefono VARCHAR(50), direccion VARCHAR(200), fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
-            CREATE TABLE inventario (id SERIAL PRIMARY KEY, producto VARCHAR(100) UNIQUE, stock INTEGER, ubicacion VARCHAR(50), fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
-            CREATE TABLE ordenes (id SERIAL PRIMARY KEY, cliente_id INTEGER REFERENCES clientes(id), total DECIMAL(10, 2), fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
-            CREATE TABLE detalle_ordenes (id SERIAL PRIMARY KEY, orden_id INTEGER REFERENCES ordenes(id), producto VARCHAR(100) REFERENCES inventario(producto), cantidad INTEGER, precio_unitario DECIMAL(10, 2));
-        """))
-        
-        # Generación de datos
-        print(f"🌱 Sembrando datos...")
-        limit_prod = int(counts.get('productos', 30))
-        lista_productos = []
-        for _ in range(limit_prod): 
-            prod = f"{fake.word().capitalize()} {fake.word()}-{random.randint(100,999)}"
-            while prod in lista_productos: prod = f"{fake.word().capitalize()} {fake.word()}-{random.randint(100,999)}"
-            lista_productos.append(prod)
-            conn.execute(text("INSERT INTO inventario (producto, stock, ubicacion) VALUES (:p, :s, :u)"), {"p": prod, "s": random.randint(0, 500), "u": f"Pasillo {random.randint(1,10)}"})
-
-        limit_cli = int(counts.get('clientes', 50))
-        for _ in range(limit_cli): 
-            conn.execute(text("INSERT INTO clientes (nombre, email, telefono, direccion) VALUES (:n, :e, :t, :d)"), {"n": fake.name(), "e": fake.email(), "t": f"+52 55{random.randint(10000000,99999999)}", "d": fake.address()})
-        
-        limit_ord = int(counts.get('ordenes', 100))
-        for _ in range(limit_ord): 
-            conn.execute(text("INSERT INTO ordenes (cliente_id, total) VALUES (:c, :t)"), {"c": random.randint(1, limit_cli), "t": random.uniform(100, 5000)})
-        
-        limit_det = int(counts.get('detalles', 300))
-        for _ in range(limit_det):
-            conn.execute(text("INSERT INTO detalle_ordenes (orden_id, producto, cantidad, precio_unitario) VALUES (:o, :p, :c, :pu)"), {"o": random.randint(1, limit_ord), "p": random.choice(lista_productos), "c": random.randint(1, 10), "pu": random.uniform(10, 500)})
+        conn.execute(text(PROD_SCHEMA))
+
+        # Generación de datos (las FKs se generan válidas: se omite su verificación fila por fila)
+        print(f"🌱 Sembrando datos (semilla {seed})...")
+        conn.execute(text("SET session_replication_role = 'replica';"))
+        totals = seed_bulk(conn, counts, seed, workers, progress)
+        conn.execute(text("SET session_replication_role = 'origin';"))
         conn.commit()
+    print("   " + ", ".join(f"{t}={n}" for t, n in totals.items()))
 
     # --- 2. QA ---
     print(f"🧹 Preparando QA...")
@@ -92,29 +229,24 @@ def generate_source_data(counts=None):
             CREATE TABLE inventario (id INTEGER PRIMARY KEY, producto VARCHAR(100) UNIQUE, stock INTEGER, ubicacion VARCHAR(50), fecha_registro TIMESTAMP);
             CREATE TABLE ordenes (id INTEGER PRIMARY KEY, cliente_id INTEGER REFERENCES clientes(id), total DECIMAL(10, 2), fecha TIMESTAMP);
             CREATE TABLE detalle_ordenes (id INTEGER PRIMARY KEY, orden_id INTEGER REFERENCES ordenes(id), producto VARCHAR(100) REFERENCES inventario(producto), cantidad INTEGER, precio_unitario DECIMAL(10, 2));
-
-            CREATE TABLE IF NOT EXISTS auditoria (
-                id SERIAL PRIMARY KEY, 
-                id_ejecucion VARCHAR(50),      -- Requisito Asesor
-                fecha_ejecucion TIMESTAMP, 
-                tabla VARCHAR(50), 
-                registros_procesados INTEGER, 
-                registros_fallidos INTEGER DEFAULT 0, -- Requisito Asesor
-                estado VARCHAR(100), 
-                mensaje TEXT, 
-                operacion VARCHAR(50),         -- Requisito Asesor
-                reglas_aplicadas TEXT,         -- Requisito Asesor
-                fecha_inicio TIMESTAMP,        -- Requisito Asesor
-                fecha_fin TIMESTAMP            -- Requisito Asesor
-            );
         """))
-        # Aseguramos columnas si la tabla ya existía
-        conn.execute(text("ALTER TABLE auditoria ADD COLUMN IF NOT EXISTS registros_fallidos INTEGER DEFAULT 0"))
-        conn.execute(text("ALTER TABLE auditoria ADD COLUMN IF NOT EXISTS id_ejecucion VARCHAR(50)"))
-        conn.execute(text("ALTER TABLE auditoria ADD COLUMN IF NOT EXISTS reglas_aplicadas TEXT"))
+        # Auditoría y tablas etl_* con la misma definición que usa el motor ETL
+        ensure_audit_schema(conn)
+        # Tablas recién creadas: watermarks, hashes y puntos de control anteriores ya no aplican
+        # (los tamaños de bloque ajustados se conservan: el ancho de las filas no cambia al volver a sembrar)
+        for table in RUN_STATE_TABLES: conn.execute(text(f"TRUNCATE {table}"))
         conn.commit()
     
     print("✅ ¡Entornos listos!")
+    return totals
 
 if __name__ == "__main__":
-    generate_source_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Reinicia Producción/QA y siembra datos de prueba con COPY")
+    parser.add_argument("--productos", type=int, default=30)
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--ordenes", type=int, default=100)
+    parser.add_argument("--detalles", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Misma semilla = mismos datos")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para Faker (por defecto, número de CPUs)")
+    args = parser.parse_args()
+    generate_source_data({"productos": args.productos, "clientes": args.clientes, "ordenes": args.ordenes, "detalles": args.detalles}, args.seed, args.workers)
\ No newline at end of file
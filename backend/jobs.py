@@ -0,0 +1,167 @@
+import uuid
+import time
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from etl_core import JobCancelled
+from metrics import JOB_QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+# --- JOBS EN SEGUNDO PLANO ---
+# Cada job corre en un executor acotado; el progreso se publica por revisión para polling y SSE.
+class Job:
+    def __init__(self, manager, kind, params, timeout_minutes=None):
+        self.id = str(uuid.uuid4())
+        self.manager = manager
+        self.kind = kind
+        self.params = params
+        self.timeout_minutes = timeout_minutes
+        self.status = "queued"
+        self.execution_id = None
+        self.tables = {}
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.deadline = None
+        self.revision = 0
+        self._cancel_reason = None
+        self._cond = threading.Condition()
+
+    # --- API usada por ETLEngine ---
+    def table_lock(self, table):
+        return self.manager.table_lock(table)
+
+    def stop_reason(self):
+        if self._cancel_reason: return self._cancel_reason
+        if self.deadline and datetime.now() > self.deadline:
+            self._cancel_reason = f"timeout de {self.timeout_minutes} min"
+        return self._cancel_reason
+
+    def check(self):
+        reason = self.stop_reason()
+        if reason: raise JobCancelled(reason)
+
+    def sleep(self, seconds):
+        # Espera interrumpible (backoff entre reintentos): una cancelación despierta al hilo de inmediato
+        end = time.monotonic() + seconds
+        with self._cond:
+            while not self.stop_reason() and end - time.monotonic() > 0: self._cond.wait(end - time.monotonic())
+        self.check()
+
+    def acquire(self, lock, poll=1.0):
+        # Espera al candado de una tabla que tiene otro job; se revisa la cancelación cada poll segundos
+        while not lock.acquire(timeout=poll): self.check()
+
+    def table_update(self, table, **fields):
+        with self._cond:
+            self.tables.setdefault(table, {}).update(fields)
+            self._touch()
+
+    def table_progress(self, table, **deltas):
+        with self._cond:
+            entry = self.tables.setdefault(table, {})
+            for k, v in deltas.items(): entry[k] = entry.get(k, 0) + v
+            self._touch()
+
+    # --- Ciclo de vida ---
+    def _touch(self):
+        self.revision += 1
+        self._cond.notify_all()
+
+    def set_status(self, status, **fields):
+        with self._cond:
+            self.status = status
+            for k, v in fields.items(): setattr(self, k, v)
+            self._touch()
+
+    def cancel(self, reason="cancelado por el usuario"):
+        with self._cond:
+            if self.finished: return False
+            self._cancel_reason = reason
+            self._touch()
+            return True
+
+    @property
+    def finished(self):
+        return self.status in ("success", "error", "cancelled")
+
+    def wait_for_change(self, revision, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self.revision != revision or self.finished, timeout)
+            return self.revision, self.to_dict()
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                "id": self.id, "kind": self.kind, "status": self.status, "params": self.params,
+                "execution_id": self.execution_id, "tables": {k: dict(v) for k, v in self.tables.items()},
+                "result": self.result, "error": self.error, "cancel_reason": self._cancel_reason,
+                "created_at": self.created_at.isoformat(),
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "revision": self.revision,
+            }
+
+class JobManager:
+    def __init__(self, max_workers=2, history_size=100):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.history_size = history_size
+        self.jobs = OrderedDict()
+        self._table_locks = {}
+        self._lock = threading.Lock()
+
+    def table_lock(self, table):
+        with self._lock: return self._table_locks.setdefault(table, threading.Lock())
+
+    def submit(self, kind, fn, timeout_minutes=None, **params):
+        job = Job(self, kind, params, timeout_minutes)
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history_size:
+                oldest = next(iter(self.jobs))
+                if not self.jobs[oldest].finished: break
+                self.jobs.pop(oldest)
+        self.executor.submit(self._run, job, fn)
+        logger.info(f"[JOB] {kind} {job.id} encolado")
+        return job
+
+    def _run(self, job, fn):
+        started = datetime.now()
+        JOB_QUEUE_WAIT.observe((started - job.created_at).total_seconds(), kind=job.kind)
+        deadline = started + timedelta(minutes=float(job.timeout_minutes)) if job.timeout_minutes else None
+        job.set_status("running", started_at=started, deadline=deadline)
+        try:
+            job.check()
+            result = fn(job)
+            reason = job.stop_reason()
+            if reason: status = "cancelled"
+            elif isinstance(result, dict) and result.get("failed"): status = "error"
+            else: status = "success"
+            job.set_status(status, result=result, finished_at=datetime.now())
+        except JobCancelled as e:
+            job.set_status("cancelled", error=str(e), finished_at=datetime.now())
+        except Exception as e:
+            logger.error(f"[JOB] {job.id} falló: {e}")
+            job.set_status("error", error=str(e), finished_at=datetime.now())
+        logger.info(f"[JOB] {job.kind} {job.id} -> {job.status} ({(datetime.now() - started).total_seconds():.1f}s)")
+
+    def get(self, job_id):
+        with self._lock: return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock: jobs = list(self.jobs.values())
+        return [j.to_dict() for j in reversed(jobs)]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        return job.cancel() if job else False
+
+    def shutdown(self):
+        with self._lock: jobs = list(self.jobs.values())
+        for job in jobs: job.cancel("apagado del servidor")
+        self.executor.shutdown(wait=True)
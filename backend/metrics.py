@@ -0,0 +1,146 @@
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- MÉTRICAS DEL PROCESO (FORMATO PROMETHEUS) ---
+# Registro en memoria sin dependencias: contadores, gauges e histogramas con etiquetas.
+# /metrics los expone en formato de texto; los gauges "vivos" (pools, cola de auditoría) se leen en cada scrape.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+def _labels(keys, values):
+    if not keys: return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(keys, escaped)) + "}"
+
+class Metric:
+    def __init__(self, registry, name, help, kind, labels=(), buckets=None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        self.values = {}
+        self._lock = registry.lock
+
+    def inc(self, value=1, **labels):
+        key = tuple(labels.get(k, "") for k in self.labels)
+        with self._lock: self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(k, "") for k in self.labels)
+        with self._lock: self.values[key] = value
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(k, "") for k in self.labels)
+        with self._lock:
+            entry = self.values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: entry["buckets"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock: items = [(k, dict(v) if isinstance(v, dict) else v) for k, v in self.values.items()]
+        for key, value in sorted(items):
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+                continue
+            for bound, count in zip(self.buckets, value["buckets"]):
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {value['count']}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {round(value['sum'], 6)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {value['count']}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.collectors = []
+
+    def _get(self, name, help, kind, labels, buckets=None):
+        if name not in self.metrics: self.metrics[name] = Metric(self, name, help, kind, labels, buckets)
+        return self.metrics[name]
+
+    def counter(self, name, help, labels=()):
+        return self._get(name, help, "counter", labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._get(name, help, "gauge", labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get(name, help, "histogram", labels, buckets)
+
+    def collector(self, fn):
+        # fn() se llama en cada scrape para refrescar gauges que dependen de estado externo
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        for fn in self.collectors:
+            try: fn()
+            except Exception: pass
+        lines = []
+        for metric in list(self.metrics.values()): lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# --- MÉTRICAS DEL PIPELINE ---
+STAGE_SECONDS = registry.histogram("etl_stage_seconds", "Duración de cada etapa por bloque", ("table", "stage"))
+STAGE_ROWS = registry.counter("etl_stage_rows_total", "Filas procesadas por etapa", ("table", "stage"))
+MASK_SECONDS = registry.counter("etl_mask_seconds_total", "Tiempo de enmascaramiento por tabla y regla", ("table", "rule"))
+MASK_ROWS = registry.counter("etl_mask_rows_total", "Filas enmascaradas por tabla y regla", ("table", "rule"))
+TABLE_RUNS = registry.counter("etl_table_runs_total", "Ejecuciones de tabla por estado", ("table", "status"))
+TABLE_ROWS_PER_SECOND = registry.gauge("etl_table_rows_per_second", "Filas/s de la última ejecución exitosa", ("table",))
+BATCH_ROWS = registry.gauge("etl_batch_rows", "Tamaño de bloque elegido por tabla", ("table",))
+RETRIES = registry.counter("etl_retries_total", "Reintentos por tabla", ("table",))
+POOL_WAIT = registry.histogram("db_pool_checkout_wait_seconds", "Espera para obtener una conexión del pool", ("db",))
+SCHEDULER_LAG = registry.histogram("scheduler_lag_seconds", "Retraso entre la hora programada y el disparo del cron", ())
+JOB_QUEUE_WAIT = registry.histogram("job_queue_wait_seconds", "Tiempo en cola antes de que un job arranque", ("kind",))
+
+class StageTimings:
+    # Acumulador por ejecución de tabla: alimenta las métricas del proceso y la tabla etl_tiempos_etapa
+    def __init__(self, table):
+        self.table = table
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds, rows=0, rule=None):
+        key = (stage, rule)
+        entry = self.stages.setdefault(key, [0.0, 0, 0])
+        entry[0] += seconds
+        entry[1] += rows
+        entry[2] += 1
+        if rule:
+            MASK_SECONDS.inc(seconds, table=self.table, rule=rule)
+            MASK_ROWS.inc(rows, table=self.table, rule=rule)
+        else:
+            STAGE_SECONDS.observe(seconds, table=self.table, stage=stage)
+            STAGE_ROWS.inc(rows, table=self.table, stage=stage)
+
+    @contextmanager
+    def stage(self, stage, rows=0, rule=None):
+        start = time.perf_counter()
+        try: yield
+        finally: self.add(stage, time.perf_counter() - start, rows, rule)
+
+    def iterate(self, stage, iterable, rows=len):
+        # Mide el tiempo que tarda cada elemento en producirse (p. ej. cada bloque de pd.read_sql)
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try: item = next(iterator)
+            except StopIteration: return
+            self.add(stage, time.perf_counter() - start, rows(item))
+            yield item
+
+    def to_rows(self, execution_id, attempt, status, total_rows):
+        total, now = time.perf_counter() - self.started, datetime.now()
+        out = [{"eid": execution_id, "t": self.table, "etapa": stage, "regla": rule, "intento": attempt, "estado": status,
+                "seg": round(seconds, 6), "filas": rows, "llamadas": calls, "f": now} for (stage, rule), (seconds, rows, calls) in self.stages.items()]
+        out.append({"eid": execution_id, "t": self.table, "etapa": "total", "regla": None, "intento": attempt, "estado": status,
+                    "seg": round(total, 6), "filas": total_rows, "llamadas": 1, "f": now})
+        return out
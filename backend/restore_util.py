@@ -1,49 +1,165 @@
 import os
+import sys
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
+from sqlalchemy import text
+from backup_stream import BackupReader, VerifyingStream
+from config_store import config_store
+from db_registry import get_engine
+import audit_schema
 
 # 1. Cargar entorno y clave
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 
-key = os.getenv("BACKUP_ENCRYPTION_KEY")
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+# Un .sql.enc heredado es un solo token Fernet (no se puede descifrar por partes): se limita su tamaño
+LEGACY_MAX_MB = 256
 
-if not key:
-    print(" ERROR: No se encontró BACKUP_ENCRYPTION_KEY en el archivo .env")
-    exit()
+# --- RESTAURACIÓN DIRECTA A BASE DE DATOS ---
+# El respaldo se descifra frame a frame y se aplica con COPY FROM STDIN: nunca se escribe SQL en claro a disco.
+def resolve_backup_path(name):
+    # Solo archivos dentro de backups/: cualquier ruta (absoluta o con ..) se reduce a su nombre
+    path = os.path.join(BACKUP_DIR, os.path.basename(name))
+    if not os.path.exists(path): raise FileNotFoundError(f"El archivo no existe: {path}")
+    return path
 
-# ==========================================
-# CONFIGURACIÓN: PON AQUÍ EL NOMBRE DE TU ARCHIVO
-# (Copia el nombre del archivo que se generó en la carpeta backups/)
-BACKUP_FILENAME = "backup_20251205_210045.sql.enc" 
-# ==========================================
+def resolve_target_engine(target):
+    # El destino siempre es explícito: un respaldo de Producción contiene datos sin enmascarar
+    if not target: raise ValueError("Indica la conexión destino")
+    databases = config_store.get()['databases']
+    if target in ('prod', 'production'): env_var = databases['source_db_env_var']
+    elif target == 'qa': env_var = databases['target_db_env_var']
+    else:
+        entry = databases.get('registry', {}).get(target)
+        if not entry: raise ValueError(f"Conexión destino desconocida: {target}")
+        env_var = entry['env_var']
+    uri = os.getenv(env_var)
+    if not uri: raise ValueError(f"Variable {env_var} vacía")
+    return get_engine(uri)
 
-input_path = os.path.join(BASE_DIR, 'backups', BACKUP_FILENAME)
-output_path = os.path.join(BASE_DIR, 'backups', "restored_script.sql")
+def get_env_tag(conn):
+    if not conn.execute(text("SELECT to_regclass('public._db_meta')")).scalar(): return None
+    return conn.execute(text("SELECT value FROM _db_meta WHERE key='env'")).scalar()
 
-def decrypt_backup():
-    if not os.path.exists(input_path):
-        print(f" El archivo no existe: {input_path}")
-        return
+def _reset_sequences(conn, table):
+    # Las columnas SERIAL se cargan con sus ids: la secuencia debe quedar por encima del máximo
+    cols = conn.execute(text("SELECT column_name FROM information_schema.columns WHERE table_schema = 'public' AND table_name = :t AND column_default LIKE 'nextval%'"), {"t": table}).scalars().all()
+    for col in cols:
+        conn.execute(text(f"SELECT setval(pg_get_serial_sequence(:t, :c), COALESCE((SELECT MAX({col}) FROM {table}), 0) + 1, false)"), {"t": table, "c": col})
 
-    try:
-        print(f" Leyendo archivo cifrado: {BACKUP_FILENAME}...")
-        with open(input_path, 'rb') as f:
-            encrypted_data = f.read()
+def _load_table(reader, engine, table, replace, progress=None):
+    info = reader.manifest['tables'][table]
+    col_list = ', '.join(f'"{c}"' for c in info['columns'])
+    stream = VerifyingStream(reader.table_chunks(table))
+    with engine.connect() as conn:
+        conn.execute(text("SET session_replication_role = 'replica';"))
+        if replace: conn.execute(text(f"DELETE FROM {table}"))
+        cursor = conn.connection.dbapi_connection.cursor()
+        try: cursor.copy_expert(f"COPY {table} ({col_list}) FROM STDIN", stream)
+        finally: cursor.close()
+        # Verificación antes del commit: si no cuadra, la tabla queda como estaba
+        if stream.rows != info['rows'] or stream.sha256 != info['sha256']:
+            raise ValueError(f"{table}: verificación fallida (filas {stream.rows}/{info['rows']}, checksum {'OK' if stream.sha256 == info['sha256'] else 'distinto'})")
+        _reset_sequences(conn, table)
+        conn.execute(text("SET session_replication_role = 'origin';"))
+        conn.commit()
+    logger.info(f"[OK] {table}: {stream.rows} filas restauradas y verificadas")
+    if progress: progress(table, stream.rows)
+    return stream.rows
+
+def restore_backup(filename, target, tables=None, workers=4, allow_production=False, progress=None, include_meta=False):
+    key = os.getenv("BACKUP_ENCRYPTION_KEY")
+    if not key: raise ValueError("Falta BACKUP_ENCRYPTION_KEY")
+    reader = BackupReader(resolve_backup_path(filename), key.encode())
+    available = reader.manifest['tables']
+    unknown = set(tables or []) - set(available)
+    if unknown: raise ValueError(f"Tablas no incluidas en el respaldo: {', '.join(sorted(unknown))}")
+    selected = [t for t in available if not tables or t in tables]
+    engine = resolve_target_engine(target)
+
+    with engine.connect() as conn:
+        env_tag = get_env_tag(conn)
+        if env_tag == 'production' and not allow_production: raise PermissionError("⛔ El destino es Production; usa allow_production para forzarlo")
+        if not tables:
+            # Restauración completa: se recrea el esquema y se conserva la huella _db_meta del destino
+            logger.info("[INFO] Aplicando esquema del respaldo...")
+            cursor = conn.connection.dbapi_connection.cursor()
+            try: cursor.execute(reader.schema_sql())
+            finally: cursor.close()
+            if env_tag: conn.execute(text("INSERT INTO _db_meta (key, value) VALUES ('env', :v)"), {"v": env_tag})
+            elif not include_meta: conn.execute(text("DROP TABLE IF EXISTS _db_meta"))
+        conn.commit()
+    # La huella del origen solo se copia si se pide (include_meta) y el destino no tiene una propia:
+    # un destino sin huella no hereda la de Production por accidente
+    if '_db_meta' in selected and (env_tag or not include_meta):
+        if include_meta: logger.warning(f"[WARN] El destino ya tiene huella '{env_tag}', no se restaura _db_meta")
+        selected.remove('_db_meta')
 
-        print(" Desencriptando datos...")
-        fernet = Fernet(key.encode())
-        decrypted_data = fernet.decrypt(encrypted_data)
+    report = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='restore') as pool:
+        futures = {t: pool.submit(_load_table, reader, engine, t, bool(tables), progress) for t in selected}
+        for t, future in futures.items(): report[t] = future.result()
 
-        print(f" Guardando SQL legible en: {output_path}...")
-        with open(output_path, 'wb') as f:
-            f.write(decrypted_data)
+    if 'auditoria' in selected:
+        # El resumen del dashboard se reconstruye desde la auditoría restaurada
+        with engine.connect() as conn:
+            conn.execute(text(audit_schema.AUDIT_ROLLUP_DDL))
+            audit_schema.rebuild_audit_rollup(conn)
+            conn.commit()
+    return report
 
-        print("\n ¡ÉXITO! El archivo 'restored_script.sql' está listo.")
-        print("  ADVERTENCIA: Este archivo contiene datos reales. Bórralo después de cargarlo en pgAdmin.")
+def restore_legacy_sql(filename, target, allow_production=False, include_meta=False):
+    # Respaldos .sql.enc anteriores: se descifran en memoria y se ejecutan directo en el destino
+    key = os.getenv("BACKUP_ENCRYPTION_KEY")
+    if not key: raise ValueError("Falta BACKUP_ENCRYPTION_KEY")
+    path = resolve_backup_path(filename)
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    if size_mb > LEGACY_MAX_MB: raise ValueError(f"Respaldo heredado de {size_mb:.0f} MB supera el límite de {LEGACY_MAX_MB} MB")
+    with open(path, 'rb') as f: sql = Fernet(key.encode()).decrypt(f.read()).decode('utf-8')
+    engine = resolve_target_engine(target)
+    with engine.connect() as conn:
+        env_tag = get_env_tag(conn)
+        if env_tag == 'production' and not allow_production: raise PermissionError("⛔ El destino es Production; usa allow_production para forzarlo")
+        cursor = conn.connection.dbapi_connection.cursor()
+        try: cursor.execute(sql)
+        finally: cursor.close()
+        if env_tag: conn.execute(text("UPDATE _db_meta SET value = :v WHERE key = 'env'"), {"v": env_tag})
+        elif not include_meta: conn.execute(text("DROP TABLE IF EXISTS _db_meta"))
+        conn.commit()
 
+def main():
+    parser = argparse.ArgumentParser(description="Restaura un respaldo cifrado directamente en una base de datos")
+    parser.add_argument("backup", help="Archivo en backups/ (.dmbk o .sql.enc heredado)")
+    parser.add_argument("--target", help="Conexión destino (obligatoria al restaurar): qa, prod o un id del registro")
+    parser.add_argument("--tables", help="Lista de tablas separadas por coma (solo esas se reemplazan)")
+    parser.add_argument("--workers", type=int, default=4, help="Tablas restauradas en paralelo")
+    parser.add_argument("--list", action="store_true", help="Solo muestra el manifiesto")
+    parser.add_argument("--allow-production", action="store_true", help="Permite restaurar sobre Production")
+    parser.add_argument("--include-meta", action="store_true", help="Copia la huella _db_meta del respaldo a un destino sin huella")
+    args = parser.parse_args()
+
+    try:
+        if args.backup.endswith('.sql.enc'):
+            restore_legacy_sql(args.backup, args.target, args.allow_production, args.include_meta)
+            print("\n ¡ÉXITO! Respaldo heredado aplicado en el destino.")
+            return
+        if args.list:
+            reader = BackupReader(resolve_backup_path(args.backup), os.getenv("BACKUP_ENCRYPTION_KEY", "").encode())
+            print(f" Respaldo creado: {reader.manifest['created_at']}")
+            for t, info in reader.manifest['tables'].items(): print(f"  {t:<20} {info['source']:<5} {info['rows']:>10} filas  sha256={info['sha256'][:16]}…")
+            return
+        tables = [t.strip() for t in args.tables.split(',')] if args.tables else None
+        report = restore_backup(args.backup, args.target, tables, args.workers, args.allow_production, include_meta=args.include_meta)
+        print(f"\n ¡ÉXITO! {sum(report.values())} filas restauradas en {len(report)} tablas.")
     except Exception as e:
-        print(f" Error al desencriptar (¿Es la clave correcta?): {e}")
+        print(f" Error al restaurar (¿Es la clave correcta?): {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    decrypt_backup()
\ No newline at end of file
+    main()
@@ -0,0 +1,127 @@
+import time
+import threading
+import logging
+from datetime import datetime
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# --- CATÁLOGO DE ESQUEMA CACHEADO ---
+# Tablas, columnas, tipos, PK, FKs y filas estimadas del esquema public en una sola consulta al catálogo.
+# Cada CHECK_SECONDS se compara una huella barata del contenido del catálogo (no de xmin, que no ve los cambios que
+# solo tocan pg_attribute/pg_attrdef y se reinicia con el wraparound de xid): conteo + md5 de relaciones, columnas,
+# defaults y restricciones del esquema. Solo si cambió (o venció el TTL, para refrescar las filas estimadas) se
+# vuelve a leer el catálogo completo.
+CHECK_SECONDS = 10
+CATALOG_TTL = 600
+
+FINGERPRINT_SQL = text("""
+    SELECT concat_ws('/',
+        (SELECT COUNT(*) || ':' || md5(COALESCE(string_agg(concat_ws(',', c.oid, c.relname, c.relkind, c.relispartition), ';' ORDER BY c.oid), ''))
+            FROM pg_class c WHERE c.relnamespace = 'public'::regnamespace),
+        (SELECT COUNT(*) || ':' || md5(COALESCE(string_agg(concat_ws(',', a.attrelid, a.attnum, a.attname, a.atttypid, a.atttypmod, a.attnotnull, a.attisdropped), ';' ORDER BY a.attrelid, a.attnum), ''))
+            FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+            WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p') AND a.attnum > 0),
+        (SELECT COUNT(*) || ':' || md5(COALESCE(string_agg(concat_ws(',', d.adrelid, d.adnum, pg_get_expr(d.adbin, d.adrelid)), ';' ORDER BY d.adrelid, d.adnum), ''))
+            FROM pg_attrdef d JOIN pg_class c ON c.oid = d.adrelid WHERE c.relnamespace = 'public'::regnamespace),
+        (SELECT COUNT(*) || ':' || md5(COALESCE(string_agg(concat_ws(',', k.oid, k.conname, k.contype, k.conrelid, k.confrelid, k.conkey, k.confkey), ';' ORDER BY k.oid), ''))
+            FROM pg_constraint k WHERE k.connamespace = 'public'::regnamespace))
+""")
+
+CATALOG_SQL = text("""
+    SELECT c.relname,
+        CASE WHEN c.reltuples < 0 THEN NULL ELSE c.reltuples::bigint END,
+        (SELECT json_agg(json_build_object('name', a.attname, 'type', format_type(a.atttypid, a.atttypmod), 'nullable', NOT a.attnotnull) ORDER BY a.attnum)
+            FROM pg_attribute a WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped),
+        (SELECT json_agg(a.attname ORDER BY u.ord) FROM pg_constraint k
+            CROSS JOIN LATERAL unnest(k.conkey) WITH ORDINALITY u(attnum, ord)
+            JOIN pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = u.attnum
+            WHERE k.conrelid = c.oid AND k.contype = 'p'),
+        (SELECT json_agg(json_build_object(
+                'name', k.conname, 'ref_table', k.confrelid::regclass::text,
+                'columns', (SELECT json_agg(a.attname ORDER BY u.ord) FROM unnest(k.conkey) WITH ORDINALITY u(attnum, ord) JOIN pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = u.attnum),
+                'ref_columns', (SELECT json_agg(a.attname ORDER BY u.ord) FROM unnest(k.confkey) WITH ORDINALITY u(attnum, ord) JOIN pg_attribute a ON a.attrelid = k.confrelid AND a.attnum = u.attnum)
+            ) ORDER BY k.conname) FROM pg_constraint k WHERE k.conrelid = c.oid AND k.contype = 'f')
+    FROM pg_class c
+    WHERE c.relnamespace = 'public'::regnamespace AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+    ORDER BY c.relname
+""")
+
+# Sugerencia de regla por nombre de columna (mismo criterio que el alta de pipelines)
+SUGGESTIONS = [('email', 'hash_email'), ('telef', 'preserve_format'), ('nombre', 'fake_name'), ('direc', 'redact')]
+
+def suggest_masking_rules(columns):
+    rules = {}
+    for c in columns:
+        cn = c['name'].lower()
+        rule = next((r for key, r in SUGGESTIONS if key in cn), None)
+        if rule: rules[c['name']] = rule
+    return rules
+
+class SchemaCatalog:
+    def __init__(self, check_seconds=CHECK_SECONDS, ttl=CATALOG_TTL):
+        self.check_seconds = check_seconds
+        self.ttl = ttl
+        self.stats = {"loads": 0, "checks": 0, "hits": 0}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def _engine_lock(self, key):
+        with self._lock: return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, engine, force=False):
+        key = str(engine.url)
+        # Un lock por base: varias peticiones simultáneas esperan una sola lectura del catálogo
+        with self._engine_lock(key):
+            entry = self._entries.get(key)
+            now = time.time()
+            if entry and not force and now - entry["checked"] < self.check_seconds:
+                self._count(hits=1)
+                return entry["catalog"]
+            with engine.connect() as conn:
+                fingerprint = conn.execute(FINGERPRINT_SQL).scalar()
+                self._count(checks=1)
+                if entry and not force and fingerprint == entry["fingerprint"] and now - entry["loaded"] < self.ttl:
+                    entry["checked"] = now
+                    return entry["catalog"]
+                catalog = self._load(conn, fingerprint)
+            if entry and entry["fingerprint"] != fingerprint: logger.info(f"[INFO] Catálogo de {engine.url.database}: cambio de esquema detectado, recargado")
+            self._entries[key] = {"catalog": catalog, "fingerprint": fingerprint, "loaded": now, "checked": now}
+            self._count(loads=1)
+            return catalog
+
+    def _load(self, conn, fingerprint):
+        tables = {}
+        for name, rows, columns, pk, fks in conn.execute(CATALOG_SQL):
+            tables[name] = {"name": name, "rows": rows, "columns": columns or [], "pk": pk or [], "fks": fks or []}
+        return {"version": fingerprint, "loaded_at": datetime.now().isoformat(), "tables": tables}
+
+    def invalidate(self, engine=None):
+        with self._lock:
+            if engine is None: self._entries.clear()
+            else: self._entries.pop(str(engine.url), None)
+
+    def _count(self, **deltas):
+        with self._lock:
+            for k, v in deltas.items(): self.stats[k] += v
+
+    # --- Vistas derivadas ---
+    def table_names(self, engine):
+        return list(self.get(engine)["tables"])
+
+    def table(self, engine, name):
+        return self.get(engine)["tables"].get(name)
+
+    def fk_graph(self, engine):
+        # Hijo -> padres (sin autorreferencias)
+        graph = {}
+        for name, t in self.get(engine)["tables"].items():
+            for fk in t["fks"]:
+                if fk["ref_table"] != name: graph.setdefault(name, set()).add(fk["ref_table"])
+        return graph
+
+    def metrics(self):
+        with self._lock: return {**self.stats, "databases": len(self._entries)}
+
+schema_catalog = SchemaCatalog()
@@ -0,0 +1,32 @@
+import sys
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from faker import Faker
+
+# --- WORKER DE SEMBRADO (FAKER) ---
+# Módulo sin imports de la app. Un pool spawn (o forkserver) re-importa el __main__ del padre en cada worker:
+# desde un job de Flask eso sería app.py completo. Por eso init_db lanza este módulo como proceso propio
+# (python -m seed_worker) y el pool se crea aquí, donde el __main__ que heredan los workers es este archivo.
+_chunk_faker = {}
+
+def faker_clients(args):
+    # Un Faker por proceso, re-sembrado por bloque: el resultado no depende del número de workers
+    seed, start, size = args
+    if 'es_MX' not in _chunk_faker: _chunk_faker['es_MX'] = Faker('es_MX')
+    f = _chunk_faker['es_MX']
+    f.seed_instance(seed * 1000003 + start)
+    names = [f.name() for _ in range(size)]
+    addresses = [f.address().replace('\n', ', ') for _ in range(size)]
+    return names, addresses
+
+def serve(source, sink):
+    # Entrada: (bloques, workers) en pickle; salida: un pickle (nombres, direcciones) por bloque, en orden
+    chunks, workers = pickle.load(source)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for result in pool.map(faker_clients, chunks):
+            pickle.dump(result, sink)
+            sink.flush()
+
+if __name__ == "__main__":
+    serve(sys.stdin.buffer, sys.stdout.buffer)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos de backend se importan por nombre (como en app.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+from batch_tuner import BatchTuner, tuning_settings
+
+MB = 1024 * 1024
+
+def make(rows=1000, **kwargs):
+    return BatchTuner("t", rows, **{"target_seconds": 1.0, "max_chunk_mb": 64, "min_rows": 100, "max_rows": 50000, **kwargs})
+
+def test_initial_rows_are_clamped():
+    assert make(10).rows == 100
+    assert make(10 ** 6).rows == 50000
+
+def test_pinned_and_disabled_keep_the_size():
+    for tuner in (make(1234, pinned=True), make(1234, enabled=False)):
+        assert tuner.observe(1234, 0.01, 1234) == 1234
+        assert tuner.rows == 1234 and not tuner.measured
+
+def test_grows_at_most_x2_per_chunk():
+    tuner = make(1000)
+    # 100k filas/s con objetivo de 1 s pediría 100000: se limita a x2
+    assert tuner.observe(1000, 0.01, 1000 * 10) == 2000
+    assert tuner.observe(2000, 0.02, 2000 * 10) == 4000
+
+def test_shrinks_at_most_half_per_chunk():
+    tuner = make(4000)
+    # 100 filas/s pediría 100 filas: se limita a /2
+    assert tuner.observe(4000, 40.0, 4000 * 10) == 2000
+
+def test_converges_to_target_seconds():
+    tuner = make(1000)
+    assert tuner.observe(1000, 1000 / 1500, 1000 * 10) == 1500
+
+def test_clamped_to_min_and_max_rows():
+    tuner = make(40000)
+    assert tuner.observe(40000, 0.01, 40000 * 10) == 50000
+    tuner = make(150)
+    assert tuner.observe(150, 100.0, 150 * 10) == 100
+
+def test_memory_ceiling_overrides_step_limit():
+    # 1 MB por fila con techo de 64 MB: baja de 1000 a 64 filas de golpe (y luego al mínimo)
+    tuner = make(1000, min_rows=10)
+    assert tuner.observe(1000, 0.5, 1000 * MB) == 64
+    tuner = make(1000)
+    assert tuner.observe(1000, 0.5, 1000 * MB) == 100
+
+def test_partial_last_chunk_does_not_update_rate():
+    tuner = make(1000)
+    # Menos de la mitad del bloque: solo se registra el ancho de fila
+    assert tuner.observe(400, 10.0, 400 * 20) == 1000
+    assert tuner.rows_per_second is None and tuner.bytes_per_row == 20
+    assert tuner.observe(500, 0.01, 500 * 20) == 2000
+
+def test_ignores_empty_or_instant_chunks():
+    tuner = make(1000)
+    assert tuner.observe(0, 1.0, 0) == 1000
+    assert tuner.observe(1000, 0, 1000) == 1000
+    assert tuner.bytes_per_row is None and tuner.chunks == 2
+
+def test_tuning_settings_defaults_and_overrides():
+    assert tuning_settings({})["max_rows"] == 50000
+    tuning = tuning_settings({"batch_tuning": {"enabled": False, "target_seconds": "3", "min_rows": "50"}})
+    assert tuning["enabled"] is False and tuning["target_seconds"] == 3.0 and tuning["min_rows"] == 50
@@ -0,0 +1,55 @@
+from etl_core import narrow_ranges
+
+def stub_sums(source_rows, target_rows, calls=None):
+    # Igual que _range_sums: {cubeta: (filas, suma de hashes)} de cada lado para [lo, hi]
+    def bucketize(rows, lo, hi, width):
+        buckets = {}
+        for pk, h in rows.items():
+            if lo <= pk <= hi:
+                count, total = buckets.get((pk - lo) // width, (0, 0))
+                buckets[(pk - lo) // width] = (count + 1, total + h)
+        return buckets
+    def range_sums(lo, hi, width):
+        if calls is not None: calls.append((lo, hi, width))
+        return bucketize(source_rows, lo, hi, width), bucketize(target_rows, lo, hi, width)
+    return range_sums
+
+def rows(lo, hi):
+    return {pk: pk * 7 for pk in range(lo, hi + 1)}
+
+def test_identical_tables_need_one_comparison():
+    assert narrow_ranges(1, 10000, stub_sums(rows(1, 10000), rows(1, 10000))) == ([], 1)
+
+def test_small_difference_is_a_leaf_at_first_level():
+    source, target = rows(1, 100), rows(1, 100)
+    source[42] += 1
+    leaves, compared = narrow_ranges(1, 100, stub_sums(source, target), fanout=4, leaf_rows=50)
+    assert leaves == [(26, 50)] and compared == 1
+
+def test_recurses_until_bucket_fits_leaf_rows():
+    source, target = rows(1, 10000), rows(1, 10000)
+    source[5000] += 1
+    calls = []
+    leaves, compared = narrow_ranges(1, 10000, stub_sums(source, target, calls), fanout=10, leaf_rows=50)
+    # 10000 -> 1000 -> 100 -> 10 filas por cubeta: tres niveles y una sola hoja con la fila cambiada
+    assert compared == 3 and [c[2] for c in calls] == [1000, 100, 10]
+    assert len(leaves) == 1
+    lo, hi = leaves[0]
+    assert lo <= 5000 <= hi and hi - lo + 1 <= 50
+
+def test_width_one_is_always_a_leaf():
+    source, target = rows(1, 8), rows(1, 8)
+    source[3] += 1
+    leaves, compared = narrow_ranges(1, 8, stub_sums(source, target), fanout=2, leaf_rows=0)
+    # 8 -> 4 -> 2 -> 1 clave por cubeta
+    assert leaves == [(3, 3)] and compared == 3
+
+def test_new_and_deleted_rows_are_found():
+    source, target = rows(1, 1000), rows(1, 1000)
+    source[1001] = 1
+    del source[10]
+    target[2000] = 5
+    leaves, _ = narrow_ranges(1, 2000, stub_sums(source, target), fanout=8, leaf_rows=20)
+    for pk in (10, 1001, 2000): assert any(lo <= pk <= hi for lo, hi in leaves)
+    # Las hojas pueden ser anchas si hay huecos de PK, pero nunca con más de leaf_rows filas
+    assert all(max(sum(lo <= pk <= hi for pk in side) for side in (source, target)) <= 20 for lo, hi in leaves)
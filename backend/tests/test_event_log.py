@@ -0,0 +1,47 @@
+import json
+import multiprocessing
+from datetime import datetime, timedelta
+from event_log import EventLog
+
+def _write(directory, writer, n):
+    log = EventLog(directory, max_bytes=2000)
+    for i in range(n): log.append({"timestamp": datetime.now().isoformat(), "writer": writer, "i": i})
+
+def test_concurrent_writers_keep_every_segment(tmp_path):
+    ctx = multiprocessing.get_context('spawn')
+    procs = [ctx.Process(target=_write, args=(str(tmp_path), w, 300)) for w in range(3)]
+    for p in procs: p.start()
+    for p in procs: p.join()
+    assert all(p.exitcode == 0 for p in procs)
+    events = list(EventLog(str(tmp_path)).read(newest_first=False))
+    assert len(events) == 900
+    for w in range(3): assert [e['i'] for e in events if e['writer'] == w] == list(range(300))
+    # Aunque cada proceso sobrescribió index.json con su vista, el último refresco cubre todos los archivos
+    with open(tmp_path / 'index.json', encoding='utf-8') as f: indexed = {s['file'] for s in json.load(f)}
+    assert indexed == {p.name for p in tmp_path.glob('events-*.jsonl')}
+
+def test_reader_sees_appends_from_another_instance(tmp_path):
+    reader, writer = EventLog(str(tmp_path)), EventLog(str(tmp_path))
+    writer.append({"timestamp": datetime.now().isoformat(), "status": "ok"})
+    assert [e['status'] for e in reader.read()] == ['ok']
+    writer.append({"timestamp": datetime.now().isoformat(), "status": "error"})
+    assert [e['status'] for e in reader.read()] == ['error', 'ok']
+    assert [e['status'] for e in reader.read(status='error')] == ['error']
+
+def test_stale_index_is_rebuilt_from_segments(tmp_path):
+    log = EventLog(str(tmp_path), max_bytes=200)
+    for i in range(20): log.append({"timestamp": datetime.now().isoformat(), "i": i})
+    (tmp_path / 'index.json').write_text('[]', encoding='utf-8')
+    assert len(list(EventLog(str(tmp_path)).read())) == 20
+
+def test_prune_keeps_recent_segments(tmp_path):
+    log = EventLog(str(tmp_path), max_bytes=200)
+    old = (datetime.now() - timedelta(days=30)).isoformat()
+    for i in range(20): log.append({"timestamp": old, "i": i})
+    # Recién creados: todavía pueden estar activos en otro proceso, no se borran aunque sus eventos sean viejos
+    assert log.prune(datetime.now() - timedelta(days=1)) == 0
+    log.max_age = timedelta(0)
+    assert log.prune(datetime.now() - timedelta(days=1)) > 0
+    # El segmento activo de este proceso nunca se poda
+    assert [p.name for p in tmp_path.glob('events-*.jsonl')] == [log._own]
+    assert [e['i'] for e in log.read()][0] == 19
@@ -1,6 +1,6 @@
 import { cn } from "@/lib/utils";
 import { PipelineStatus } from "@/types/pipeline";
-import { CheckCircle2, XCircle, AlertTriangle, Clock, Loader2 } from "lucide-react";
+import { CheckCircle2, XCircle, AlertTriangle, Clock, Loader2, MinusCircle, Ban } from "lucide-react";
 
 interface StatusBadgeProps {
   status: PipelineStatus;
@@ -34,6 +34,16 @@ const statusConfig: Record<PipelineStatus, { label: string; className: string; i
     className: 'bg-warning/20 text-warning',
     icon: AlertTriangle,
   },
+  skipped: {
+    label: 'Omitido',
+    className: 'bg-muted text-muted-foreground',
+    icon: MinusCircle,
+  },
+  cancelled: {
+    label: 'Cancelado',
+    className: 'bg-warning/20 text-warning',
+    icon: Ban,
+  },
 };
 
 const sizeClasses = {
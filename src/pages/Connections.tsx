@@ -12,11 +12,12 @@ const Connections = () => {
   const [connections, setConnections] = useState<any[]>([]);
   const [loading, setLoading] = useState(false);
 
-  const fetchConnections = () => {
+  // Sin refresh: último sondeo del monitor en segundo plano; con refresh: sondeo inmediato
+  const fetchConnections = (refresh = false) => {
     setLoading(true);
     const toastId = toast.loading("Midiendo latencia de red...");
     
-    fetch('http://localhost:5000/api/connections')
+    fetch(`http://localhost:5000/api/connections${refresh ? '?refresh=1' : ''}`)
       .then(res => res.json())
       .then(data => {
         setConnections(data);
@@ -32,6 +33,13 @@ const Connections = () => {
 
   useEffect(() => { fetchConnections(); }, []);
 
+  useEffect(() => {
+    const timer = setInterval(() => {
+      fetch('http://localhost:5000/api/connections').then(res => res.json()).then(setConnections).catch(() => {});
+    }, 15000);
+    return () => clearInterval(timer);
+  }, []);
+
   return (
     <Layout>
       <Header title="Estado de Conexiones" description="Monitoreo de latencia y disponibilidad de bases de datos" />
@@ -43,7 +51,7 @@ const Connections = () => {
                 <Activity className="h-4 w-4 text-green-500 animate-pulse" />
                 <span>Monitoreo activo</span>
             </div>
-            <Button onClick={fetchConnections} disabled={loading} variant="outline" className="gap-2">
+            <Button onClick={() => fetchConnections(true)} disabled={loading} variant="outline" className="gap-2">
                 <RefreshCw className={`h-4 w-4 ${loading ? 'animate-spin' : ''}`}/> 
                 {loading ? "Escaneando..." : "Ejecutar Diagnóstico"}
             </Button>
@@ -68,13 +76,14 @@ const Connections = () => {
 const ServerCard = ({ db }: { db: any }) => {
     // Calcular salud basada en latencia
     const isConnected = db.status === 'connected';
+    const isPending = db.status === 'unknown'; // aún sin primer sondeo del monitor
     const latencyColor = db.latency < 100 ? "bg-green-500" : db.latency < 300 ? "bg-yellow-500" : "bg-red-500";
     const healthPercent = isConnected ? Math.max(0, 100 - (db.latency / 10)) : 0; // Fórmula visual simple
 
     return (
         <Card className="card-gradient border-border/50 overflow-hidden relative group hover:border-primary/30 transition-all">
             {/* Indicador Superior de Estado */}
-            <div className={`h-1.5 w-full ${isConnected ? 'bg-green-500' : 'bg-red-500'}`} />
+            <div className={`h-1.5 w-full ${isConnected ? 'bg-green-500' : isPending ? 'bg-gray-400' : 'bg-red-500'}`} />
             
             <CardHeader className="pb-2">
                 <div className="flex justify-between items-start">
@@ -95,9 +104,9 @@ const ServerCard = ({ db }: { db: any }) => {
                             </p>
                         </div>
                     </div>
-                    <Badge variant="outline" className={`${isConnected ? 'text-green-500 border-green-500/30 bg-green-500/5' : 'text-red-500 border-red-500/30 bg-red-500/5'}`}>
-                        {isConnected ? <CheckCircle2 className="h-3 w-3 mr-1" /> : <XCircle className="h-3 w-3 mr-1" />}
-                        {isConnected ? "ONLINE" : "OFFLINE"}
+                    <Badge variant="outline" className={`${isConnected ? 'text-green-500 border-green-500/30 bg-green-500/5' : isPending ? 'text-muted-foreground' : 'text-red-500 border-red-500/30 bg-red-500/5'}`}>
+                        {isConnected ? <CheckCircle2 className="h-3 w-3 mr-1" /> : !isPending && <XCircle className="h-3 w-3 mr-1" />}
+                        {isConnected ? "ONLINE" : isPending ? "SONDEANDO" : "OFFLINE"}
                     </Badge>
                 </div>
             </CardHeader>
@@ -113,20 +122,23 @@ const ServerCard = ({ db }: { db: any }) => {
                     </div>
                     <div className="p-3 bg-muted/30 rounded-lg border border-border/50 text-center">
                         <p className="text-xs text-muted-foreground mb-1">Último Chequeo</p>
-                        <p className="font-mono font-bold text-sm mt-1">
-                            {new Date(db.lastChecked).toLocaleTimeString()}
+                        <p className={`font-mono font-bold text-sm mt-1 ${db.stale ? 'text-yellow-500' : ''}`}>
+                            {db.lastChecked ? new Date(db.lastChecked).toLocaleTimeString() : "-"}
                         </p>
+                        {db.stale && <p className="text-[10px] text-yellow-500">Sin sondeo reciente ({Math.round(db.ageSeconds)} s)</p>}
                     </div>
                 </div>
 
                 <div className="space-y-2">
                     <div className="flex justify-between text-xs">
                         <span className="text-muted-foreground">Calidad de Conexión</span>
-                        <span className={isConnected ? "text-green-500" : "text-red-500"}>
-                            {isConnected ? "Estable" : "Crítica"}
+                        <span className={isConnected ? "text-green-500" : isPending ? "text-muted-foreground" : "text-red-500"}>
+                            {isConnected ? "Estable" : isPending ? "Pendiente" : "Crítica"}
+                            {db.latencyAvg != null && ` · prom. ${db.latencyAvg} ms · ${db.availability}% disponible`}
                         </span>
                     </div>
                     <Progress value={healthPercent} className="h-2" indicatorColor={latencyColor} />
+                    {db.error && <p className="text-[10px] text-red-500 font-mono truncate" title={db.error}>{db.error}</p>}
                 </div>
             </CardContent>
         </Card>
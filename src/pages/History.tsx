@@ -2,7 +2,7 @@ import { Layout } from "@/components/Layout";
 import { Header } from "@/components/Header";
 import { ExecutionLogRow } from "@/components/ExecutionLogRow";
 import { Button } from "@/components/ui/button";
-import { Filter, RefreshCw, AlertCircle, CheckCircle2, XCircle, X } from "lucide-react";
+import { Filter, RefreshCw, AlertCircle, CheckCircle2, XCircle, X, Download } from "lucide-react";
 import { useEffect, useState } from "react";
 import { toast } from "sonner";
 import { ExecutionLog } from "@/types/pipeline";
@@ -18,23 +18,27 @@ import {
 const History = () => {
   const [logs, setLogs] = useState<ExecutionLog[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   
   const [statusFilter, setStatusFilter] = useState<'all' | 'success' | 'error'>('all');
 
-  const fetchHistory = async () => {
+  // Paginación por cursor: "Cargar más" pide la página siguiente a partir del último registro mostrado
+  const fetchHistory = async (cursor?: string) => {
     setLoading(true);
     try {
-      const response = await fetch('http://localhost:5000/api/history');
+      const params = new URLSearchParams({ limit: '50' });
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`http://localhost:5000/api/history?${params}`);
       
       if (response.ok) {
         const data = await response.json();
         
-        if (Array.isArray(data)) {
-            const realLogs: ExecutionLog[] = data.map((item: any, index: number) => {
+        if (Array.isArray(data.items)) {
+            const realLogs: ExecutionLog[] = data.items.map((item: any) => {
                 const isSuccess = item.estado && item.estado.includes('SUCCESS');
                 
                 return {
-                id: `real-${index}`,
+                id: `real-${item.id}`,
                 pipelineId: '1', 
                 pipelineName: `Migración: ${item.tabla}`,
                 status: isSuccess ? 'success' : 'error',
@@ -49,15 +53,16 @@ const History = () => {
                 recordsMasked: item.registros,
                 recordsLoaded: item.registros,
                 errors: !isSuccess ? [{ 
-                    id: `err-${index}`, 
+                    id: `err-${item.id}`, 
                     message: item.mensaje || "Error desconocido", 
                     timestamp: item.fecha, 
                     severity: 'error' 
                 }] : []
                 };
             });
-            setLogs(realLogs);
-            toast.success("Historial actualizado");
+            setLogs(prev => cursor ? [...prev, ...realLogs] : realLogs);
+            setNextCursor(data.next_cursor);
+            if (!cursor) toast.success("Historial actualizado");
         }
       }
     } catch (error) {
@@ -143,9 +148,16 @@ const History = () => {
                 </Button>
             )}
 
-            <Button variant="ghost" size="sm" onClick={fetchHistory} disabled={loading}>
+            <Button variant="ghost" size="sm" onClick={() => fetchHistory()} disabled={loading}>
               <RefreshCw className={`h-4 w-4 ${loading ? 'animate-spin' : ''}`} />
             </Button>
+
+            <Button variant="outline" size="sm" className="gap-2" asChild>
+              <a href="http://localhost:5000/api/history/export?format=csv">
+                <Download className="h-4 w-4" />
+                Exportar CSV
+              </a>
+            </Button>
           </div>
           
           <span className="text-xs text-muted-foreground">
@@ -169,6 +181,13 @@ const History = () => {
               </div>
             ))
           )}
+          {nextCursor && (
+            <div className="flex justify-center pt-2">
+              <Button variant="outline" size="sm" onClick={() => fetchHistory(nextCursor)} disabled={loading}>
+                Cargar más
+              </Button>
+            </div>
+          )}
         </div>
       </div>
     </Layout>
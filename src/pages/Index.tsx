@@ -6,7 +6,7 @@ import { Badge } from "@/components/ui/badge";
 import { Button } from "@/components/ui/button";
 import { 
   GitBranch, Shield, Database, Activity, 
-  Server, CheckCircle2, XCircle, Clock, ArrowRight 
+  Server, CheckCircle2, XCircle, Clock, ArrowRight, MinusCircle, Ban 
 } from "lucide-react";
 import { Link } from "react-router-dom";
 import { useEffect, useState } from "react";
@@ -158,6 +158,10 @@ const Index = () => {
                   <div className="flex items-center gap-3">
                     {item.status === 'success' 
                       ? <CheckCircle2 className="h-5 w-5 text-green-500" />
+                      : item.status === 'skipped'
+                      ? <MinusCircle className="h-5 w-5 text-muted-foreground" />
+                      : item.status === 'cancelled'
+                      ? <Ban className="h-5 w-5 text-orange-500" />
                       : <XCircle className="h-5 w-5 text-red-500" />
                     }
                     <div>
@@ -180,13 +184,14 @@ const Index = () => {
 // Componente auxiliar para filas de estado
 const SystemStatusRow = ({ label, status }: { label: string, status: string }) => {
   const isOnline = status === 'online' || status === 'running' || status === 'connected';
+  const isPending = status === 'unknown';
   return (
     <div className="flex items-center justify-between">
       <span className="text-sm text-muted-foreground">{label}</span>
       <div className="flex items-center gap-2">
-        <span className={`h-2 w-2 rounded-full ${isOnline ? 'bg-green-500 animate-pulse' : 'bg-red-500'}`} />
-        <span className={`text-xs font-medium ${isOnline ? 'text-green-600' : 'text-red-600'}`}>
-          {isOnline ? 'ONLINE' : 'OFFLINE'}
+        <span className={`h-2 w-2 rounded-full ${isOnline ? 'bg-green-500 animate-pulse' : isPending ? 'bg-gray-400' : 'bg-red-500'}`} />
+        <span className={`text-xs font-medium ${isOnline ? 'text-green-600' : isPending ? 'text-muted-foreground' : 'text-red-600'}`}>
+          {isOnline ? 'ONLINE' : isPending ? 'SONDEANDO' : 'OFFLINE'}
         </span>
       </div>
     </div>
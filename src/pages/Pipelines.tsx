@@ -7,6 +7,7 @@ import { toast } from "sonner";
 import { useState, useEffect } from "react";
 import { Pipeline } from "@/types/pipeline";
 import { Slider } from "@/components/ui/slider";
+import { Switch } from "@/components/ui/switch";
 
 import {
   Dialog,
@@ -25,6 +26,21 @@ interface PipelinesProps {
   userRole?: string;
 }
 
+// Sigue un job del backend por SSE hasta que termina
+const followJob = (jobId: string, onProgress?: (job: any) => void) =>
+  new Promise<any>((resolve, reject) => {
+    const source = new EventSource(`http://localhost:5000/api/jobs/${jobId}/events`);
+    source.addEventListener('progress', (e) => onProgress?.(JSON.parse((e as MessageEvent).data)));
+    source.addEventListener('done', (e) => {
+      source.close();
+      resolve(JSON.parse((e as MessageEvent).data));
+    });
+    source.onerror = () => {
+      source.close();
+      reject(new Error("Se perdió la conexión con el job"));
+    };
+  });
+
 const Pipelines = ({ userRole }: PipelinesProps) => {
   const [pipelines, setPipelines] = useState<Pipeline[]>([]); 
   const [loading, setLoading] = useState(true);
@@ -37,6 +53,7 @@ const Pipelines = ({ userRole }: PipelinesProps) => {
   // States
   const [targetPipeline, setTargetPipeline] = useState<string | null>(null);
   const [runPercentage, setRunPercentage] = useState(100);
+  const [runSubset, setRunSubset] = useState(false);
   const [isRunning, setIsRunning] = useState(false);
   
   // Create Job State
@@ -145,14 +162,16 @@ const Pipelines = ({ userRole }: PipelinesProps) => {
         body: JSON.stringify(seedCounts)
       });
       const data = await response.json();
+      if (!response.ok) throw new Error(data.error || "Error desconocido");
 
-      if (response.ok) {
-        toast.dismiss(toastId);
-        toast.success("Datos Generados", { description: "Base de datos reiniciada." });
-        setIsSeedModalOpen(false);
-      } else {
-        throw new Error(data.error || "Error desconocido");
-      }
+      const job = await followJob(data.job_id, (j) => {
+        const loaded = Object.values(j.tables || {}).reduce((acc: number, t: any) => acc + (t.loaded || 0), 0);
+        toast.loading(`Generando datos... ${loaded} registros`, { id: toastId });
+      });
+      if (job.status !== 'success') throw new Error(job.error || "Error al generar datos");
+      toast.dismiss(toastId);
+      toast.success("Datos Generados", { description: "Base de datos reiniciada." });
+      setIsSeedModalOpen(false);
     } catch (error: any) {
       toast.dismiss(toastId);
       showSmartError("Fallo Crítico", error.message);
@@ -241,6 +260,7 @@ const Pipelines = ({ userRole }: PipelinesProps) => {
       if (response.ok) {
         toast.dismiss(toastId);
         toast.success("Pipeline Creado");
+        if (data.warning) toast.warning("Revisa la configuración", { description: data.warning });
         setIsCreateModalOpen(false);
         setNewJob({ name: "", table: "" });
         fetchPipelines(); 
@@ -281,18 +301,23 @@ const Pipelines = ({ userRole }: PipelinesProps) => {
       const response = await fetch('http://localhost:5000/api/run', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ table: targetPipeline, percentage: runPercentage }) 
+        body: JSON.stringify({ table: targetPipeline, percentage: runPercentage, subset: runSubset }) 
       });
 
       const data = await response.json();
 
-      if (response.ok) {
-        toast.dismiss(toastId);
-        toast.success("Exito", { description: data.message });
-        fetchPipelines();
-      } else {
-        throw new Error(data.error || data.message || `Error ${response.status}`);
+      if (!response.ok) throw new Error(data.error || data.message || `Error ${response.status}`);
+
+      const job = await followJob(data.job_id, (j) => {
+        const loaded = Object.values(j.tables || {}).reduce((acc: number, t: any) => acc + (t.loaded || 0), 0);
+        toast.loading(`Ejecutando... ${loaded} registros cargados`, { id: toastId });
+      });
+      toast.dismiss(toastId);
+      fetchPipelines();
+      if (job.status !== 'success') {
+        throw new Error(job.error || `Tablas con error: ${(job.result?.failed || []).join(', ')}`);
       }
+      toast.success("Exito", { description: "Ejecución completada" });
     } catch (error: any) {
       toast.dismiss(toastId);
       showSmartError("Ejecución Detenida", error.message);
@@ -438,6 +463,10 @@ const Pipelines = ({ userRole }: PipelinesProps) => {
                             <span className="text-sm font-bold font-mono bg-primary/10 px-2 py-1 rounded text-primary">{runPercentage}%</span>
                         </div>
                         <Slider value={[runPercentage]} onValueChange={(val) => setRunPercentage(val[0])} max={100} step={5} className="py-2" />
+                        <div className="flex justify-between items-center">
+                            <Label htmlFor="run-subset" className="text-xs text-muted-foreground">Subconjunto íntegro (hijas solo con padres muestreados)</Label>
+                            <Switch id="run-subset" checked={runSubset} onCheckedChange={setRunSubset} />
+                        </div>
                     </div>
                 </div>
                 <DialogFooter>
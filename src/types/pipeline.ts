@@ -1,4 +1,4 @@
-export type PipelineStatus = 'idle' | 'running' | 'success' | 'error' | 'warning';
+export type PipelineStatus = 'idle' | 'running' | 'success' | 'error' | 'warning' | 'skipped' | 'cancelled';
 
 export interface Pipeline {
   id: string;
@@ -6,7 +6,7 @@ export interface Pipeline {
   description?: string;
   sourceDb: string;
   targetDb: string;
-  status: 'idle' | 'running' | 'success' | 'error';
+  status: 'idle' | 'running' | 'success' | 'error' | 'skipped' | 'cancelled';
   lastRun?: string;
   nextRun?: string;
   tablesCount: number;